@@ -37,9 +37,12 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 import pyqtgraph as pg
 import numpy as np
 from math import floor
-from time import sleep
 from sys import argv, exit, path
+from pathlib import Path
+path.append(str(Path(__file__).resolve().parents[2] / 'Toolbox'))     # Toolbox/ folder for the shared beamforming package
 from adi import ad9361 #, Pluto, ad936x
+from beamforming import Pipeline, WaveformCache, calcTheta, dbfs, tone
+from beamforming.render import Renderer
 #print(f'sys.path = {path}')  # debug
 
 class Ui_MainWindow(object):
@@ -362,35 +365,16 @@ def setupPluto(samp_rate, fc0, rx_lo, rx_mode, rx_gain0, rx_gain1, NumSamples, t
 setupPluto(samp_rate, fc0, rx_lo, rx_mode, rx_gain0, rx_gain1, NumSamples, tx_lo, tx_gain)
 
 '''Program Tx and Send Data'''
+waveform_cache = WaveformCache()
 fs = int(sdr.sample_rate)
 N = 2**16
 ts = 1 / float(fs)
-t = np.arange(0, N * ts, ts)
-i0 = np.cos(2 * np.pi * t * fc0) * 2 ** 14
-q0 = np.sin(2 * np.pi * t * fc0) * 2 ** 14
-iq0 = i0 + 1j * q0
+iq0 = waveform_cache.get(tone, N, fc0, fs)    # built once, then loaded from disk
 sdr.tx([iq0,iq0])                           # Send Tx data.
 
 xf = np.fft.fftfreq(NumSamples, ts)         # Assign frequency bins
 xf = np.fft.fftshift(xf)/1e6
 
-def calcTheta(phase):
-    # calculates the steering angle for a given phase delta (phase is in deg)
-    # steering angle is theta = arcsin(c*deltaphase/(2*pi*f*d)
-    arcsin_arg = np.deg2rad(phase) * 3E8 / (2 * np.pi * rx_lo * d)
-    arcsin_arg = max(min(1, arcsin_arg), -1)     # arcsin argument must be between 1 and -1, or numpy will throw a warning
-    calc_theta = np.rad2deg(np.arcsin(arcsin_arg))
-    return calc_theta
-
-def dbfs(raw_data):                         # function to convert IQ samples to FFT plot, scaled in dBFS
-    NumSamples = len(raw_data)
-    win = np.hamming(NumSamples)
-    y = raw_data * win
-    s_fft = np.fft.fft(y) / np.sum(win)
-    s_shift = np.fft.fftshift(s_fft)
-    s_dbfs = 20*np.log10(np.abs(s_shift)/(2**11))   # Pluto is a signed 12 bit ADC, so use 2^11 to convert to dBFS
-    return s_dbfs
-
 ''' Setup Main UI Window '''
 app = QtWidgets.QApplication(argv)
 MainWindow = QtWidgets.QMainWindow()
@@ -401,20 +385,19 @@ MainWindow.show()
 ''' Setup Graphs '''
 p1 = ui.setFFTGraph()
 p2 = ui.setRADARGraph()
-steerArrow = pg.ArrowItem()
-steerArrow.setStyle(angle=-90, tipAngle=8, tailLen=105, brush=pg.mkColor('w'))
-p2.addItem(steerArrow)
-peakSteerArrow = pg.ArrowItem()
-peakSteerArrow.setStyle(angle=-90, tipAngle=8, tailLen=105, brush=pg.mkColor('b'))
-p2.addItem(peakSteerArrow)
-baseCurve = p1.plot()
+# Every item is created once and updated in place by the renderer, at most once per monitor refresh
+renderer = Renderer()
+steerArrow = renderer.arrow(p2, angle=-90, tipAngle=8, tailLen=105, brush=pg.mkColor('w'))
+peakSteerArrow = renderer.arrow(p2, angle=-90, tipAngle=8, tailLen=105, brush=pg.mkColor('b'))
+baseCurve = renderer.curve(p1)
 baseCurve.setZValue(1)
-peakCurve = p1.plot(pen=pg.mkPen('b'))
+peakCurve = renderer.curve(p1, pen=pg.mkPen('b'))
 
-''' Rx Data '''
-data = sdr.rx()
-Rx_0 = data[0]
-Rx_1 = data[1]
+''' Pipeline '''
+# sdr.rx() runs on an acquisition thread and the phase sweep on a DSP thread, so the Qt thread only
+# draws the newest sweep step at display rate and never waits on the Pluto or on the sweep speed
+render_interval = renderer.interval # ms between redraws, one per monitor refresh
+Rx_0 = None # buffer being swept, set from the first frame and on every rescan()
 
 '''Initialize loop variables'''
 peak_sum = -10000
@@ -429,19 +412,24 @@ rotateMode = "loop" # 'loop' or 'bounce'
 peakDisplayToggle = True # Bool for keeping track of peak values
 resetPeaksToggle = True # Bool for reseting peak values each loop
 resetFlag = False # Initial condition for main toggle
+restart = False # New Pluto instance, rescan on the next sweep step
 
-def rescan():
+''' Start the sweep over a new buffer (DSP thread) '''
+def rescan(frame):
     global Rx_0, Rx_1, peak_sum, peak_delay, peak_steer_angle
-    data = sdr.rx()
-    Rx_0 = data[0]
-    Rx_1 = data[1]
+    Rx_0 = frame[0]
+    Rx_1 = frame[1]
     peak_sum = -10000
     peak_delay = -10000
     peak_steer_angle = -10000
 
-def rotate():
-    global baseCurve, peakCurve, peak_steer_angle, steer_angle, steerArrow, peakSteerArrow, peak_sum, peak_delay, i, phaseIncrement, speed, phase_cal, rotateMode, peakDisplayToggle, resetPeaksToggle
+''' One sweep step on the newest frame (DSP thread): the values render() draws '''
+def sweep(frame):
+    global Rx_0, Rx_1, peak_sum, peak_delay, peak_steer_angle, i, phaseIncrement, restart
 
+    if Rx_0 is None or restart:
+        rescan(frame)
+        restart = False
     phase_delay = delay_phases[i]
     delayed_Rx_1 = Rx_1 * np.exp(1j*np.deg2rad(phase_delay+phase_cal))
     delayed_sum = dbfs(Rx_0 + delayed_Rx_1)
@@ -449,36 +437,9 @@ def rotate():
     if (peakDisplayToggle and np.max(delayed_sum) > np.max(peak_sum)):
         peak_sum = delayed_sum 
         peak_delay = phase_delay
-        peak_steer_angle = int(calcTheta(peak_delay))
-
-    ''' FFT Plot '''
-    peakCurve.setData([0], [0])
-    if peakDisplayToggle:
-        peakCurve.setData(xf, peak_sum)
-    baseCurve.setData(xf, delayed_sum)
-    steer_angle = int(calcTheta(phase_delay))
-    # Set labels
-    ui.lcdPhase.display(phase_delay)
-    ui.lcdSteering.display(steer_angle)
-    ui.lcdSignal.display(int(floor(np.max(delayed_sum))))
-    ui.lcdPeakPhase.display(0)
-    ui.lcdPeakSteering.display(0)
-    ui.lcdPeakSignal.display(0)
-    if peakDisplayToggle:
-        ui.lcdPeakPhase.display(peak_delay)
-        ui.lcdPeakSteering.display(peak_steer_angle)
-        ui.lcdPeakSignal.display(int(floor(np.max(peak_sum))))
-
-    ''' RADAR Plot '''
-    p2.removeItem(peakSteerArrow)
-    if peakDisplayToggle:
-        peakSteerArrow = pg.ArrowItem()
-        peakSteerArrow.setStyle(angle=peak_steer_angle-90, tipAngle=8, tailLen=105, brush=pg.mkColor('b'))
-        p2.addItem(peakSteerArrow)
-    p2.removeItem(steerArrow)
-    steerArrow = pg.ArrowItem()
-    steerArrow.setStyle(angle=steer_angle-90, tipAngle=8, tailLen=105, brush=pg.mkColor('w'))
-    p2.addItem(steerArrow)
+        peak_steer_angle = int(calcTheta(peak_delay, rx_lo, d))
+    result = dict(phase_delay=phase_delay, delayed_sum=delayed_sum, steer_angle=int(calcTheta(phase_delay, rx_lo, d)),
+                  peak_display=peakDisplayToggle, peak_sum=peak_sum, peak_delay=peak_delay, peak_steer_angle=peak_steer_angle)
 
     # Increment through phases - Reset peaks
     i=i+floor(phaseIncrement)
@@ -486,20 +447,50 @@ def rotate():
         if (i>=len(delay_phases)):
             i=0
             if resetPeaksToggle:
-                rescan()
+                rescan(frame)
         elif (i<=-1):
             i=len(delay_phases)-1
             if resetPeaksToggle:
-                rescan()
+                rescan(frame)
     elif (rotateMode == 'bounce'):
         if (i>=len(delay_phases) or i<=-1):
             phaseIncrement=-1*phaseIncrement
             i=i+floor(phaseIncrement)
             if resetPeaksToggle:
-                rescan()
+                rescan(frame)
+    return result
+
+''' Queue one sweep step for the next redraw (Qt thread) '''
+def render(result):
+
+    ''' FFT Plot '''
+    renderer.set_visible(peakCurve, result['peak_display'])
+    if result['peak_display']:
+        renderer.set_data(peakCurve, xf, result['peak_sum'])
+    renderer.set_data(baseCurve, xf, result['delayed_sum'])
+    # Set labels
+    renderer.display(ui.lcdPhase, result['phase_delay'])
+    renderer.display(ui.lcdSteering, result['steer_angle'])
+    renderer.display(ui.lcdSignal, int(floor(np.max(result['delayed_sum']))))
+    if result['peak_display']:
+        renderer.display(ui.lcdPeakPhase, result['peak_delay'])
+        renderer.display(ui.lcdPeakSteering, result['peak_steer_angle'])
+        renderer.display(ui.lcdPeakSignal, int(floor(np.max(result['peak_sum']))))
+    else:
+        renderer.display(ui.lcdPeakPhase, 0)
+        renderer.display(ui.lcdPeakSteering, 0)
+        renderer.display(ui.lcdPeakSignal, 0)
+
+    ''' RADAR Plot '''
+    renderer.set_visible(peakSteerArrow, result['peak_display'])
+    if result['peak_display']:
+        renderer.set_angle(peakSteerArrow, result['peak_steer_angle']-90)
+    renderer.set_angle(steerArrow, result['steer_angle']-90)
+
+pipeline = Pipeline(lambda: sdr.rx(), sweep, period=speed/1000).start()
 
 def mainLoop():
-    global baseCurve, peakCurve, peak_steer_angle, steer_angle, steerArrow, peakSteerArrow, peak_sum, peak_delay, i, phaseIncrement, speed, phase_cal, rotateMode, peakDisplayToggle, resetPeaksToggle, resetFlag, sdr
+    global peakDisplayToggle, resetPeaksToggle, phaseIncrement, speed, phase_cal, resetFlag, restart, sdr
 
     loopToggle = ui.getPauseToggle()
     newPeakDisplayToggle = ui.getPeakDisplayToggle()
@@ -513,12 +504,17 @@ def mainLoop():
         # If change has occured to Pluto variables
         if resetFlag:
             print("Restart Pluto")
+            # Stop both threads and drop the old device's queued frames before tearing it down
+            pipeline.pause()
+            pipeline.pause_acquire()
             sdr.tx_destroy_buffer()
-            # New Pluto instance
+            # New Pluto instance, picked up by the acquisition thread on its next rx()
             sdr = ad9361(uri='ip:192.168.2.1')
             setupPluto(samp_rate, fc0, rx_lo, rx_mode, rx_gain0, rx_gain0, NumSamples, tx_lo, tx_gain)
-            rescan()
+            pipeline.drain()
+            restart = True
             resetFlag = False
+            pipeline.resume_acquire()
 
         # If Peak Display toggle changed
         if newPeakDisplayToggle != peakDisplayToggle:
@@ -529,26 +525,33 @@ def mainLoop():
         # If Phase Increment dial changed
         if newPhaseIncrement != phaseIncrement:
             phaseIncrement = newPhaseIncrement
-        # If Speed dial is changed
+        # If Speed dial is changed, the DSP thread steps at the new rate (no sleep on this thread)
         if newSpeed != speed:
             speed = newSpeed
-
-        rotate()
+            pipeline.period = speed/1000
+        pipeline.resume()
     else:
+        pipeline.pause()
         # If Phase Calibration is changed
         if newPhaseCal != phase_cal:
             phase_cal = newPhaseCal
             # resetFlag = True
 
-
-    # Control rate of rotation
-    sleep(speed/1000)
+    # Draw the newest sweep step, if there is one since the last redraw
+    result = pipeline.latest()
+    if result is not None:
+        render(result)
+    renderer.flush()
 
 timer = pg.QtCore.QTimer()
 timer.timeout.connect(mainLoop)
-timer.start(0)
+timer.start(render_interval)
 
 if __name__ == "__main__":
-    exit(app.exec_())
+    status = app.exec_()
+    pipeline.close()
+    print(pipeline.report())
+    print(f'{renderer.frames} redraws, {renderer.skipped} held back by the {renderer.max_fps:.0f} Hz cap')
+    exit(status)
 
 sdr.tx_destroy_buffer()
\ No newline at end of file
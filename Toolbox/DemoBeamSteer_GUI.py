@@ -34,12 +34,11 @@ video walkthrough of this at:  https://www.youtube.com/@jonkraft
 from PyQt5 import QtCore, QtGui, QtWidgets
 import pyqtgraph as pg
 import numpy as np
-import pylab as pl
-import math
 from math import floor
-from time import sleep
 from sys import argv, exit, path
 from adi import ad9361 #, Pluto, ad936x
+from beamforming import BeamScanner, Pipeline, WaveformCache, calcTheta, dbfs, find_phase_offset, tone
+from beamforming.render import Renderer
 #print(f'sys.path = {path}')  # debug
 
 '''Setup'''
@@ -52,6 +51,10 @@ rx_gain1 = 40
 tx_lo = rx_lo
 tx_gain = -3
 fc0 = int(200e3)            # 200 kHz
+# sweepMode "step": one phase per step, new buffer after every sweep (peak lags by a sweep)
+#           "pattern": whole beam pattern of every new buffer, the sweep animates over it
+# Starts in "step" unless run with --pattern, the SWEEP MODE button switches it while running
+sweepMode = "pattern" if "--pattern" in argv else "step"
 
 phase_offest = 0
 
@@ -87,51 +90,20 @@ setupPluto(samp_rate, fc0, rx_lo, rx_mode, rx_gain0, rx_gain1, NumSamples, tx_lo
 
 class Ui_MainWindow(object):
 
-    def xcorrelate(self, X, Y, maxlag):
-        N = max(len(X), len(Y))
-        N_nextpow2 = math.ceil(math.log(N + maxlag, 2))
-        M = 2**N_nextpow2
-        if len(X) < M:
-            postpad_X = int(M - len(X) - maxlag)
-        else:
-            postpad_X = 0
-
-        if len(Y) < M:
-            postpad_Y = int(M - len(Y))
-        else:
-            postpad_Y = 0
-            
-        pre = pl.fft(pl.pad(X, (maxlag,postpad_X), 'constant', constant_values=(0, 0)))
-        post = pl.fft(pl.pad(Y, (0,postpad_Y), 'constant', constant_values=(0, 0)))
-        cor = pl.ifft(pre * pl.conj(post))
-        R = cor[0:2 * maxlag]
-        return R
-
-
-    def find_phase_offset(self, ref_data, Rx_data):
-
-        result_corr = self.xcorrelate(ref_data, Rx_data,int(len(ref_data) / 2))
-        max_position = np.argmax(abs(result_corr))
-
-        phase_diff = result_corr[max_position] / pl.sqrt(pl.mean(pl.real(Rx_data)**2 + pl.imag(Rx_data)**2))
-        phase_diff = pl.angle(phase_diff)/ pl.pi * 180
-
-        return int(phase_diff)
-
     def recalibrate(self):
         print("RECALIBRATION ROUTINE")
-        AVERAGING_PHASE = 15
-        phase_cal = []
-        for i in range(AVERAGING_PHASE):
-            data1 = sdr.rx()
-            
-            Rx_0 = data1[0]        # PlutoSDR 1, RX 0
-            Rx_1 = data1[1]        # PlutoSDR 1, RX 1
-            phase_offset = self.find_phase_offset(Rx_0, Rx_1)
-
-            phase_cal.append(phase_offset)
-        self.phaseOffset = int(sum(phase_cal) / len(phase_cal))
+        # the frames are read on the DSP thread, setPhaseCal() runs from mainLoop() once they are in
+        self.phaseCalibration.setEnabled(False)
+        self.labelPhaseCal.setText("Phase Calibration: measuring...")
+        pipeline.submit(measurePhaseCal, self.setPhaseCal)
+
+    def setPhaseCal(self, phaseOffset, error):
+        if error is None:
+            self.phaseOffset = phaseOffset
+        else:
+            print(f'Recalibration failed: {error!r}')
         self.labelPhaseCal.setText("Phase Calibration: "+str(self.phaseOffset)+" deg")
+        self.phaseCalibration.setEnabled(not self.getPauseToggle())
     
     def togglePause(self):
         text = self.toggleTrackerButton.text()
@@ -173,6 +145,20 @@ class Ui_MainWindow(object):
         elif text == 'RESET PEAKS: \nOFF':
             self.buttonResetPeaks.setText('RESET PEAKS: \nON')
 
+    def toggleSweepMode(self):
+        text = self.buttonSweepMode.text()
+        if text == 'SWEEP MODE: \nSTEP':
+            self.buttonSweepMode.setText('SWEEP MODE: \nPATTERN')
+        elif text == 'SWEEP MODE: \nPATTERN':
+            self.buttonSweepMode.setText('SWEEP MODE: \nSTEP')
+
+    def getSweepMode(self):
+        text = self.buttonSweepMode.text()
+        if text == 'SWEEP MODE: \nSTEP':
+            return "step"
+        elif text == 'SWEEP MODE: \nPATTERN':
+            return "pattern"
+
     def getResetPeaksToggle(self):
         text = self.buttonResetPeaks.text()
         if text == 'RESET PEAKS: \nON':
@@ -279,6 +265,10 @@ class Ui_MainWindow(object):
         self.phaseCalibration.setEnabled(False)
         self.phaseCalibration.clicked.connect(self.recalibrate)
         self.phaseCalibration.setObjectName("phaseCalibration")
+        self.buttonSweepMode = QtWidgets.QPushButton(self.centralwidget)
+        self.buttonSweepMode.setGeometry(QtCore.QRect(70, 620, 171, 121))
+        self.buttonSweepMode.setObjectName("buttonSweepMode")
+        self.buttonSweepMode.clicked.connect(self.toggleSweepMode)
         # Dials
         self.dialPhaseIncrement = QtWidgets.QDial(self.centralwidget)
         self.dialPhaseIncrement.setGeometry(QtCore.QRect(1030, 650, 121, 121))
@@ -379,6 +369,8 @@ class Ui_MainWindow(object):
         self.buttonResetPeaks.setText(_translate("MainWindow", "RESET PEAKS: \n"
 "ON"))
         self.phaseCalibration.setText(_translate("MainWindow", "RECALIBRATE"))
+        self.buttonSweepMode.setText(_translate("MainWindow", "SWEEP MODE: \n"
++sweepMode.upper()))
 
     def setFFTGraph(self):
         p1 = self.winFFT.addPlot()
@@ -417,37 +409,16 @@ class Ui_MainWindow(object):
         return p2
 
 '''Program Tx and Send Data'''
+waveform_cache = WaveformCache()
 fs = int(sdr.sample_rate)
 N = 2**16
 ts = 1 / float(fs)
-t = np.arange(0, N * ts, ts)
-i0 = np.cos(2 * np.pi * t * fc0) * 2 ** 14
-q0 = np.sin(2 * np.pi * t * fc0) * 2 ** 14
-iq0 = i0 + 1j * q0
+iq0 = waveform_cache.get(tone, N, fc0, fs)    # built once, then loaded from disk
 sdr.tx([iq0,iq0])                           # Send Tx data.
 
 xf = np.fft.fftfreq(NumSamples, ts)         # Assign frequency bins
 xf = np.fft.fftshift(xf)/1e6
 
-''' Calculate Steering Angle using Phase Difference - Kraft '''
-def calcTheta(phase):
-    # calculates the steering angle for a given phase delta (phase is in deg)
-    # steering angle is theta = arcsin(c * deltaphase / (2 * pi * f * d)
-    arcsin_arg = np.deg2rad(phase) * 3e8 / (2 * np.pi * rx_lo * d)
-    arcsin_arg = max(min(1, arcsin_arg), -1) # arcsin argument must be between 1 and -1, or numpy will throw a warning
-    calc_theta = np.rad2deg(np.arcsin(arcsin_arg))
-    return calc_theta
-
-''' Convert IQ samples to FFT Plot Display scaled in dBfs - Kraft '''
-def dbfs(raw_data):
-    NumSamples = len(raw_data)
-    win = np.hamming(NumSamples)
-    y = raw_data * win
-    s_fft = np.fft.fft(y) / np.sum(win)
-    s_shift = np.fft.fftshift(s_fft)
-    s_dbfs = 20 * np.log10(np.abs(s_shift) / (2**11))     # Pluto is a signed 12 bit ADC, so use 2^11 to convert to dBFS
-    return s_dbfs
-
 ''' Setup Main UI Window '''
 app = QtWidgets.QApplication(argv)
 MainWindow = QtWidgets.QMainWindow()
@@ -458,20 +429,20 @@ MainWindow.show()
 ''' Setup Graphs '''
 p1 = ui.setFFTGraph()
 p2 = ui.setRADARGraph()
-steerArrow = pg.ArrowItem()
-steerArrow.setStyle(angle=-90, tipAngle=8, tailLen=105, brush=pg.mkColor('w'))
-p2.addItem(steerArrow)
-peakSteerArrow = pg.ArrowItem()
-peakSteerArrow.setStyle(angle=-90, tipAngle=8, tailLen=105, brush=pg.mkColor('b'))
-p2.addItem(peakSteerArrow)
-baseCurve = p1.plot()
+# Every item is created once and updated in place by the renderer, at most once per monitor refresh
+renderer = Renderer()
+steerArrow = renderer.arrow(p2, angle=-90, tipAngle=8, tailLen=200, brush=pg.mkColor('w'))
+peakSteerArrow = renderer.arrow(p2, angle=-90, tipAngle=8, tailLen=200, brush=pg.mkColor('b'))
+baseCurve = renderer.curve(p1)
 baseCurve.setZValue(1)
-peakCurve = p1.plot(pen=pg.mkPen('b'))
+peakCurve = renderer.curve(p1, pen=pg.mkPen('b'))
+patternCurve = renderer.curve(p2, pen=pg.mkPen('b')) # beam pattern of the newest buffer ("pattern" mode)
 
-''' Rx Data '''
-data = sdr.rx()
-Rx_0 = data[0]
-Rx_1 = data[1]
+''' Pipeline '''
+# sdr.rx() runs on an acquisition thread and the phase sweep on a DSP thread, so the Qt thread only
+# draws the newest sweep step at display rate and never waits on the Pluto or on the sweep speed
+render_interval = renderer.interval # ms between redraws, one per monitor refresh
+Rx_0 = None # buffer being swept, set from the first frame and on every rescan()
 
 '''Initialize loop variables'''
 peak_sum = -10000
@@ -486,18 +457,35 @@ rotateMode = "loop" # 'loop' or 'bounce'
 peakDisplayToggle = True # Bool for keeping track of peak values
 resetPeaksToggle = True # Bool for reseting peak values each loop
 
-def rescan():
+''' Average phase offset between the two channels over a few fresh frames (DSP thread) '''
+def measurePhaseCal(next_frame):
+    AVERAGING_PHASE = 15
+    phase_cal = []
+    for i in range(AVERAGING_PHASE):
+        data1 = next_frame()   # sweep is paused while RECALIBRATE is enabled
+        
+        Rx_0 = data1[0]        # PlutoSDR 1, RX 0
+        Rx_1 = data1[1]        # PlutoSDR 1, RX 1
+        phase_offset = find_phase_offset(Rx_0, Rx_1)
+
+        phase_cal.append(phase_offset)
+    return int(sum(phase_cal) / len(phase_cal))
+
+''' Start the sweep over a new buffer (DSP thread) '''
+def rescan(frame):
     global Rx_0, Rx_1, peak_sum, peak_delay, peak_steer_angle
-    data = sdr.rx()
-    Rx_0 = data[0]
-    Rx_1 = data[1]
+    Rx_0 = frame[0]
+    Rx_1 = frame[1]
     peak_sum = -10000
     peak_delay = -10000
     peak_steer_angle = -10000
 
-def rotate():
-    global baseCurve, peakCurve, peak_steer_angle, steer_angle, steerArrow, peakSteerArrow, peak_sum, peak_delay, i, phaseIncrement, speed, phase_cal, rotateMode, peakDisplayToggle, resetPeaksToggle
+''' One sweep step on the newest frame (DSP thread): the values render() draws '''
+def sweep(frame):
+    global Rx_0, Rx_1, peak_sum, peak_delay, peak_steer_angle, i, phaseIncrement
 
+    if Rx_0 is None:
+        rescan(frame)
     phase_delay = delay_phases[i]
     delayed_Rx_1 = Rx_1 * np.exp(1j*np.deg2rad(phase_delay+phase_cal))
     delayed_sum = dbfs(Rx_0 + delayed_Rx_1)
@@ -505,36 +493,9 @@ def rotate():
     if (peakDisplayToggle and np.max(delayed_sum) > np.max(peak_sum)):
         peak_sum = delayed_sum 
         peak_delay = phase_delay
-        peak_steer_angle = int(calcTheta(peak_delay))
-
-    ''' FFT Plot '''
-    peakCurve.setData([0], [0])
-    if peakDisplayToggle:
-        peakCurve.setData(xf, peak_sum)
-    baseCurve.setData(xf, delayed_sum)
-    steer_angle = int(calcTheta(phase_delay))
-    # Set labels
-    ui.lcdPhase.display(phase_delay)
-    ui.lcdSteering.display(steer_angle)
-    ui.lcdSignal.display(int(floor(np.max(delayed_sum))))
-    ui.lcdPeakPhase.display(0)
-    ui.lcdPeakSteering.display(0)
-    ui.lcdPeakSignal.display(0)
-    if peakDisplayToggle:
-        ui.lcdPeakPhase.display(peak_delay)
-        ui.lcdPeakSteering.display(peak_steer_angle)
-        ui.lcdPeakSignal.display(int(floor(np.max(peak_sum))))
-
-    ''' RADAR Plot '''
-    p2.removeItem(peakSteerArrow)
-    if peakDisplayToggle:
-        peakSteerArrow = pg.ArrowItem()
-        peakSteerArrow.setStyle(angle=peak_steer_angle-90, tipAngle=8, tailLen=200, brush=pg.mkColor('b'))
-        p2.addItem(peakSteerArrow)
-    p2.removeItem(steerArrow)
-    steerArrow = pg.ArrowItem()
-    steerArrow.setStyle(angle=steer_angle-90, tipAngle=8, tailLen=200, brush=pg.mkColor('w'))
-    p2.addItem(steerArrow)
+        peak_steer_angle = int(calcTheta(peak_delay, rx_lo, d))
+    result = dict(phase_delay=phase_delay, delayed_sum=delayed_sum, steer_angle=int(calcTheta(phase_delay, rx_lo, d)),
+                  peak_display=peakDisplayToggle, peak_sum=peak_sum, peak_delay=peak_delay, peak_steer_angle=peak_steer_angle)
 
     # Increment through phases - Reset peaks
     i=i+floor(phaseIncrement)
@@ -542,20 +503,109 @@ def rotate():
         if (i>=len(delay_phases)):
             i=0
             if resetPeaksToggle:
-                rescan()
+                rescan(frame)
         elif (i<=-1):
             i=len(delay_phases)-1
             if resetPeaksToggle:
-                rescan()
+                rescan(frame)
     elif (rotateMode == 'bounce'):
         if (i>=len(delay_phases) or i<=-1):
             phaseIncrement=-1*phaseIncrement
             i=i+floor(phaseIncrement)
             if resetPeaksToggle:
-                rescan()
+                rescan(frame)
+    return result
+
+''' Beam pattern of one buffer: every phase of delay_phases in one batched scan '''
+scanner = BeamScanner(delay_phases, [0, 1], NumSamples, 0, NumSamples) # all bins, like dbfs()
+steer_angles = calcTheta(delay_phases, rx_lo, d)
+pattern_frame = None # buffer the current pattern was computed from
+
+''' dBFS spectrum of Rx0 + Rx1 steered by one phase delay, from the scanner's channel spectra '''
+def steered_dbfs(spectra, phase_delay):
+    return 20*np.log10(np.abs(spectra[0] + spectra[1]*np.exp(1j*np.deg2rad(phase_delay+phase_cal))) / 2**11)
+
+''' One sweep step over the beam pattern of the newest buffer (DSP thread, "pattern" mode) '''
+def pattern_sweep(frame):
+    global pattern_frame, spectra, pattern, peak_sum, peak_delay, peak_steer_angle, i, phaseIncrement
+
+    if frame is not pattern_frame:
+        # New buffer: whole pattern at once and its peak narrowed down to 0.1 deg, so the peak is one buffer old
+        pattern_frame = frame
+        channels = np.array(frame[:2])
+        spectra = scanner.spectra(channels)     # one FFT per buffer, shared by the peak search and the sweep
+        peak_delay, peak_dbfs, pattern = scanner.fine_peak(channels, [0, phase_cal], tolerance=0.1, spectra=spectra)
+        peak_sum = steered_dbfs(spectra, peak_delay)
+        peak_steer_angle = int(calcTheta(peak_delay, rx_lo, d))
+        peak_delay = int(round(peak_delay)) # the LCDs show 3 digits
+    # The sweep only animates over that pattern: one spectrum per step, no new FFT
+    phase_delay = delay_phases[i]
+    delayed_sum = steered_dbfs(spectra, phase_delay)
+    result = dict(phase_delay=phase_delay, delayed_sum=delayed_sum, steer_angle=int(calcTheta(phase_delay, rx_lo, d)),
+                  peak_display=peakDisplayToggle, peak_sum=peak_sum, peak_delay=peak_delay, peak_steer_angle=peak_steer_angle,
+                  pattern=pattern)
+
+    # Increment through phases
+    i=i+floor(phaseIncrement)
+    if (rotateMode == 'loop'):
+        i=i%len(delay_phases)
+    elif (rotateMode == 'bounce'):
+        if (i>=len(delay_phases) or i<=-1):
+            phaseIncrement=-1*phaseIncrement
+            i=i+floor(phaseIncrement)
+    return result
+
+''' Queue one sweep step for the next redraw (Qt thread) '''
+def render(result):
+
+    ''' FFT Plot '''
+    renderer.set_visible(peakCurve, result['peak_display'])
+    if result['peak_display']:
+        renderer.set_data(peakCurve, xf, result['peak_sum'])
+    renderer.set_data(baseCurve, xf, result['delayed_sum'])
+    # Set labels
+    renderer.display(ui.lcdPhase, result['phase_delay'])
+    renderer.display(ui.lcdSteering, result['steer_angle'])
+    renderer.display(ui.lcdSignal, int(floor(np.max(result['delayed_sum']))))
+    if result['peak_display']:
+        renderer.display(ui.lcdPeakPhase, result['peak_delay'])
+        renderer.display(ui.lcdPeakSteering, result['peak_steer_angle'])
+        renderer.display(ui.lcdPeakSignal, int(floor(np.max(result['peak_sum']))))
+    else:
+        renderer.display(ui.lcdPeakPhase, 0)
+        renderer.display(ui.lcdPeakSteering, 0)
+        renderer.display(ui.lcdPeakSignal, 0)
+
+    ''' RADAR Plot '''
+    renderer.set_visible(peakSteerArrow, result['peak_display'])
+    if result['peak_display']:
+        renderer.set_angle(peakSteerArrow, result['peak_steer_angle']-90)
+    renderer.set_angle(steerArrow, result['steer_angle']-90)
+    renderer.set_visible(patternCurve, 'pattern' in result)
+    if 'pattern' in result:
+        # Beam pattern in polar form, the outer ring is the peak and the center 40 dB below it
+        r = 34 * np.clip((result['pattern'] - np.max(result['pattern']) + 40) / 40, 0, 1)
+        renderer.set_data(patternCurve, r*np.sin(np.deg2rad(steer_angles)), r*np.cos(np.deg2rad(steer_angles)))
+
+activeSweepMode = sweepMode # mode the DSP thread is sweeping in
+
+''' One sweep step in the current sweepMode (DSP thread), so the mode can change while running '''
+def process(frame):
+    global activeSweepMode, Rx_0, pattern_frame, i
+    if sweepMode != activeSweepMode:
+        # Mode changed from the GUI: start the new mode's sweep over the newest buffer
+        activeSweepMode = sweepMode
+        Rx_0 = None
+        pattern_frame = None
+        i = 0
+    if activeSweepMode == "pattern":
+        return pattern_sweep(frame)
+    return sweep(frame)
+
+pipeline = Pipeline(lambda: sdr.rx(), process, period=speed/1000).start()
 
 def mainLoop():
-    global baseCurve, peakCurve, peak_steer_angle, steer_angle, steerArrow, peakSteerArrow, peak_sum, peak_delay, i, phaseIncrement, speed, phase_cal, rotateMode, peakDisplayToggle, resetPeaksToggle, resetFlag, sdr
+    global peakDisplayToggle, resetPeaksToggle, phaseIncrement, speed, phase_cal, sweepMode
 
     loopToggle = ui.getPauseToggle()
     newPeakDisplayToggle = ui.getPeakDisplayToggle()
@@ -563,9 +613,13 @@ def mainLoop():
     newPhaseCal = ui.getPhaseCal()
     newPhaseIncrement = ui.dialPhaseIncrement.value()
     newSpeed = ui.speedDial.value()
+    newSweepMode = ui.getSweepMode()
 
     # If toggle is on to continue tracker
     if loopToggle:
+        # If Sweep Mode changed, the DSP thread switches on its next step
+        if newSweepMode != sweepMode:
+            sweepMode = newSweepMode
         # If Peak Display toggle changed
         if newPeakDisplayToggle != peakDisplayToggle:
             peakDisplayToggle = newPeakDisplayToggle
@@ -575,24 +629,35 @@ def mainLoop():
         # If Phase Increment dial changed
         if newPhaseIncrement != phaseIncrement:
             phaseIncrement = newPhaseIncrement
-        # If Speed dial is changed
+        # If Speed dial is changed, the DSP thread steps at the new rate (no sleep on this thread)
         if newSpeed != speed:
             speed = newSpeed
-
-        rotate()
+            pipeline.period = speed/1000
+        pipeline.resume()
     else:
+        pipeline.pause()
         # If Phase Calibration is changed
         if newPhaseCal != phase_cal:
             phase_cal = newPhaseCal
 
-    # Control rate of rotation
-    sleep(speed/1000)
+    # Finish a recalibration, if one came back since the last redraw
+    pipeline.poll_jobs()
+
+    # Draw the newest sweep step, if there is one since the last redraw
+    result = pipeline.latest()
+    if result is not None:
+        render(result)
+    renderer.flush()
 
 timer = pg.QtCore.QTimer()
 timer.timeout.connect(mainLoop)
-timer.start(0)
+timer.start(render_interval)
 
 if __name__ == "__main__":
-    exit(app.exec_())
+    status = app.exec_()
+    pipeline.close()
+    print(pipeline.report())
+    print(f'{renderer.frames} redraws, {renderer.skipped} held back by the {renderer.max_fps:.0f} Hz cap')
+    exit(status)
 
 sdr.tx_destroy_buffer()
\ No newline at end of file
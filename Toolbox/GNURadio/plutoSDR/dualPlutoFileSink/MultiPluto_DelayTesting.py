@@ -8,94 +8,37 @@ The actual data for the stream output does not indicate any relatice domain. For
 displayed in the time domain to help aid in confirming phase lock across multiple Rx nodes of a single Pluto SDR.
 '''
 
-import math
 import numpy as np
 import pylab as pl
 import pyqtgraph as pg  
 from pyqtgraph.Qt import QtCore, QtGui
-
-'''Function for trimming ndarray data'''
-def trimDelay(input, delayDelta):
-    # output = input
-    # num_output = input.shape[0]
-    # num_to_copy = max(0, num_output - delayDelta)
-    # num_adj = min(delayDelta, num_output)
-    # for i in range(num_output):
-    #     iptr = input[i]
-    #     optr = output[i]
-    #     optr[:num_to_copy]
-    # std::memcpy(input)
-    input = np.pad(input, (0, delayDelta), 'constant', constant_values=(0))
-    input = input[delayDelta:]
-    return input
-
-'''Function for padding ndarray data'''
-def padDelay(input, delayDelta):
-    length = len(input)
-    input = np.pad(input, (delayDelta, 0), 'constant', constant_values=(0))
-    input = input[:length]
-    return input
-
-'''Function for cross-correlation - Krysik'''
-def xcorrelate(X, Y, maxlag):
-    N = max(len(X), len(Y))
-    N_nextpow2 = math.ceil(math.log(N + maxlag, 2))
-    M = 2**N_nextpow2
-    if len(X) < M:
-        postpad_X = int(M - len(X) - maxlag)
-    else: 
-        postpad_X = 0
-
-    if len(Y) < M:
-        postpad_Y = int(M - len(Y))
-    else:
-        postpad_Y = 0
-        
-    pre  = pl.fft( np.pad(X, (maxlag,postpad_X), 'constant', constant_values=(0, 0)) )
-    post = pl.fft( np.pad(Y, (0,postpad_Y), 'constant', constant_values=(0, 0)) )
-    cor  = pl.ifft( pre * np.conj(post) )
-    R = cor[0 : 2*maxlag]
-    return R
+from sys import path
+from pathlib import Path
+path.append(str(Path(__file__).resolve().parents[3]))     # Toolbox/ folder for the shared beamforming package
+from beamforming import Correlator, correct_trigger_delay, dbfs
 
 '''Function for computing and finding delays - Krysik'''
-def compute_and_set_delay(ref_data, Rx_data, Rx_name, samp_rate):
-
-    result_corr = xcorrelate(ref_data, Rx_data,int(len(ref_data) / 2))
-    max_position = np.argmax(abs(result_corr))
-    delay = len(result_corr) / 2 - max_position
+def compute_and_set_delay(ref_data, Rx_data, Rx_names, samp_rate, correlator=None):
+    # Rx_data is a (channels x samples) block; pass a Correlator of ref_data to reuse its FFT between calls
+    if correlator is None:
+        correlator = Correlator(ref_data)
+    phase_diff, delay, peak_mag = correlator.sync(Rx_data)
 
-    phase_diff = result_corr[max_position] / np.sqrt(np.mean(np.real(Rx_data)**2 + np.imag(Rx_data)**2))
-    # phase_diff = sqrt(var(ref_data)/var(Rx_data))*(exp(1j*angle(phase_diff)))
-    phase_diff = np.angle(phase_diff) / np.pi * 180
-
-    print ("Delay of ", Rx_name, ": ", delay,' | Phase Diff: ', phase_diff, " [deg] | Length of ", Rx_name, ": ", Rx_data.shape[0])
+    for Rx_name, Rx, Rx_delay, Rx_phase in zip(Rx_names, Rx_data, delay, phase_diff):
+        print ("Delay of ", Rx_name, ": ", Rx_delay,' | Phase Diff: ', Rx_phase, " [deg] | Length of ", Rx_name, ": ", Rx.shape[0])
 
     # Set phase amplitude correction
     # INSERT
     # phase_amplitude_correction = sqrt(var(ref_data)/var(Rx_data))*(exp(1j*angle(phase_amplitude_correction)))
 
-    trim = Rx_data
-
     # TODO: data is aligned, but the graphs arbitrarily line up at index[0]
 
     # Set delay     
-    if delay < 0:
-        trim = padDelay(Rx_data, int(-delay)) # *samp_rate
-    elif delay > 0:
-        trim = trimDelay(Rx_data, int(delay)) # *samp_rate
+    trim = np.array([correct_trigger_delay(Rx, Rx_delay) for Rx, Rx_delay in zip(Rx_data, delay)])
 
     # return Rx_data * np.exp(1j*np.deg2rad(phase_diff))
-    return trim * np.sqrt(np.var(ref_data) / np.var(Rx_data)) * (np.exp(1j * np.deg2rad(phase_diff)))
-
-''' Function to convert IQ samples to FFT plot, scaled in dBFS - Kraft '''
-def dbfs(raw_data):                         
-    NumSamples = len(raw_data)
-    win = np.hamming(NumSamples)
-    y = raw_data * win
-    s_fft = np.fft.fft(y) / np.sum(win)
-    s_shift = np.fft.fftshift(s_fft)
-    s_dbfs = 20 * np.log10(np.abs(s_shift) / (2**11))   # Pluto is a signed 12 bit ADC, so use 2^11 to convert to dBFS
-    return s_dbfs
+    gain = np.sqrt(np.var(ref_data) / np.var(Rx_data, axis=-1)) * np.exp(1j * np.deg2rad(phase_diff))
+    return trim * gain[:, np.newaxis]
 
 ''' IQ Files to Read: '''
 # JOEL
@@ -134,18 +77,11 @@ SAMPLE_RATE = 2e6  # should be the same as it was in GNU Radio
 NUM_SAMPLES = fP2.shape[0] # this ensures that it is relative to what is captured
 
 '''Cross-Correlation and Delay Values'''
-DfP3 = compute_and_set_delay(fP2, fP3, "Pluto 2.1 Rx1", SAMPLE_RATE)
-nil = compute_and_set_delay(fP2, DfP3, "Pluto 2.1 Rx1", SAMPLE_RATE)
-# DfP5 = compute_and_set_delay(fP4, fP5, "Pluto 5.1 Rx1", SAMPLE_RATE)
-# nil = compute_and_set_delay(fP4, DfP5, "Pluto 5.1 Rx1", SAMPLE_RATE)
-# DfP5 = compute_and_set_delay(fP2, fP5, "Pluto 5.1 Rx1", SAMPLE_RATE)
-# nil = compute_and_set_delay(fP2, DfP5, "Pluto 5.1 Rx1", SAMPLE_RATE)
-# DfP4 = compute_and_set_delay(fP2, fP4, "Pluto 5.1 Rx0", SAMPLE_RATE)
-# nil = compute_and_set_delay(fP2, DfP4, "Pluto 5.1 Rx0", SAMPLE_RATE)
-DfP4 = compute_and_set_delay(fP2, fP4, "Pluto 5.1 Rx0", SAMPLE_RATE)
-nil = compute_and_set_delay(fP2, DfP4, "Pluto 5.1 Rx0", SAMPLE_RATE)
-DfP5 = compute_and_set_delay(fP2, fP5, "Pluto 5.1 Rx1", SAMPLE_RATE)
-nil = compute_and_set_delay(fP2, DfP5, "Pluto 5.1 Rx1", SAMPLE_RATE)
+# fP2 is FFT'd once and reused for every channel and for the re-check after correction
+correlator = Correlator(fP2)
+Rx_names = ["Pluto 2.1 Rx1", "Pluto 5.1 Rx0", "Pluto 5.1 Rx1"]
+DfP3, DfP4, DfP5 = compute_and_set_delay(fP2, np.array([fP3, fP4, fP5]), Rx_names, SAMPLE_RATE, correlator)
+nil = compute_and_set_delay(fP2, np.array([DfP3, DfP4, DfP5]), Rx_names, SAMPLE_RATE, correlator)
 
 ''' Visualizing raw data '''
 if DOMAIN == "freq" and GRAPHS == "stack":
@@ -9,16 +9,10 @@
 import numpy as np
 import pyqtgraph as pg  
 from pyqtgraph.Qt import QtCore, QtGui, QtWidgets
-
-'''Function to convert IQ samples to FFT plot, scaled in dBFS - Kraft'''
-def dbfs(raw_data):                         
-    NumSamples = len(raw_data)
-    win = np.hamming(NumSamples)
-    y = raw_data * win
-    s_fft = np.fft.fft(y) / np.sum(win)
-    s_shift = np.fft.fftshift(s_fft)
-    s_dbfs = 20*np.log10(np.abs(s_shift)/(2**11))   # Pluto is a signed 12 bit ADC, so use 2^11 to convert to dBFS
-    return s_dbfs
+from sys import path
+from pathlib import Path
+path.append(str(Path(__file__).resolve().parents[3]))     # Toolbox/ folder for the shared beamforming package
+from beamforming import dbfs
 
 ''' File names go here '''
 # FILE_1 = "GNURadio/fileOutput"
@@ -5,33 +5,15 @@
     The actual data for the stream output does not indicate any relatice domain. For this script, it is written to be displayed in the time domain to help aid in confirming phase lock across multiple Rx nodes of a single Pluto SDR.
 '''
 
-import math
 from numpy import *
 import numpy as np
 from pylab import *
 import pyqtgraph as pg  
 from pyqtgraph.Qt import QtCore, QtGui, QtWidgets
-
-'''Function for corss-correlation - Krysik'''
-def xcorrelate(X,Y,maxlag):
-    N = max(len(X), len(Y))
-    N_nextpow2 = math.ceil(math.log(N + maxlag,2))
-    M = 2**N_nextpow2
-    if len(X) < M:
-        postpad_X = int(M-len(X)-maxlag)
-    else:
-        postpad_X = 0
-
-    if len(Y) < M:
-        postpad_Y = int(M-len(Y))
-    else:
-        postpad_Y = 0
-        
-    pre  = fft( pad(X, (maxlag,postpad_X), 'constant', constant_values=(0, 0)) )
-    post = fft( pad(Y, (0,postpad_Y), 'constant', constant_values=(0, 0)) )
-    cor  = ifft( pre * conj(post) )
-    R = cor[0:2*maxlag]
-    return R
+from sys import path
+from pathlib import Path
+path.append(str(Path(__file__).resolve().parents[3]))     # Toolbox/ folder for the shared beamforming package
+from beamforming import dbfs, xcorrelate
 
 '''Function for computing and finding delays - Krysik'''
 def compute_and_find_delay(ref_data, Rx_data, Rx_name, samp_rate):
@@ -46,16 +28,6 @@ def compute_and_find_delay(ref_data, Rx_data, Rx_name, samp_rate):
 
     print ("Delay of ", Rx_name, ": ", delay,' | Phase Diff: ', phase_diff, " [deg]")
 
-'''Function to convert IQ samples to FFT plot, scaled in dBFS - Kraft'''
-def dbfs(raw_data):                         
-    NumSamples = len(raw_data)
-    win = np.hamming(NumSamples)
-    y = raw_data * win
-    s_fft = np.fft.fft(y) / np.sum(win)
-    s_shift = np.fft.fftshift(s_fft)
-    s_dbfs = 20*np.log10(np.abs(s_shift)/(2**11))   # Pluto is a signed 12 bit ADC, so use 2^11 to convert to dBFS
-    return s_dbfs
-
 ''' File names go here '''
 FILE_Rx1 = "/home/ubuntu/nTSDR_Local_Testing/fileOutputRx1"
 FILE_Rx2 = "/home/ubuntu/nTSDR_Local_Testing/fileOutputRx2"
@@ -57,22 +57,11 @@ print(f'sys.path = {path}')     # Edit JB: may need to add path to PYTHONPATH fo
 from adi import ad9361
 import matplotlib.pyplot as plt
 import numpy as np
-import pylab as pl
-import math
 import time
-
-def generate_bpsk(data, samp_rate, bit_len):
-    num_bits = data.shape[0]
-    samples_per_bit = math.floor(samp_rate*bit_len)
-    #
-    iq = np.empty(0)
-    for idx in range(num_bits):
-        iq = np.append(iq, data[idx] * np.ones([int(samples_per_bit)]))
-    #
-    # Add complex component
-    iq = iq + 1j * np.zeros(iq.shape[0])
-    #
-    return iq
+from pathlib import Path
+path.append(str(Path(__file__).resolve().parents[2]))     # Toolbox/ folder for the shared beamforming package
+from beamforming import barker, calcTheta, dbfs, tone
+from beamforming import find_phase_offset as compute_phase_offset
 
 ''' Setup '''
 samp_rate = 2e6                     # 2e6 = 2MHz: must be <=30.72 MHz if both channels are enabled
@@ -152,16 +141,13 @@ sdr1.tx_buffer_size = int(2**18)            # TX Buffer size: 2^18 = 262144
 ''' Program SDR1 TX1 and Send Data From PlutoSDR 1 to all other RX Nodes '''
 
 # Barker Sequence
-b13 = np.array([1, 1, 1, 1, 1, -1, -1, 1, 1, -1, 1, -1, 1])
+b13 = barker(13)
 
 # Carrier Signal
 fs = int(sdr1.sample_rate)
 N = 2**16
 ts = 1 / float(fs)
-t = np.arange(0, N * ts, ts)
-i0 = np.cos(2 * np.pi * t * fc0) * 2**14
-q0 = np.sin(2 * np.pi * t * fc0) * 2**14
-iq0 = i0 + 1j * q0
+iq0 = tone(N, fc0, fs)
 
 # BPSK
 # bpsk = generate_bpsk(iq0, 50, 13)
@@ -176,56 +162,6 @@ signal_end = int(NumSamples * (samp_rate / 2 + fc0 * 2) / samp_rate)
 
 ''' Function for cross-correlation - Krysik '''
 
-def xcorrelate(X,Y,maxlag):
-    N = max(len(X), len(Y))
-    N_nextpow2 = math.ceil(math.log(N + maxlag,2))
-    M = 2**N_nextpow2
-    if len(X) < M:
-        postpad_X = int(M - len(X) - maxlag)
-    else:
-        postpad_X = 0
-
-    if len(Y) < M:
-        postpad_Y = int(M - len(Y))
-    else:
-        postpad_Y = 0
-        
-    pre = pl.fft(pl.pad(X, (maxlag,postpad_X), 'constant', constant_values=(0, 0)))
-    post = pl.fft(pl.pad(Y, (0,postpad_Y), 'constant', constant_values=(0, 0)))
-    cor = pl.ifft(pre * pl.conj(post))
-    R = cor[0:2 * maxlag]
-    return R
-
-''' Function for computing and finding delays - Krysik '''
-def compute_phase_offset(ref_data, Rx_data):
-
-    result_corr = xcorrelate(ref_data, Rx_data,int(len(ref_data) / 2))
-    max_position = np.argmax(abs(result_corr))
-    delay = len(result_corr) / 2 - max_position
-
-    phase_diff = result_corr[max_position] / pl.sqrt(pl.mean(pl.real(Rx_data)**2 + pl.imag(Rx_data)**2))
-    phase_diff = pl.angle(phase_diff)/ pl.pi * 180
-
-    return int(phase_diff)
-
-def calcTheta(phase):
-    # calculates the steering angle for a given phase delta (phase is in deg)
-    # steering angle is theta = arcsin(c * deltaphase / (2 * pi * f * d)
-    arcsin_arg = np.deg2rad(phase) * 3e8 / (2 * np.pi * rx_lo * d)
-    arcsin_arg = max(min(1, arcsin_arg), -1) # arcsin argument must be between 1 and -1, or numpy will throw a warning
-    calc_theta = np.rad2deg(np.arcsin(arcsin_arg))
-    return calc_theta
-
-def dbfs(raw_data):
-    # function to convert IQ samples to FFT plot, scaled in dBFS
-    NumSamples = len(raw_data)
-    win = np.hamming(NumSamples)
-    y = raw_data * win
-    s_fft = np.fft.fft(y) / np.sum(win)
-    s_shift = np.fft.fftshift(s_fft)
-    s_dbfs = 20 * np.log10(np.abs(s_shift) / (2**11))     # Pluto is a signed 12 bit ADC, so use 2^11 to convert to dBFS
-    return s_dbfs
-
 ''' Collect Data '''
 # let each Pluto run for a bit, to do all its calibrations, then get a buffer
 for i in range(20):  
@@ -294,7 +230,7 @@ for i in range(num_scans):
     peak_dbfs = np.max(peak_sum)
     peak_delay_index = np.where(peak_sum == peak_dbfs)
     peak_delay = delay_phases[peak_delay_index[0][0]]
-    steer_angle = int(calcTheta(peak_delay))
+    steer_angle = int(calcTheta(peak_delay, rx_lo, d))
 
     if Plot_Compass == False:
         plt.clf()
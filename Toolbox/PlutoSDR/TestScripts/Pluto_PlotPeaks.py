@@ -53,13 +53,15 @@ gain value, max of 71 dB, or 62 dB when over 4 GHz center freq
 
 from sys import path
 print(f'sys.path = {path}')     # Edit JB: may need to add path to PYTHONPATH for OSError: [Errno 16] Device or resource busy
+from pathlib import Path
+path.append(str(Path(__file__).resolve().parents[2]))     # Toolbox/ folder for the shared beamforming package
 
 from adi import ad9361
 import matplotlib.pyplot as plt
 import numpy as np
-import pylab as pl
-import math
 import time
+from beamforming import BeamScanner, calcTheta
+from beamforming import find_phase_offset as compute_phase_offset
 
 ''' Setup '''
 samp_rate = 2e6                     # 2e6 = 2MHz: must be <=30.72 MHz if both channels are enabled
@@ -159,57 +161,6 @@ xf = np.fft.fftshift(xf) / 1e6
 signal_start = int(NumSamples * (samp_rate / 2 + fc0 / 2) / samp_rate)
 signal_end = int(NumSamples * (samp_rate / 2 + fc0 * 2) / samp_rate)
 
-''' Function for cross-correlation - Krysik '''
-def xcorrelate(X,Y,maxlag):
-    N = max(len(X), len(Y))
-    N_nextpow2 = math.ceil(math.log(N + maxlag,2))
-    M = 2**N_nextpow2
-    if len(X) < M:
-        postpad_X = int(M - len(X) - maxlag)
-    else:
-        postpad_X = 0
-
-    if len(Y) < M:
-        postpad_Y = int(M - len(Y))
-    else:
-        postpad_Y = 0
-        
-    pre = pl.fft(pl.pad(X, (maxlag,postpad_X), 'constant', constant_values=(0, 0)))
-    post = pl.fft(pl.pad(Y, (0,postpad_Y), 'constant', constant_values=(0, 0)))
-    cor = pl.ifft(pre * pl.conj(post))
-    R = cor[0:2 * maxlag]
-    return R
-
-''' Function for computing and finding delays - Krysik '''
-def compute_phase_offset(ref_data, Rx_data):
-
-    result_corr = xcorrelate(ref_data, Rx_data,int(len(ref_data) / 2))
-    max_position = np.argmax(abs(result_corr))
-    delay = len(result_corr) / 2 - max_position
-
-    phase_diff = result_corr[max_position] / pl.sqrt(pl.mean(pl.real(Rx_data)**2 + pl.imag(Rx_data)**2))
-    phase_diff = pl.angle(phase_diff)/ pl.pi * 180
-
-    return int(phase_diff)
-
-def calcTheta(phase):
-    # calculates the steering angle for a given phase delta (phase is in deg)
-    # steering angle is theta = arcsin(c * deltaphase / (2 * pi * f * d)
-    arcsin_arg = np.deg2rad(phase) * 3e8 / (2 * np.pi * rx_lo * d)
-    arcsin_arg = max(min(1, arcsin_arg), -1) # arcsin argument must be between 1 and -1, or numpy will throw a warning
-    calc_theta = np.rad2deg(np.arcsin(arcsin_arg))
-    return calc_theta
-
-def dbfs(raw_data):
-    # function to convert IQ samples to FFT plot, scaled in dBFS
-    NumSamples = len(raw_data)
-    win = np.hamming(NumSamples)
-    y = raw_data * win
-    s_fft = np.fft.fft(y) / np.sum(win)
-    s_shift = np.fft.fftshift(s_fft)
-    s_dbfs = 20 * np.log10(np.abs(s_shift) / (2**11))     # Pluto is a signed 12 bit ADC, so use 2^11 to convert to dBFS
-    return s_dbfs
-
 ''' Collect Data '''
 # let each Pluto run for a bit, to do all its calibrations, then get a buffer
 for i in range(20):  
@@ -257,7 +208,9 @@ phase_cal_1c = int(sum(phase_cal_1c) / len(phase_cal_1c))
 #phase_cal_1d = int(sum(phase_cal_1b) / len(phase_cal_1b))
 
 ''' Scans '''
-AVERAGING_SCANS = 1
+delay_phases = np.arange(-180, 180, 2)    # Create an Array for -180 - 180 degrees sweep
+# Steering matrix is built once: element k is shifted by k * phase_delay
+scanner = BeamScanner(delay_phases, np.arange(4), NumSamples, signal_start, signal_end)
 for i in range(num_scans):
     data1 = sdr1.rx()
     #data2 = sdr2.rx()
@@ -271,7 +224,6 @@ for i in range(num_scans):
     Rx_1c = data3[1]          # PlutoSDR 3, RX 1
     # Rx_0d = data4[0]        # PlutoSDR 4, RX 0
     # Rx_1d = data4[1]        # PlutoSDR 4, RX 1
-    peak_sum = []
     #
     #phase_cal_1a = compute_phase_offset(Rx_0a, Rx_1a)
     #phase_cal_0b = compute_phase_offset(Rx_0a, Rx_0b)
@@ -281,29 +233,13 @@ for i in range(num_scans):
     #phase_cal_0d = compute_phase_offset(Rx_0b, Rx_0d)
     #phase_cal_1d = compute_phase_offset(Rx_0b, Rx_1d)
     #
-    delay_phases = np.arange(-180, 180, 2)    # Create an Array for -180 - 180 degrees sweep
-        
-    ''' Phase shift by each degree from -180 to 180 and store peak signal '''
-    for phase_delay in delay_phases:   
-        peak_sum_avg = []
-        for i in range(AVERAGING_SCANS):
-            #delayed_Rx_1a = Rx_1a * np.exp(1j * np.deg2rad(1 * phase_delay + phase_cal_1a))
-            #delayed_Rx_1a = Rx_1a * np.exp(1j * np.deg2rad(1 * phase_delay + phase_cal_1a))    # PlutoSDR 1 RX 1
-            #delayed_Rx_0b = Rx_0b * np.exp(1j * np.deg2rad(3 * phase_delay + phase_cal_1a))    # PlutoSDR 2 RX 0
-            delayed_Rx_1b = Rx_1b * np.exp(1j * np.deg2rad(1 * phase_delay + phase_cal_1b))     # PlutoSDR 2 RX 1
-            delayed_Rx_0c = Rx_0b * np.exp(1j * np.deg2rad(2 * phase_delay + phase_cal_1b))     # PlutoSDR 3 RX 0
-            delayed_Rx_1c = Rx_1b * np.exp(1j * np.deg2rad(3 * phase_delay + phase_cal_1b))     # PlutoSDR 3 RX 1                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                          ))    # PlutoSDR 3 RX 1
-            #delayed_Rx_0d = Rx_0b * np.exp(1j * np.deg2rad(3 * phase_delay + phase_cal_1a))    # PlutoSDR 4 RX 0
-            #delayed_Rx_1d = Rx_1b * np.exp(1j * np.deg2rad(4 * phase_delay + phase_cal_1a))    # PlutoSDR 4 RX 1
-            delayed_sum = dbfs(Rx_0b + delayed_Rx_1b + delayed_Rx_0c + delayed_Rx_1c)
-            peak_sum_avg.append(delayed_sum[signal_start:signal_end])
-        peak_sum_value = sum(peak_sum_avg) / len(peak_sum_avg)
-        peak_sum.append(np.max(peak_sum_value)) # np.max(delayed_sum[signal_start:signal_end])
+    ''' Phase shift by every entry of delay_phases in one batch and store peak signal '''
+    # Same nodes as the old per-phase loop: P2 Rx0/Rx1 are reused for the P3 slots and all use phase_cal_1b
+    channels = np.array([Rx_0b, Rx_1b, Rx_0b, Rx_1b])
+    peak_sum = scanner.scan(channels, [0, phase_cal_1b, phase_cal_1b, phase_cal_1b])
     
-    peak_dbfs = np.max(peak_sum)
-    peak_delay_index = np.where(peak_sum == peak_dbfs)
-    peak_delay = delay_phases[peak_delay_index[0][0]]
-    steer_angle = int(calcTheta(peak_delay))
+    peak_delay, peak_dbfs = scanner.peak(peak_sum)
+    steer_angle = int(calcTheta(peak_delay, rx_lo, d))
 
     if Plot_Compass == False:
         plt.clf()
@@ -28,11 +28,14 @@ video walkthrough of this at:  https://www.youtube.com/@jonkraft
 
 import sys
 print(f'sys.path = {sys.path}')       # Edit JB: may need to add path to PYTHONPATH for OSError: [Errno 16] Device or resource busy
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))     # Toolbox/ folder for the shared beamforming package
 
 import adi
 import numpy as np
 import pyqtgraph as pg   # pyqtgraph will plot MUCH faster than matplotlib (https://pyqtgraph.readthedocs.io/en/latest/getting_started/installation.html)
 from pyqtgraph.Qt import QtCore, QtGui
+from beamforming import BeamScanner, calcTheta
 
 '''Setup'''
 samp_rate = 2e6    # must be <=30.72 MHz if both channels are enabled
@@ -89,14 +92,6 @@ xf = np.fft.fftshift(xf)/1e6
 signal_start = int(NumSamples*(samp_rate/2+fc0/2)/samp_rate)
 signal_end = int(NumSamples*(samp_rate/2+fc0*2)/samp_rate)
 
-def calcTheta(phase):
-    # calculates the steering angle for a given phase delta (phase is in deg)
-    # steering angle is theta = arcsin(c*deltaphase/(2*pi*f*d)
-    arcsin_arg = np.deg2rad(phase)*3E8/(2*np.pi*rx_lo*d)
-    arcsin_arg = max(min(1, arcsin_arg), -1)     # arcsin argument must be between 1 and -1, or numpy will throw a warning
-    calc_theta = np.rad2deg(np.arcsin(arcsin_arg))
-    return calc_theta
-
 def dbfs(raw_data):
     # function to convert IQ samples to FFT plot, scaled in dBFS
     NumSamples = len(raw_data)
@@ -118,31 +113,29 @@ def monopulse_angle(array1, array2):
     angle_diff = np.angle(sum_delta_correlation)
     return angle_diff
 
+delay_phases = np.arange(-180, 180, 2)    # phase delay in degrees
+# Steering over the whole spectrum: peak_sum / peak_delta are the max of the full dbfs() trace
+scanner = BeamScanner(delay_phases, [0, 1], NumSamples, 0, NumSamples)
+delta_sign = np.array([1, -1])            # Rx_0 - delayed_Rx_1
+
 def scan_for_DOA():
     # go through all the possible phase shifts and find the peak, that will be the DOA (direction of arrival) aka steer_angle
+    # Each channel is FFT'd once, then every sum/delta spectrum is a weighted sum of the two channel spectra
     data = sdr.rx()
     Rx_0=data[0]
     Rx_1=data[1]
-    peak_sum = []
-    peak_delta = []
-    monopulse_phase = []
-    delay_phases = np.arange(-180, 180, 2)    # phase delay in degrees
-    for phase_delay in delay_phases:   
-        delayed_Rx_1 = Rx_1 * np.exp(1j*np.deg2rad(phase_delay+phase_cal))
-        delayed_sum = Rx_0 + delayed_Rx_1
-        delayed_delta = Rx_0 - delayed_Rx_1
-        delayed_sum_fft, delayed_sum_dbfs = dbfs(delayed_sum)
-        delayed_delta_fft, delayed_delta_dbfs = dbfs(delayed_delta)
-        mono_angle = monopulse_angle(delayed_sum_fft, delayed_delta_fft)
-        
-        peak_sum.append(np.max(delayed_sum_dbfs))
-        peak_delta.append(np.max(delayed_delta_dbfs))
-        monopulse_phase.append(np.sign(mono_angle))
+    spectra = scanner.spectra(np.array([Rx_0, Rx_1]))
+    weights = scanner.weights([0, phase_cal])
+    delayed_sum_fft = weights @ spectra
+    delayed_delta_fft = (weights * delta_sign) @ spectra
+    peak_sum = 20*np.log10(np.max(np.abs(delayed_sum_fft), axis=-1)/(2**11))
+    peak_delta = 20*np.log10(np.max(np.abs(delayed_delta_fft), axis=-1)/(2**11))
+    # monopulse_angle() for every phase at once: 'valid' correlation of equal length traces is sum(a * conj(b))
+    sum_delta_correlation = np.sum(delayed_sum_fft[:, signal_start:signal_end] * np.conj(delayed_delta_fft[:, signal_start:signal_end]), axis=-1)
+    monopulse_phase = np.sign(np.angle(sum_delta_correlation))
         
-    peak_dbfs = np.max(peak_sum)
-    peak_delay_index = np.where(peak_sum==peak_dbfs)
-    peak_delay = delay_phases[peak_delay_index[0][0]]
-    steer_angle = int(calcTheta(peak_delay))
+    peak_delay, peak_dbfs = scanner.peak(peak_sum)
+    steer_angle = int(calcTheta(peak_delay, rx_lo, d))
     
     return delay_phases, peak_dbfs, peak_delay, steer_angle, peak_sum, peak_delta, monopulse_phase
 
@@ -192,7 +185,7 @@ curve1 = p1.plot(tracking_angles)
 def update_tracker():
     global tracking_angles, delay
     delay = Tracking(delay)
-    tracking_angles = np.append(tracking_angles, calcTheta(delay))
+    tracking_angles = np.append(tracking_angles, calcTheta(delay, rx_lo, d))
     tracking_angles = tracking_angles[1:]
     curve1.setData(tracking_angles, np.arange(tracking_length))
     
@@ -33,6 +33,9 @@ import adi
 import matplotlib.pyplot as plt
 import numpy as np
 import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))     # Toolbox/ folder for the shared beamforming package
+from beamforming import dbfs
 
 '''Setup'''
 samp_rate = 2e6             # must be <= 30.72 MHz if both channels are enabled
@@ -79,15 +82,6 @@ sdr.tx([iq0,iq0])                           # Send Tx data.
 xf = np.fft.fftfreq(NumSamples, ts)         # Assign frequency bins
 xf = np.fft.fftshift(xf)/1e6
 
-def dbfs(raw_data):                         # function to convert IQ samples to FFT plot, scaled in dBFS
-    NumSamples = len(raw_data)
-    win = np.hamming(NumSamples)
-    y = raw_data * win
-    s_fft = np.fft.fft(y) / np.sum(win)
-    s_shift = np.fft.fftshift(s_fft)
-    s_dbfs = 20*np.log10(np.abs(s_shift)/(2**11))   # Pluto is a signed 12 bit ADC, so use 2^11 to convert to dBFS
-    return s_dbfs
-
 '''Collect Data'''
 for i in range(20):                         # let Pluto run for a bit, to do all its calibrations, then get a buffer
     data = sdr.rx()
@@ -35,6 +35,9 @@ from pyqtgraph.Qt import QtCore, QtGui, QtWidgets
 import numpy as np
 import time
 import math
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))     # Toolbox/ folder for the shared beamforming package
+from beamforming import calcTheta, dbfs
 
 '''Setup'''
 samp_rate = 2e6             # must be <= 30.72 MHz if both channels are enabled
@@ -86,23 +89,6 @@ sdr.tx([iq0,iq0])                           # Send Tx data.
 xf = np.fft.fftfreq(NumSamples, ts)         # Assign frequency bins
 xf = np.fft.fftshift(xf)/1e6
 
-def calcTheta(phase):
-    # calculates the steering angle for a given phase delta (phase is in deg)
-    # steering angle is theta = arcsin(c*deltaphase/(2*pi*f*d)
-    arcsin_arg = np.deg2rad(phase) * 3E8 / (2 * np.pi * rx_lo * d)
-    arcsin_arg = max(min(1, arcsin_arg), -1)     # arcsin argument must be between 1 and -1, or numpy will throw a warning
-    calc_theta = np.rad2deg(np.arcsin(arcsin_arg))
-    return calc_theta
-
-def dbfs(raw_data):                         # function to convert IQ samples to FFT plot, scaled in dBFS
-    NumSamples = len(raw_data)
-    win = np.hamming(NumSamples)
-    y = raw_data * win
-    s_fft = np.fft.fft(y) / np.sum(win)
-    s_shift = np.fft.fftshift(s_fft)
-    s_dbfs = 20*np.log10(np.abs(s_shift)/(2**11))   # Pluto is a signed 12 bit ADC, so use 2^11 to convert to dBFS
-    return s_dbfs
-
 '''Collect Data'''
 for i in range(20):                         # let Pluto run for a bit, to do all its calibrations, then get a buffer
     data = sdr.rx()
@@ -202,13 +188,13 @@ def rotate():
     if (peakToggle and np.max(delayed_sum) > np.max(peak_sum)):
         peak_sum = delayed_sum 
         peak_delay = phase_delay
-        peak_steer_angle = int(calcTheta(peak_delay))
+        peak_steer_angle = int(calcTheta(peak_delay, rx_lo, d))
 
     ''' FFT Plot '''
     if (peakToggle):
         peakCurve.setData(xf, peak_sum)
     baseCurve.setData(xf, delayed_sum)
-    steer_angle = int(calcTheta(phase_delay))
+    steer_angle = int(calcTheta(phase_delay, rx_lo, d))
     # Set labels
     phaseLabel.setText("Phase shift = {} deg".format(phase_delay))
     steerLabel.setText("Steering Angle = {} deg".format(steer_angle))
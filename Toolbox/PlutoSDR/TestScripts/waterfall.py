@@ -7,11 +7,14 @@ print(f'sys.path = {sys.path}')       # Edit JB: may need to add path to PYTHONP
 import adi
 import numpy as np
 import pygame
-from matplotlib import mlab as mlab
-from PIL import Image
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[2]))     # Toolbox/ folder for the shared beamforming package
+from beamforming.waterfall import Waterfall, psd
 
-DISPLAY_WIDTH = 256
-DISPLAY_HEIGHT = 200
+FFT_SIZE = 1024         # bins per spectrum
+SPAN = 1 / 4            # center part of the spectrum that is displayed
+DISPLAY_WIDTH = 256     # columns; a wider span keeps the strongest bin of each column
+DISPLAY_HEIGHT = 200    # rows of history
 
 # Create Radio
 sdr = adi.ad9361(uri='ip:192.168.2.1') # 2023-12-02: Works now and waterfall display works
@@ -26,39 +29,15 @@ sdr.dds_enabled = [1, 1, 1, 1]
 sdr.dds_frequencies = [1e6, 1e6, 1e6, 1e6]
 sdr.dds_scales = [1, 1, 0, 0]
 
-image = []
+# History ring, allocated once: every frame colors and uploads only the newest row
+waterfall = Waterfall(DISPLAY_WIDTH, DISPLAY_HEIGHT, 'gray')
+span = slice(round(FFT_SIZE / 2) - round(FFT_SIZE * SPAN / 2), round(FFT_SIZE / 2) + round(FFT_SIZE * SPAN / 2))
 
 def get_data():
     samples = sdr.rx()
-    power, _ = mlab.psd(samples, NFFT=1024, Fs=int(sdr.sample_rate) / 1e6)
-
-    max_pow = 0
-    min_pow = 10
-
-    # search whole data set for maximum and minimum value
-    for dat in power:
-        if dat > max_pow:
-            max_pow = dat
-        elif dat < min_pow:
-            min_pow = dat
-
-    # update image data
-    imagelist = []
-    for dat in power:
-        imagelist.append(mymap(dat, min_pow, max_pow, 0, 255))
-    image.append(
-        imagelist[
-            round(len(imagelist) / 2)
-            - round(len(imagelist) / 8) : round(len(imagelist) / 2)
-            + round(len(imagelist) / 8)
-        ]
-    )
-    if len(image) > 200:
-        image.pop(0)
-
-
-def mymap(x, in_min, in_max, out_min, out_max):
-    return int((x - in_min) * (out_max - out_min) / (in_max - in_min) + out_min)
+    power = psd(samples, FFT_SIZE, int(sdr.sample_rate) / 1e6)
+    # normalized to the min and max of the row and colored, all bins at once
+    return waterfall.push(power[span])
 
 
 pygame.init()
@@ -68,6 +47,8 @@ clock = pygame.time.Clock()
 background = pygame.Surface(gameDisplay.get_size())
 background = background.convert()
 background.fill((0, 0, 0))
+# The ring rows as a surface, same layout as waterfall.rgb
+ring = pygame.Surface((DISPLAY_WIDTH, DISPLAY_HEIGHT)).convert()
 
 game_quit = False
 
@@ -79,14 +60,12 @@ while not game_quit:
         if event.type == pygame.QUIT:
             game_quit = True
 
-    get_data()
-    outimage = np.array(image, np.ubyte)
-    outimage = Image.fromarray(outimage, mode="L")
-    outimage = outimage.convert("RGBA")
-    strFormat = "RGBA"
-    raw_str = outimage.tobytes("raw", strFormat)
-    surface = pygame.image.fromstring(raw_str, outimage.size, "RGBA")
-    gameDisplay.blit(surface, (0, 0))
+    row = get_data()
+    # Upload only the new row (surfarray is x, y so the row is a (width x 1 x 3) column block),
+    # then blit the ring in display order, oldest row on top
+    pygame.surfarray.blit_array(ring.subsurface((0, waterfall.head, DISPLAY_WIDTH, 1)), row[:, np.newaxis, :])
+    for start, stop, y in waterfall.segments():
+        gameDisplay.blit(ring, (0, y), pygame.Rect(0, start, DISPLAY_WIDTH, stop - start))
     pygame.display.update()
     clock.tick(60)
 
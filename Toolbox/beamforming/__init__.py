@@ -0,0 +1,25 @@
+'''
+Shared DSP for the PlutoSDR beamforming scripts in Toolbox/.
+
+Scripts in Toolbox/ can import this package directly. Scripts in sub folders need the Toolbox
+folder on sys.path first, e.g.:
+    path.append(str(Path(__file__).resolve().parents[2]))
+'''
+
+from .dsp import (dbfs, calcTheta, trimDelay, padDelay, correct_trigger_delay, align_channels, aligned_views,
+                  xcorrelate, compute_phase_offset_and_delay, find_phase_offset, find_trigger_delay,
+                  generate_bpsk)
+from .buffers import BufferPool
+from .scan import BeamScanner, steering_matrix
+from .acquisition import ConcurrentReceiver
+from .pipeline import Pipeline
+from .simulator import SimulatedPluto, SimulatedScene, simulated_array
+from .correlate import Correlator, correlate_channels
+from .doa import phase_progression, doa_candidates, interferometric_doa
+from .covariance import sample_covariance, StreamingCovariance
+from .subspace import MUSIC, root_music
+from .adaptive import MVDR
+from .calibration import Calibration, CalibrationStore, DriftMonitor, calibration_key
+from .channels import ChannelMatrix
+from .waterfall import Waterfall
+from .waveforms import WaveformCache, barker, bpsk_buffer, pn_sequence, tone
@@ -0,0 +1,77 @@
+'''
+Concurrent receive from several Plutos.
+
+Calling sdr1.rx(), sdr2.rx(), sdr3.rx() one after another makes the frame latency the sum of all
+the network round trips, and each buffer is captured later than the one before it, which shows up
+as extra trigger delay in compute_phase_offset_and_delay(). ConcurrentReceiver keeps one worker
+thread per device (libiio releases the GIL while it waits on the network) and releases them all
+through a barrier, so every rx() is issued at the same moment.
+'''
+
+import threading
+import time
+import numpy as np
+
+''' One worker thread per device, all released together for every rx() '''
+class ConcurrentReceiver(object):
+
+    def __init__(self, sdrs, timeout=5.0):
+        # sdrs: list of adi.ad9361 (or anything with an rx() method), in channel order
+        # timeout: seconds to wait for all devices before giving up on a frame
+        self.sdrs = list(sdrs)
+        self.timeout = timeout
+        num_devices = len(self.sdrs)
+        self._start = threading.Barrier(num_devices + 1)
+        self._done = threading.Barrier(num_devices + 1)
+        self._data = [None] * num_devices
+        self._errors = [None] * num_devices
+        self.issue_times = np.zeros(num_devices)    # time.perf_counter() when each rx() was issued
+        self.timestamps = np.zeros(num_devices)     # time.perf_counter() when each rx() returned
+        self._running = True
+        self._threads = []
+        for index in range(num_devices):
+            thread = threading.Thread(target=self._worker, args=(index,), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self, index):
+        sdr = self.sdrs[index]
+        while True:
+            try:
+                self._start.wait()
+            except threading.BrokenBarrierError:
+                return
+            if not self._running:
+                return
+            self.issue_times[index] = time.perf_counter()
+            try:
+                self._data[index] = sdr.rx()
+                self._errors[index] = None
+            except Exception as error:
+                self._errors[index] = error
+            self.timestamps[index] = time.perf_counter()
+            try:
+                self._done.wait()
+            except threading.BrokenBarrierError:
+                return
+
+    ''' Receive one buffer from every device: ((channels x samples) block, per-device timestamps) '''
+    def rx(self):
+        try:
+            self._start.wait(self.timeout)
+            self._done.wait(self.timeout)
+        except threading.BrokenBarrierError:
+            self.close()
+            raise TimeoutError(f'Not every device returned rx() within {self.timeout} s')
+        for sdr, error in zip(self.sdrs, self._errors):
+            if error is not None:
+                raise RuntimeError(f'rx() failed on {getattr(sdr, "uri", sdr)}') from error
+        # ad9361.rx() returns a list with one array per enabled channel, or a single array for one channel
+        block = np.concatenate([np.atleast_2d(np.asarray(data)) for data in self._data])
+        return block, self.timestamps.copy()
+
+    ''' Stop the worker threads '''
+    def close(self):
+        self._running = False
+        self._start.abort()
+        self._done.abort()
@@ -0,0 +1,66 @@
+'''
+MVDR (Capon) adaptive beamforming for the multi-Pluto linear arrays.
+
+The phase-shift sum in rotate() has fixed sidelobes about 13 dB down, so a strong interferer in
+the ISM band can out-shout the emitter at the peak search. MVDR keeps unit gain in the look
+direction and minimises everything else, which puts nulls on the interferers:
+    w = R^-1 a / (a^H R^-1 a),    Capon spectrum P = 1 / (a^H R^-1 a)
+R comes from covariance.py (sample_covariance() or StreamingCovariance) with diagonal loading
+added for robustness against calibration errors and short averaging. Inverting R is the only
+O(channels^3) step, so it is redone every update_every updates, not per buffer or per sample.
+
+Phase steps [deg] between neighbouring elements are the same units as delay_phases in the
+PlotPeaks scripts, and the channels given to beamform() must carry the same phase_cal as the
+channels R was estimated from.
+'''
+
+import numpy as np
+from .scan import steering_matrix
+
+''' MVDR weights, Capon spectrum and beamformed output from a channel covariance '''
+class MVDR(object):
+
+    def __init__(self, element_index, delay_phases=np.arange(-180, 180, 2), loading=0.01, update_every=1):
+        # loading: diagonal loading as a fraction of the mean channel power (trace(R) / channels)
+        # update_every: recompute R^-1 on every update_every-th call to update()
+        self.element_index = np.asarray(element_index)
+        self.delay_phases = np.asarray(delay_phases)
+        self.loading = loading
+        self.update_every = int(update_every)
+        # Array response for every grid phase step (phases x channels), see subspace.MUSIC
+        self.manifold = np.conj(steering_matrix(self.delay_phases, self.element_index))
+        self.R_inv = None
+        self.updates = 0
+        self.inversions = 0
+
+    ''' Take a new covariance estimate, inverting it when the cadence is due '''
+    def update(self, R):
+        if self.R_inv is None or self.updates % self.update_every == 0:
+            num_channels = R.shape[0]
+            load = self.loading * np.trace(R).real / num_channels
+            self.R_inv = np.linalg.inv(R + load * np.eye(num_channels))
+            self.inversions += 1
+        self.updates += 1
+
+    ''' Array response for one phase step [deg] '''
+    def response(self, look_phase):
+        return np.conj(steering_matrix([look_phase], self.element_index)[0])
+
+    ''' Capon spatial spectrum [dB] for every entry of delay_phases '''
+    def spectrum(self):
+        # a^H R^-1 a for all grid points at once
+        quad = np.sum(np.conj(self.manifold) * (self.manifold @ self.R_inv.T), axis=-1).real
+        return -10 * np.log10(quad)
+
+    ''' MVDR weights (channels) for a look direction given as a phase step [deg] '''
+    def weights(self, look_phase):
+        a = self.response(look_phase)
+        R_inv_a = self.R_inv @ a
+        return R_inv_a / (np.conj(a) @ R_inv_a)
+
+    ''' Beamformed output stream w^H x (samples) of a (channels x samples) block '''
+    def beamform(self, channels, look_phase, phase_cal=None):
+        channels = np.asarray(channels)
+        if phase_cal is not None:
+            channels = channels * np.exp(1j * np.deg2rad(np.asarray(phase_cal, dtype=float)))[:, np.newaxis]
+        return np.conj(self.weights(look_phase)) @ channels
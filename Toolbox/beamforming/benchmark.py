@@ -0,0 +1,223 @@
+'''
+Benchmarks for the beamforming hot paths, on data from the simulated Plutos.
+
+Run from the Toolbox/ folder:
+    python -m beamforming.benchmark                        # print the timings
+    python -m beamforming.benchmark --save results.json    # and write them as JSON
+    python -m beamforming.benchmark --baseline beamforming/benchmark_baseline.json
+
+Each benchmark is timed at the PlotPeaks defaults (6 channels, 2^12 samples, 180 phases) and then
+with one of those swept at a time: 2 to 16 channels, 2^10 to 2^20 samples, 90 to 1440 phases.
+With --baseline, every case that is more than --tolerance slower than the stored timing is
+reported as a regression and the exit status is 1. Timings only compare on the same machine, so
+regenerate the baseline with --save when the hardware changes.
+'''
+
+import argparse
+import json
+import platform
+import sys
+import time
+import numpy as np
+from .dsp import dbfs, xcorrelate, compute_phase_offset_and_delay, correct_trigger_delay, generate_bpsk
+from .scan import BeamScanner
+from .correlate import correlate_channels
+from .doa import interferometric_doa
+from .simulator import SimulatedScene, simulated_array
+
+DEFAULT_CASE = {'channels': 6, 'samples': 2**12, 'phases': 180}
+CHANNELS = [2, 4, 6, 8, 12, 16]
+SAMPLES = [2**10, 2**12, 2**14, 2**16, 2**18, 2**20]
+PHASES = [90, 180, 360, 720, 1440]
+QUICK_SAMPLES = 2**14       # --quick stops the samples sweep here
+QUICK_PHASES = 360          # and the phases sweep here
+TIME_MODE_SAMPLES = 2**16   # "time" mode runs one FFT per phase, so it is only swept this far
+
+samp_rate = 1e6
+fc0 = int(200e3)
+rx_lo = 915e6
+
+''' Synthetic (channels x samples) block: BPSK from 20 deg with trigger delays and phase offsets '''
+def synthetic_block(channels, samples, seed=0):
+    rng = np.random.default_rng(seed)
+    scene = SimulatedScene(emitter_angle=20, seed=seed)
+    num_devices = (channels + 1) // 2
+    sdrs = simulated_array(num_devices, scene, num_samples=samples, sample_rate=samp_rate, rx_lo=rx_lo,
+                           trigger_delays=np.repeat(rng.integers(-10, 10, (num_devices, 1)), 2, axis=1),
+                           phase_offsets=rng.uniform(-180, 180, (num_devices, 2)))
+    sdrs[0].tx(generate_bpsk(rng.choice([-1, 1], max(samples // 8, 64)), samp_rate, 8e-6))
+    block = np.concatenate([np.atleast_2d(np.asarray(sdr.rx())) for sdr in sdrs])
+    return block[:channels]
+
+''' Scanner over the same bins as the PlotPeaks scripts '''
+def make_scanner(channels, samples, phases, mode="freq"):
+    delay_phases = np.linspace(-180, 180, phases, endpoint=False)
+    signal_start = int(samples * (samp_rate / 2 + fc0 / 2) / samp_rate)
+    signal_end = int(samples * (samp_rate / 2 + fc0 * 2) / samp_rate)
+    return BeamScanner(delay_phases, np.arange(channels), samples, signal_start, signal_end, mode=mode)
+
+''' Beam sweep of rotate()/sweep(): one scan of every phase '''
+def bench_scan(case, block):
+    scanner = make_scanner(case['channels'], case['samples'], case['phases'])
+    phase_cal = np.zeros(case['channels'])
+    return lambda: scanner.scan(block, phase_cal)
+
+''' Same sweep with the original sum-then-FFT order '''
+def bench_scan_time(case, block):
+    scanner = make_scanner(case['channels'], case['samples'], case['phases'], mode="time")
+    phase_cal = np.zeros(case['channels'])
+    return lambda: scanner.scan(block, phase_cal)
+
+''' Trigger delay and phase offset of every channel against the first one '''
+def bench_sync(case, block):
+    return lambda: compute_phase_offset_and_delay(block[0], block[1:])
+
+''' Same sync with the bounded +-256 lag search of correlate.py's "window" mode '''
+def bench_sync_window(case, block):
+    return lambda: correlate_channels(block[0], block[1:], 256, "window")
+
+''' One xcorrelate() over half the buffer length, as compute_phase_offset_and_delay() does '''
+def bench_xcorrelate(case, block):
+    maxlag = case['samples'] // 2
+    return lambda: xcorrelate(block[0], block[1], maxlag)
+
+''' dBFS spectrum of one channel '''
+def bench_dbfs(case, block):
+    return lambda: dbfs(block[0])
+
+''' The DSP of one newPlotPeaks rotate() frame: sync, delay correction and beam sweep '''
+def bench_frame(case, block):
+    scanner = make_scanner(case['channels'], case['samples'], case['phases'])
+    def frame():
+        phase_cal, delay = compute_phase_offset_and_delay(block[0], block[1:])
+        channels = np.vstack([block[:1]] + [correct_trigger_delay(Rx, delta) for Rx, delta in zip(block[1:], delay)])
+        return scanner.scan(channels, np.concatenate([[0], phase_cal]))
+    return frame
+
+''' Sum and delta sweep of monopulseTracking.scan_for_DOA() '''
+def bench_scan_for_DOA(case, block):
+    scanner = make_scanner(2, case['samples'], case['phases'])
+    delta_sign = np.array([1, -1])
+    def scan_for_DOA():
+        spectra = scanner.spectra(block[:2])
+        weights = scanner.weights([0, 0])
+        delayed_sum_fft = weights @ spectra
+        delayed_delta_fft = (weights * delta_sign) @ spectra
+        peak_sum = 20*np.log10(np.max(np.abs(delayed_sum_fft), axis=-1)/(2**11))
+        sum_delta_correlation = np.sum(delayed_sum_fft * np.conj(delayed_delta_fft), axis=-1)
+        return peak_sum, np.sign(np.angle(sum_delta_correlation))
+    return scan_for_DOA
+
+''' Closed form DOA from the channel spectra, no phase sweep '''
+def bench_interferometric(case, block):
+    scanner = make_scanner(case['channels'], case['samples'], 1)
+    element_index = np.arange(case['channels'])
+    return lambda: interferometric_doa(scanner.spectra(block), element_index, rx_lo, 0.5 * 3e8 / rx_lo)
+
+# name: (setup function, swept parameters, largest samples)
+BENCHMARKS = {
+    'scan': (bench_scan, ('channels', 'samples', 'phases'), None),
+    'scan_time': (bench_scan_time, ('channels', 'samples', 'phases'), TIME_MODE_SAMPLES),
+    'sync': (bench_sync, ('channels', 'samples'), None),
+    'sync_window': (bench_sync_window, ('channels', 'samples'), None),
+    'xcorrelate': (bench_xcorrelate, ('samples',), None),
+    'dbfs': (bench_dbfs, ('samples',), None),
+    'frame': (bench_frame, ('channels', 'samples', 'phases'), None),
+    'scan_for_DOA': (bench_scan_for_DOA, ('samples', 'phases'), None),
+    'interferometric': (bench_interferometric, ('channels', 'samples'), None),
+}
+
+''' Every case of one benchmark: the defaults, then one parameter swept at a time '''
+def cases(params, max_samples=None, quick=False):
+    sweeps = {'channels': CHANNELS, 'samples': SAMPLES, 'phases': PHASES}
+    if quick:
+        sweeps['samples'] = [n for n in SAMPLES if n <= QUICK_SAMPLES]
+        sweeps['phases'] = [n for n in PHASES if n <= QUICK_PHASES]
+    if max_samples is not None:
+        sweeps['samples'] = [n for n in sweeps['samples'] if n <= max_samples]
+    result = []
+    for param in params:
+        for value in sweeps[param]:
+            case = {key: DEFAULT_CASE[key] for key in params}
+            case[param] = value
+            if case not in result:
+                result.append(case)
+    return result
+
+''' Unique name of a benchmark case, e.g. "scan[channels=6,samples=4096,phases=180]" '''
+def case_key(name, case):
+    return name + '[' + ','.join(f'{key}={case[key]}' for key in sorted(case)) + ']'
+
+''' Median seconds per call, after one warm-up call to fill the window and plan caches '''
+def time_call(func, min_time=0.2, min_repeats=3, max_repeats=1000):
+    func()
+    times = []
+    while len(times) < min_repeats or (sum(times) < min_time and len(times) < max_repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+''' Run the selected benchmarks: {case_key: {"name", case parameters..., "seconds", "fps"}} '''
+def run(names=None, quick=False, min_time=0.2, verbose=True):
+    names = list(BENCHMARKS) if names is None else names
+    blocks = {}
+    results = {}
+    for name in names:
+        if name not in BENCHMARKS:
+            raise ValueError(f'Not a valid benchmark: {name} ({", ".join(BENCHMARKS)})')
+        setup, params, max_samples = BENCHMARKS[name]
+        for case in cases(params, max_samples, quick):
+            shape = (case.get('channels', 2), case.get('samples', DEFAULT_CASE['samples']))
+            if shape not in blocks:
+                blocks[shape] = synthetic_block(*shape)
+            full_case = dict(DEFAULT_CASE, **case)
+            seconds = time_call(setup(full_case, blocks[shape]), min_time=min_time)
+            key = case_key(name, case)
+            results[key] = dict(name=name, **case, seconds=seconds, fps=1 / seconds)
+            if verbose:
+                print(f'{key:<55} {seconds * 1e3:10.3f} ms  {1 / seconds:10.1f} /s')
+    return results
+
+''' Cases that got slower than baseline by more than tolerance: [(key, baseline s, new s)] '''
+def compare(results, baseline, tolerance=0.25):
+    regressions = []
+    for key, result in results.items():
+        if key in baseline:
+            old = baseline[key]['seconds']
+            if result['seconds'] > old * (1 + tolerance):
+                regressions.append((key, old, result['seconds']))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the beamforming DSP on simulated data')
+    parser.add_argument('names', nargs='*', help=f'benchmarks to run (default: all of {", ".join(BENCHMARKS)})')
+    parser.add_argument('--quick', action='store_true', help=f'stop the sweeps at {QUICK_SAMPLES} samples and {QUICK_PHASES} phases')
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds to spend timing each case')
+    parser.add_argument('--save', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON file from --save to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline (0.25 = 25%%)')
+    args = parser.parse_args(argv)
+
+    results = run(args.names or None, quick=args.quick, min_time=args.min_time)
+    report = {
+        'machine': {'platform': platform.platform(), 'processor': platform.processor(),
+                    'python': platform.python_version(), 'numpy': np.__version__},
+        'results': results,
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        for key, old, new in regressions:
+            print(f'REGRESSION {key}: {old * 1e3:.3f} ms -> {new * 1e3:.3f} ms ({new / old:.2f}x)')
+        print(f'{len(regressions)} of {len(results)} cases slower than baseline by more than {args.tolerance:.0%}')
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
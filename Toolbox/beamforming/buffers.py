@@ -0,0 +1,72 @@
+'''
+Reusable work buffers for the per-frame DSP.
+
+Every rotate()/sweep() frame used to allocate the same handful of sample-sized complex128 arrays
+(windowed channels, FFTs, steered sums, magnitudes), which at sustained frame rates is mostly
+allocator churn. A BufferPool hands out named, preallocated arrays instead: the first request for
+a name allocates it, later requests with the same shape and dtype get the same array back, and the
+caller writes into it with out= arguments. Shapes follow NumSamples and the channel count, so after
+the first frame (or after a resize) a frame makes no new pool allocations.
+
+The counters tell whether that holds: `allocations` counts every array the pool had to allocate,
+and frame() reports the allocations of one frame. With debug=True frame() also measures, through
+tracemalloc, the peak bytes allocated during the frame; once the pool is filled that is only the
+temporaries the out= arguments missed. tracemalloc slows Python down, so leave debug off when timing.
+'''
+
+from contextlib import contextmanager
+import tracemalloc
+import numpy as np
+
+''' Named preallocated arrays, reused while their shape and dtype stay the same '''
+class BufferPool(object):
+
+    def __init__(self, debug=False):
+        # debug: also measure the peak bytes allocated in every frame()
+        self.debug = debug
+        self._buffers = {}
+        self.allocations = 0            # arrays allocated since the pool was created
+        self.frames = 0
+        self.frame_allocations = 0      # pool allocations in the last frame()
+        self.frame_peak_bytes = 0       # with debug, peak bytes allocated in the last frame()
+        self._frame_start = 0
+
+    ''' Array called name with this shape and dtype, allocated only the first time (contents are stale) '''
+    def get(self, name, shape, dtype=np.complex128):
+        shape = tuple(int(n) for n in np.atleast_1d(shape))
+        dtype = np.dtype(dtype)
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self._buffers[name] = buffer
+            self.allocations += 1
+        return buffer
+
+    ''' Bytes held by the pool '''
+    @property
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    ''' Count the pool allocations (and with debug, the peak allocated bytes) of one frame '''
+    @contextmanager
+    def frame(self):
+        start_allocations = self.allocations
+        if self.debug:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self._frame_start = tracemalloc.get_traced_memory()[0]
+        try:
+            yield self
+        finally:
+            self.frames += 1
+            self.frame_allocations = self.allocations - start_allocations
+            if self.debug:
+                self.frame_peak_bytes = tracemalloc.get_traced_memory()[1] - self._frame_start
+
+    ''' One line summary of the last frame for a debug print or label '''
+    def report(self):
+        text = f'frame {self.frames}: {self.frame_allocations} buffer allocations ({self.nbytes / 2**10:.0f} KiB pooled)'
+        if self.debug:
+            text += f', {self.frame_peak_bytes / 2**10:.1f} KiB temporary'
+        return text
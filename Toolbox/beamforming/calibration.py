@@ -0,0 +1,207 @@
+'''
+Per channel phase, delay and gain calibration, kept on disk between runs.
+
+rotate() used to measure every channel's trigger delay and phase offset against the reference
+channel by full cross-correlation on every frame. Between Pluto restarts the trigger delays don't
+change and the phase offsets drift slowly, so a Calibration is measured once (averaged over a few
+buffers, like the startup loop in dualTxPlotPeaks.py), saved in a CalibrationStore under the
+devices, LO and sample rate it was taken with, and reloaded at the next start. Each frame then
+only runs Calibration.check(), one zero-lag inner product per channel, and re-measures when the
+check fails.
+
+All values are relative to channel 0 and use the same signs as compute_phase_offset_and_delay():
+delay goes to align_channels() and phase to the phase_cal of BeamScanner.scan().
+
+DriftMonitor runs that check on every frame and also tracks the slow phase drift: it reads each
+channel's phase at the tone bin (a single-bin DFT, O(samples) per channel), moves the stored phase
+towards it with a first order tracking filter, and only falls back to a full correlation search
+when a phase residual jumps past the threshold or the alignment (zero-lag coherence) check fails.
+It counts frames and recalibrations so the fallback rate can be watched.
+'''
+
+from functools import lru_cache
+import json
+from pathlib import Path
+import numpy as np
+from .correlate import Correlator
+from .dsp import align_channels
+
+DEFAULT_STORE = Path.home() / '.sdr-beamforming' / 'calibration.json'
+
+''' Per channel phase [deg], delay [samples] and gain against channel 0 '''
+class Calibration(object):
+
+    def __init__(self, phase, delay, gain, coherence=None):
+        # coherence: normalised zero-lag correlation of each channel after calibration, from measure()
+        self.phase = np.asarray(phase, dtype=float)
+        self.delay = np.asarray(delay, dtype=float)
+        self.gain = np.asarray(gain, dtype=float)
+        self.coherence = np.ones_like(self.phase) if coherence is None else np.asarray(coherence, dtype=float)
+
+    ''' Measure from one or more (channels x samples) buffers, averaged '''
+    @classmethod
+    def measure(cls, buffers, maxlag=None, mode="full"):
+        # buffers: list of (channels x samples) blocks, or a single block
+        buffers = np.asarray(buffers)
+        if buffers.ndim == 2:
+            buffers = buffers[np.newaxis]
+        delays, gains = [], []
+        for channels in buffers:
+            phase, delay, peak_mag = Correlator(channels[0], maxlag, mode).sync(channels[1:], subsample=True)
+            power = np.mean(channels.real**2 + channels.imag**2, axis=-1)
+            delays.append(delay)
+            gains.append(np.sqrt(power[0] / power[1:]))
+        # The lag of a buffer can jump (a trigger slip, or a tone peak one period over), and the mean of
+        # jumping lags matches no buffer. Each channel takes the most common whole-sample delay and the
+        # median subsample delay of the buffers that agree with it.
+        delays = np.asarray(delays)
+        rounded = np.round(delays)
+        delay = np.empty(delays.shape[-1])
+        for k in range(len(delay)):
+            values, counts = np.unique(rounded[:, k], return_counts=True)
+            agree = rounded[:, k] == values[np.argmax(counts)]
+            delay[k] = np.median(delays[agree, k])
+        calibration = cls(np.zeros(buffers.shape[1]), np.concatenate([[0], delay]),
+                          np.concatenate([[1], np.mean(gains, axis=0)]))
+        # Phase and coherence are measured again at that delay, so they belong to the stored delay;
+        # a buffer that doesn't line up there has a low coherence, so it barely weighs in
+        phasors, peaks = [], []
+        for channels in buffers:
+            error, coherence = calibration.residual(calibration.apply(channels))
+            phasors.append(coherence * np.exp(1j * np.deg2rad(error)))
+            peaks.append(coherence)
+        # phases are averaged on the unit circle so -179 and 179 average to 180, not 0
+        calibration.phase = np.angle(np.mean(phasors, axis=0), deg=True)
+        calibration.phase[0] = 0
+        calibration.coherence = np.median(peaks, axis=0)
+        return calibration
+
+    ''' Delay aligned, gain matched channels; the phase is left to phase_cal '''
+    def apply(self, channels):
+        aligned = align_channels(channels, self.delay)
+        aligned *= self.gain[:, np.newaxis]
+        return aligned
+
+    ''' Phase error [deg] and coherence of every channel of an aligned block against channel 0 '''
+    def residual(self, aligned, tone_freq=None):
+        # zero-lag inner product, the correlation peak after alignment, O(channels x samples)
+        # tone_freq: optional tone frequency [cycles per sample, fc0 / samp_rate] to read the phase
+        # at the tone bin only, which leaves out the noise in the rest of the band
+        cross = np.conj(aligned) @ aligned[0]
+        energy = np.sum(aligned.real**2 + aligned.imag**2, axis=-1)
+        coherence = np.abs(cross) / np.sqrt(energy[0] * energy)
+        if tone_freq is not None:
+            tone_bin = aligned @ _tone(aligned.shape[-1], tone_freq)
+            cross = tone_bin[0] * np.conj(tone_bin)
+        error = (np.angle(cross, deg=True) - self.phase + 180) % 360 - 180
+        return error, coherence
+
+    ''' True if an aligned block still fits this calibration '''
+    def check(self, aligned, max_phase_error=10.0, min_coherence=0.8):
+        # min_coherence is relative to the coherence at measurement time, so it also catches
+        # a trigger delay that moved (the channels no longer line up)
+        error, coherence = self.residual(aligned)
+        return bool(np.all(np.abs(error) <= max_phase_error) and np.all(coherence >= min_coherence * self.coherence))
+
+    def to_dict(self):
+        return {'phase': self.phase.tolist(), 'delay': self.delay.tolist(), 'gain': self.gain.tolist(),
+                'coherence': self.coherence.tolist()}
+
+    @classmethod
+    def from_dict(cls, values):
+        return cls(values['phase'], values['delay'], values['gain'], values.get('coherence'))
+
+''' Single-bin DFT kernel for a tone, built once per length and frequency '''
+@lru_cache(maxsize=8)
+def _tone(num_samples, tone_freq):
+    tone = np.exp(-2j * np.pi * tone_freq * np.arange(num_samples))
+    tone.flags.writeable = False
+    return tone
+
+''' Per frame calibration check with phase tracking, full recalibration only on a failed check '''
+class DriftMonitor(object):
+
+    def __init__(self, calibration, tone_freq=None, smoothing=0.2, max_phase_error=10.0, min_coherence=0.8,
+                 maxlag=None, mode="full", store=None, key=None):
+        # calibration: starting Calibration (e.g. from a CalibrationStore), or None to measure on the first frame
+        # tone_freq: fc0 / samp_rate to track the phase at the tone bin, None for the whole band
+        # smoothing: tracking filter gain, the share of the phase residual taken per frame
+        # max_phase_error, min_coherence: thresholds of the check, as in Calibration.check()
+        # maxlag, mode: correlation search used for a full recalibration
+        # store, key: optional CalibrationStore and key to save every new calibration under
+        self.calibration = calibration
+        self.tone_freq = tone_freq
+        self.smoothing = smoothing
+        self.max_phase_error = max_phase_error
+        self.min_coherence = min_coherence
+        self.maxlag = maxlag
+        self.mode = mode
+        self.store = store
+        self.key = key
+        self.frames = 0
+        self.recalibrations = 0         # full correlation searches
+        self.phase_failures = 0         # of which triggered by a phase residual over max_phase_error
+        self.alignment_failures = 0     # of which triggered by the coherence check
+
+    ''' Full correlation search on this frame '''
+    def recalibrate(self, data):
+        self.calibration = Calibration.measure(data, self.maxlag, self.mode)
+        self.recalibrations += 1
+        if self.store is not None:
+            self.store.save(self.key, self.calibration)
+
+    ''' Calibrate one raw (channels x samples) frame: (aligned channels, phase_cal [deg]) '''
+    def process(self, data):
+        self.frames += 1
+        if self.calibration is None:
+            self.recalibrate(data)
+            return self.calibration.apply(data), self.calibration.phase.copy()
+        aligned = self.calibration.apply(data)
+        error, coherence = self.calibration.residual(aligned, self.tone_freq)
+        aligned_ok = np.all(coherence >= self.min_coherence * self.calibration.coherence)
+        phase_ok = np.all(np.abs(error) <= self.max_phase_error)
+        if aligned_ok and phase_ok:
+            # first order tracking filter on the slow drift
+            self.calibration.phase += self.smoothing * error
+        else:
+            self.alignment_failures += int(not aligned_ok)
+            self.phase_failures += int(aligned_ok and not phase_ok)
+            self.recalibrate(data)
+            aligned = self.calibration.apply(data)
+        return aligned, self.calibration.phase.copy()
+
+''' Serial number of a Pluto if libiio reports it, its URI otherwise '''
+def device_id(sdr):
+    try:
+        # pylibiio context attributes are plain strings
+        return str(sdr.ctx.attrs['hw_serial'])
+    except (AttributeError, KeyError):
+        return getattr(sdr, 'uri', str(sdr))
+
+''' Store key for a set of receivers (in channel order), LO and sample rate '''
+def calibration_key(sdrs, rx_lo, sample_rate):
+    return f'{",".join(device_id(sdr) for sdr in sdrs)}@{int(rx_lo)}Hz@{int(sample_rate)}Sps'
+
+''' JSON file of Calibrations keyed by calibration_key() '''
+class CalibrationStore(object):
+
+    def __init__(self, path=DEFAULT_STORE):
+        self.path = Path(path)
+
+    def _read(self):
+        if not self.path.exists():
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    ''' Calibration saved under key, or None '''
+    def load(self, key):
+        values = self._read().get(key)
+        return None if values is None else Calibration.from_dict(values)
+
+    def save(self, key, calibration):
+        stored = self._read()
+        stored[key] = calibration.to_dict()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(stored, f, indent=1)
@@ -0,0 +1,109 @@
+'''
+All receive channels of the array as one (channels x samples) matrix.
+
+The PlotPeaks scripts kept every channel in its own variable (Rx_0a, Rx_1a, Rx_0b, ...) and
+repeated each delay, phase and plot step once per variable, so a fourth Pluto meant editing every
+one of those blocks. A ChannelMatrix keeps the samples as one contiguous complex64 block, row k
+being channel k, and carries what each row is: device URI, RX port, element position (in units of
+d) and capture timestamp, plus the Calibration of the whole block. align(), steer() and sum() work
+on every channel at once, so 8 or 16 elements take the same code as 6.
+
+Row order is the order of ConcurrentReceiver.rx(): (Pluto 1 Rx0, Pluto 1 Rx1, Pluto 2 Rx0, ...).
+'''
+
+import numpy as np
+from .scan import steering_matrix
+
+''' (channels x samples) complex64 samples with per channel metadata '''
+class ChannelMatrix(object):
+
+    def __init__(self, data, uris=None, ports=None, positions=None, timestamps=None, calibration=None):
+        # data: (channels x samples) block, copied to contiguous complex64 if it isn't already
+        # uris, ports: device URI and RX port of each channel
+        # positions: element position of each channel in units of d, defaults to 0, 1, 2, ...
+        # timestamps: capture time of each channel [s], e.g. ConcurrentReceiver timestamps
+        # calibration: Calibration the block was aligned with, None while it is raw
+        self.data = np.ascontiguousarray(np.atleast_2d(data), dtype=np.complex64)
+        num_channels = self.data.shape[0]
+        self.uris = [None] * num_channels if uris is None else list(uris)
+        self.ports = [None] * num_channels if ports is None else list(ports)
+        self.positions = np.arange(num_channels, dtype=float) if positions is None else np.asarray(positions, dtype=float)
+        self.timestamps = np.zeros(num_channels) if timestamps is None else np.asarray(timestamps, dtype=float)
+        self.calibration = calibration
+        for name, values in (('uris', self.uris), ('ports', self.ports), ('positions', self.positions),
+                             ('timestamps', self.timestamps)):
+            if len(values) != num_channels:
+                raise ValueError(f'{len(values)} {name} for {num_channels} channels')
+
+    ''' One frame from a ConcurrentReceiver, with the URI and port of every row '''
+    @classmethod
+    def from_receiver(cls, receiver, positions=None):
+        data, timestamps = receiver.rx()
+        uris, ports, times = [], [], []
+        for sdr, timestamp in zip(receiver.sdrs, timestamps):
+            for port in getattr(sdr, 'rx_enabled_channels', [0]):
+                uris.append(getattr(sdr, 'uri', str(sdr)))
+                ports.append(port)
+                times.append(timestamp)
+        return cls(data, uris, ports, positions, times)
+
+    @property
+    def num_channels(self):
+        return self.data.shape[0]
+
+    @property
+    def num_samples(self):
+        return self.data.shape[1]
+
+    ''' Channel labels like the GUI legends: "P1Rx0", "P1Rx1", "P2Rx0", ... '''
+    @property
+    def labels(self):
+        devices = list(dict.fromkeys(self.uris))
+        return [f'P{devices.index(uri) + 1}Rx{port}' for uri, port in zip(self.uris, self.ports)]
+
+    ''' Phase calibration [deg] of every channel, zeros when not calibrated '''
+    @property
+    def phase_cal(self):
+        if self.calibration is None:
+            return np.zeros(self.num_channels)
+        return self.calibration.phase
+
+    def __len__(self):
+        return self.num_channels
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.data if dtype is None else self.data.astype(dtype)
+
+    ''' Row k is that channel's samples, a slice or index array is a ChannelMatrix of those channels '''
+    def __getitem__(self, index):
+        if np.isscalar(index):
+            return self.data[index]
+        rows = np.arange(self.num_channels)[index]
+        calibration = self.calibration
+        if calibration is not None:
+            calibration = type(calibration)(calibration.phase[rows], calibration.delay[rows],
+                                            calibration.gain[rows], calibration.coherence[rows])
+        return ChannelMatrix(self.data[rows], [self.uris[k] for k in rows], [self.ports[k] for k in rows],
+                             self.positions[rows], self.timestamps[rows], calibration)
+
+    ''' Same channels around new samples, e.g. the aligned block from a DriftMonitor '''
+    def replace(self, data, calibration=None):
+        return ChannelMatrix(data, self.uris, self.ports, self.positions, self.timestamps, calibration)
+
+    ''' Delay aligned, gain matched copy with the calibration attached (phase goes to steer()) '''
+    def align(self, calibration):
+        return self.replace(calibration.apply(self.data), calibration)
+
+    ''' Steering weights (phases x channels) for phase steps [deg], phase calibration included '''
+    def steer(self, delay_phases):
+        weights = steering_matrix(np.atleast_1d(delay_phases), self.positions)
+        weights *= np.exp(1j * np.deg2rad(self.phase_cal))
+        return weights.astype(np.complex64)
+
+    ''' Delay-and-sum of all channels: (phases x samples), or (samples) for a single phase step '''
+    def sum(self, delay_phases=0.0):
+        steered = self.steer(delay_phases) @ self.data
+        return steered[0] if np.ndim(delay_phases) == 0 else steered
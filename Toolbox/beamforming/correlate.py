@@ -0,0 +1,151 @@
+'''
+One reference, many channels cross-correlation.
+
+compute_phase_offset_and_delay() is usually called with the same reference channel (Rx_0a, or the
+first file of a capture) against every other channel, and again after the delays are corrected,
+which FFTs the zero padded reference every time. A Correlator FFTs the reference once and then
+correlates it against a whole (channels x samples) block in one pass, as often as needed.
+
+The default "full" mode searches +-len/2 lags like xcorrelate(), so a 4096 sample buffer needs
+8192 point FFTs and a 2^20 sample file capture 2^21 points. The trigger delays between our Plutos
+are tens of samples, so "window" mode only searches +-maxlag: it correlates `segment` samples
+from the middle of the reference against the same span of each channel widened by maxlag on both
+sides. The FFT is then next_pow2(segment + 2*maxlag) points, so the cost follows the lag range
+and the segment length, not the buffer length. Leaving segment unset uses the whole buffer minus
+the 2*maxlag margin, which still halves the FFT length compared to "full".
+
+A periodic input (the default "carrier" tone) correlates equally well every period, and in "window"
+mode every lag overlaps the full segment, so the correlation has many equal peaks and a plain argmax
+picks an arbitrary one. sync() therefore takes the peak closest to zero lag among those within
+`tie_tolerance` of the highest one, and zero lag itself when the correlation is flat (a tone),
+which is what "full" mode ends up with through the shrinking overlap of its zero padded lags. A
+single sharp peak (BPSK) is not affected.
+
+sync(subsample=True) fits a parabola through the correlation magnitude around the peak, so the
+delay comes out in fractional samples and the phase is read at the interpolated peak instead of
+the nearest lag. dsp.align_channels() applies those fractional delays to the whole block. A flat
+correlation (a tone in "window" mode) has no peak to interpolate, a parabola through three equal
+magnitudes only fits the noise, so those channels keep the whole lag.
+'''
+
+from functools import lru_cache
+import math
+import numpy as np
+from .dsp import _xcorr_plan
+
+''' Slice of the channels, reference segment, FFT length and lag -> FFT bin lookup for "window" mode '''
+@lru_cache(maxsize=32)
+def _window_plan(N, maxlag, segment):
+    if 2 * maxlag >= N:
+        raise ValueError(f'maxlag = {maxlag} leaves no samples to correlate in a {N} sample buffer')
+    segment = N - 2 * maxlag if segment is None else min(int(segment), N - 2 * maxlag)
+    start = (N - segment) // 2
+    M = 2**math.ceil(math.log(segment + 2 * maxlag, 2))
+    # Channel span starts maxlag before the reference segment, so lag k - maxlag sits at bin -(2*maxlag - k) mod M
+    lags = (np.arange(2 * maxlag) - 2 * maxlag) % M
+    lags.flags.writeable = False
+    return start, segment, M, lags
+
+''' Reference channel with its FFT kept, correlated against (channels x samples) blocks '''
+class Correlator(object):
+
+    def __init__(self, ref_data, maxlag=None, mode="full", segment=None, tie_tolerance=0.1):
+        # ref_data: reference channel (samples)
+        # maxlag: largest lag searched, defaults to half the buffer like compute_phase_offset_and_delay()
+        # mode: "full" (zero padded, whole buffer) or "window" (+-maxlag around a segment, see above)
+        # segment: reference samples correlated in "window" mode, defaults to all that fit
+        # tie_tolerance: peaks within this fraction of the highest correlation power count as ties
+        # and the one closest to zero lag wins ("window" mode)
+        if mode not in ("full", "window"):
+            raise ValueError(f'Not a valid correlation mode: {mode} ("full" or "window")')
+        ref_data = np.asarray(ref_data)
+        self.mode = mode
+        self.tie_tolerance = tie_tolerance
+        self.num_samples = ref_data.shape[-1]
+        self.maxlag = int(self.num_samples / 2) if maxlag is None else int(maxlag)
+        if mode == "full":
+            self.M, self.lags = _xcorr_plan(self.num_samples, self.maxlag)
+            self.span = slice(0, self.num_samples)
+        else:
+            start, segment, self.M, self.lags = _window_plan(self.num_samples, self.maxlag, segment)
+            ref_data = ref_data[start:start + segment]
+            self.span = slice(start - self.maxlag, start + segment + self.maxlag)
+            self.overlap = slice(self.maxlag, self.maxlag + segment)    # samples of the span at zero lag
+        self.ref_fft = np.fft.fft(ref_data, n=self.M)
+        self.ref_energy = float(np.vdot(ref_data, ref_data).real)
+
+    ''' Correlation at lags -maxlag..maxlag-1, R[maxlag] is zero lag ("full" matches xcorrelate()) '''
+    def correlate(self, Rx_data):
+        Rx_data = np.asarray(Rx_data)
+        if Rx_data.shape[-1] != self.num_samples:
+            raise ValueError(f'Channels have {Rx_data.shape[-1]} samples, the reference has {self.num_samples}')
+        spectrum = np.fft.fft(Rx_data[..., self.span], n=self.M, axis=-1)
+        np.conj(spectrum, out=spectrum)
+        spectrum *= self.ref_fft
+        cor = np.fft.ifft(spectrum, axis=-1)
+        return cor[..., self.lags]
+
+    ''' Per channel (phase offset [deg], trigger delay [samples], peak magnitude) against the reference '''
+    def sync(self, Rx_data, subsample=False):
+        # phase offset is a float, delay an int (a float with subsample=True), same signs as
+        # compute_phase_offset_and_delay()
+        # peak magnitude is the normalised correlation peak, 1.0 for a perfect (scaled, shifted) copy
+        Rx_data = np.asarray(Rx_data)
+        result_corr = self.correlate(Rx_data)
+        power = result_corr.real**2 + result_corr.imag**2
+        if self.mode == "window":
+            max_position, flat = self._nearest_peak(power)
+        else:
+            max_position, flat = np.argmax(power, axis=-1), False
+        peak = np.take_along_axis(result_corr, np.expand_dims(max_position, -1), axis=-1)[..., 0]
+        if subsample:
+            # a flat correlation has no peak to fit a parabola to, so those channels stay on the lag
+            offset, peak = _interpolate_peak(result_corr, max_position, peak, flat)
+            delay = self.maxlag - (max_position + offset)
+        else:
+            delay = self.maxlag - max_position
+        phase_diff = np.angle(peak, deg=True)
+        if self.mode == "window":
+            Rx_data = Rx_data[..., self.span][..., self.overlap]
+        energy = np.sum(Rx_data.real**2 + Rx_data.imag**2, axis=-1)
+        peak_mag = np.abs(peak) / np.sqrt(self.ref_energy * energy)
+        return phase_diff, delay, peak_mag
+
+    ''' Index of the correlation peak closest to zero lag, among those within tie_tolerance of the highest,
+        and whether the correlation was flat (no peak, the lag nearest zero was taken) '''
+    def _nearest_peak(self, power):
+        num_lags = power.shape[-1]
+        rows = power.reshape(-1, num_lags)
+        lags = np.arange(num_lags)
+        ties = rows >= (1 - self.tie_tolerance) * np.max(rows, axis=-1, keepdims=True)
+        # index maxlag is zero lag
+        nearest = np.argmin(np.where(ties, np.abs(lags - self.maxlag), num_lags), axis=-1)[:, np.newaxis]
+        # the run of ties around it is one peak, bounded by the closest non-tie on each side
+        start = np.max(np.where(~ties & (lags < nearest), lags, -1), axis=-1, keepdims=True) + 1
+        stop = np.min(np.where(~ties & (lags > nearest), lags, num_lags), axis=-1, keepdims=True)
+        positions = np.argmax(np.where((lags >= start) & (lags < stop), rows, -np.inf), axis=-1)
+        # unless the run covers most of the lags: a tone has no peak at all, its correlation is flat
+        # up to noise and the lag nearest zero is kept
+        flat = (stop - start)[:, 0] > num_lags // 2
+        positions = np.where(flat, nearest[:, 0], positions)
+        return positions.reshape(power.shape[:-1]), flat.reshape(power.shape[:-1])
+
+''' Parabolic interpolation of a correlation peak: (offset from max_position in samples, complex peak) '''
+def _interpolate_peak(result_corr, max_position, peak, flat=False):
+    # flat: channels whose correlation has no peak, kept on their lag
+    last = result_corr.shape[-1] - 1
+    left = np.take_along_axis(result_corr, np.expand_dims(np.maximum(max_position - 1, 0), -1), axis=-1)[..., 0]
+    right = np.take_along_axis(result_corr, np.expand_dims(np.minimum(max_position + 1, last), -1), axis=-1)[..., 0]
+    mag_left, mag_peak, mag_right = np.abs(left), np.abs(peak), np.abs(right)
+    curvature = mag_left - 2 * mag_peak + mag_right
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offset = np.where(curvature < 0, 0.5 * (mag_left - mag_right) / curvature, 0.0)
+    # a peak on the edge of the lag range has no neighbour on one side, so keep it on the lag
+    offset = np.where((max_position == 0) | (max_position == last) | flat, 0.0, np.clip(offset, -0.5, 0.5))
+    # same parabola through the complex values gives the correlation (and its phase) at the offset
+    peak = peak + offset * (right - left) / 2 + offset**2 * (right - 2 * peak + left) / 2
+    return offset, peak
+
+''' Batched compute_phase_offset_and_delay(): (phase offsets, delays, peak magnitudes) of every channel '''
+def correlate_channels(ref_data, Rx_data, maxlag=None, mode="full", segment=None, subsample=False, tie_tolerance=0.1):
+    return Correlator(ref_data, maxlag, mode, segment, tie_tolerance).sync(Rx_data, subsample)
@@ -0,0 +1,87 @@
+'''
+Spatial covariance of the channel matrix, R = X X^H / snapshots.
+
+Every subspace (MUSIC) or adaptive (MVDR) estimator starts from R of the aligned channels. The
+phase calibration is applied to the channels first, the same per channel phase_cal that
+BeamScanner.scan() takes, so R describes the array as if every channel were phase matched.
+
+StreamingCovariance keeps R across buffers instead of recomputing it from each buffer alone:
+every update is a rank-k update from the k snapshots of the new buffer, blended in with a
+forgetting factor, so the cost per buffer is constant and the estimate follows a slowly changing
+scene. With band=(signal_start, signal_end) the snapshots are the windowed FFT bins around fc0
+instead of the raw samples, which keeps the out of band noise out of R and cuts the snapshots
+from NumSamples to the width of the band.
+'''
+
+import numpy as np
+from .spectrum import windowed_fft
+
+''' Covariance (channels x channels) of one (channels x samples) block '''
+def sample_covariance(channels, phase_cal=None, forward_backward=False):
+    # forward_backward: average R with its flipped conjugate. Only valid for a uniform linear array;
+    # it decorrelates two coherent emitters (e.g. a tone and its multipath reflection) for MUSIC
+    channels = np.asarray(channels)
+    if phase_cal is not None:
+        channels = channels * np.exp(1j * np.deg2rad(np.asarray(phase_cal, dtype=float)))[:, np.newaxis]
+    R = channels @ np.conj(channels.T) / channels.shape[-1]
+    if forward_backward:
+        R = (R + np.conj(R[::-1, ::-1])) / 2
+    return R
+
+''' Covariance kept across buffers with exponential forgetting '''
+class StreamingCovariance(object):
+
+    def __init__(self, num_channels, forgetting=0.9, band=None, decimation=1):
+        # forgetting: weight of the previous estimate per update (0 = latest buffer only)
+        # band: optional (signal_start, signal_end) bins of the fftshifted spectrum, like BeamScanner
+        # decimation: use every decimation-th sample as a snapshot (time snapshots only)
+        if not 0 <= forgetting < 1:
+            raise ValueError(f'forgetting = {forgetting} must be in [0, 1)')
+        self.num_channels = int(num_channels)
+        self.forgetting = float(forgetting)
+        self.band = band
+        self.decimation = int(decimation)
+        self.R = np.zeros((self.num_channels, self.num_channels), dtype=complex)
+        self.updates = 0
+
+    ''' Snapshots (channels x k) of one buffer: samples, or FFT bins of the band '''
+    def snapshots(self, channels):
+        channels = np.asarray(channels)
+        if self.band is None:
+            return channels[:, ::self.decimation]
+        num_samples = channels.shape[-1]
+        signal_start, signal_end = self.band
+        # fftshift is a roll by N/2, so the shifted band maps straight back to unshifted bins
+        bins = (np.arange(signal_start, signal_end) - num_samples // 2) % num_samples
+        return windowed_fft(channels)[:, bins]
+
+    ''' Add one (channels x samples) buffer '''
+    def update(self, channels, phase_cal=None):
+        snapshots = self.snapshots(channels)
+        if phase_cal is not None:
+            snapshots = snapshots * np.exp(1j * np.deg2rad(np.asarray(phase_cal, dtype=float)))[:, np.newaxis]
+        self.rank_update(snapshots)
+
+    ''' Rank-k update from k snapshots (channels x k) '''
+    def rank_update(self, snapshots):
+        R_new = snapshots @ np.conj(snapshots.T)
+        R_new /= snapshots.shape[-1]
+        if self.updates == 0:
+            self.R[:] = R_new
+        else:
+            self.R *= self.forgetting
+            R_new *= 1 - self.forgetting
+            self.R += R_new
+        self.updates += 1
+
+    ''' Copy of the current estimate '''
+    def snapshot(self):
+        return self.R.copy()
+
+    ''' Current estimate and settings as a dict of arrays, e.g. for np.savez(path, **export()) '''
+    def export(self):
+        return {'R': self.R.copy(), 'forgetting': self.forgetting, 'updates': self.updates}
+
+    def reset(self):
+        self.R[:] = 0
+        self.updates = 0
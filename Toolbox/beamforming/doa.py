@@ -0,0 +1,67 @@
+'''
+Direction of arrival without a phase sweep.
+
+For the narrowband tone at fc0 the phase step between neighbouring elements can be read straight
+off the cross-spectra of the channels against the first one, instead of trying 180 phase steps
+and keeping the loudest. phase_progression() takes the channel spectra at the
+signal_start:signal_end bins (BeamScanner.spectra()), sums each channel's cross-spectrum over the
+bins (which weights every bin by its power), and fits the phase step by least squares over all
+channels. That is O(channels x bins) per buffer after the per channel FFT.
+
+With an element spacing d over half a wavelength the phase step wraps before the steering angle
+reaches +-90 deg, so several angles give the same phase step. doa_candidates() lists them all and
+interferometric_doa() keeps the one closest to a prior, e.g. the last tracked angle.
+'''
+
+import numpy as np
+from .dsp import calcTheta
+
+''' Phase step between neighbouring elements [deg] by least squares over all channels: (phase step, coherence) '''
+def phase_progression(spectra, element_index, phase_cal=None):
+    # spectra: (channels x bins), e.g. BeamScanner.spectra(channels), row 0 is the reference
+    # element_index: position of each channel in units of d
+    # phase_cal: optional per channel phase calibration [deg], same as BeamScanner.scan()
+    # Signs follow BeamScanner: the returned phase step is the delay_phases entry the scan peaks at
+    # coherence is 1.0 when every channel fits the linear phase progression exactly
+    spectra = np.asarray(spectra)
+    element_index = np.asarray(element_index, dtype=float)
+    cross = spectra @ np.conj(spectra[0])
+    if phase_cal is not None:
+        cross = cross * np.exp(1j * np.deg2rad(np.asarray(phase_cal, dtype=float)))
+    # Unambiguous first guess from pairs of neighbouring elements (closest pairs if none are adjacent)
+    order = np.argsort(element_index)
+    gaps = np.diff(element_index[order])
+    closest = gaps == np.min(gaps)
+    pairs = np.sum(cross[order][1:][closest] * np.conj(cross[order][:-1][closest]))
+    phase_step = -np.angle(pairs) / np.min(gaps)
+    # Weighted least squares of the residual phase against element position refines the slope
+    weight = np.abs(cross)
+    residual = np.angle(cross * np.exp(1j * phase_step * element_index))
+    mean_index = np.average(element_index, weights=weight)
+    mean_residual = np.average(residual, weights=weight)
+    spread = np.sum(weight * (element_index - mean_index)**2)
+    if spread > 0:
+        phase_step -= np.sum(weight * (element_index - mean_index) * (residual - mean_residual)) / spread
+    coherence = np.abs(np.sum(cross * np.exp(1j * phase_step * element_index))) / np.sum(weight)
+    phase_step = (np.rad2deg(phase_step) + 180) % 360 - 180
+    return phase_step, coherence
+
+''' Every steering angle [deg] that gives a phase step [deg], more than one for d over half a wavelength '''
+def doa_candidates(phase, rx_lo, d):
+    wavelength = 3e8 / rx_lo
+    max_phase = 360 * d / wavelength      # phase step at endfire
+    wraps = np.arange(-np.ceil(max_phase / 360), np.ceil(max_phase / 360) + 1)
+    sin_theta = (phase + 360 * wraps) / max_phase
+    sin_theta = sin_theta[np.abs(sin_theta) <= 1]
+    return np.rad2deg(np.arcsin(sin_theta))
+
+''' Closed form DOA: (steering angle [deg], phase step [deg], coherence) '''
+def interferometric_doa(spectra, element_index, rx_lo, d, phase_cal=None, prior=0.0):
+    # prior: angle [deg] used to pick between candidates when d is over half a wavelength
+    phase, coherence = phase_progression(spectra, element_index, phase_cal)
+    candidates = doa_candidates(phase, rx_lo, d)
+    if len(candidates) == 0:
+        # noise pushed the phase step past endfire, calcTheta() clips it to +-90 deg
+        return calcTheta(phase, rx_lo, d), phase, coherence
+    steer_angle = candidates[np.argmin(np.abs(candidates - prior))]
+    return steer_angle, phase, coherence
@@ -0,0 +1,157 @@
+'''
+Shared DSP core for the Pluto scripts.
+
+These started life as copies of Jon Kraft's dbfs()/calcTheta() and Piotr Krysik's xcorrelate() in
+every script under Toolbox/. The signatures are kept so a script only needs to swap its local
+copy for an import, with two changes:
+  - calcTheta() takes rx_lo and d as arguments instead of reading the script's globals
+  - every function works on a single channel or on a batched (channels x samples) block,
+    along the last axis, and keeps complex64 input in complex64
+
+Windows (see spectrum.py) and the correlation lag tables only depend on the buffer length, so
+they are built once per length and reused for every buffer. numpy's pocketfft keeps its own twiddle
+factor cache per FFT length, so the FFT "plans" are reused as long as the lengths stay fixed.
+'''
+
+from functools import lru_cache
+import math
+import numpy as np
+from .spectrum import window, dbfs     # dbfs() is kept importable from here for the scripts
+
+''' Hamming window for a given length, built once and reused '''
+def hamming(num_samples):
+    return window(num_samples, 'hamming')
+
+''' Calculate Steering Angle using Phase Difference - Kraft '''
+def calcTheta(phase, rx_lo, d):
+    # calculates the steering angle for a given phase delta (phase is in deg)
+    # steering angle is theta = arcsin(c * deltaphase / (2 * pi * f * d)
+    arcsin_arg = np.deg2rad(phase) * 3e8 / (2 * np.pi * rx_lo * d)
+    arcsin_arg = np.clip(arcsin_arg, -1, 1)     # arcsin argument must be between 1 and -1, or numpy will throw a warning
+    calc_theta = np.rad2deg(np.arcsin(arcsin_arg))
+    return calc_theta
+
+''' Function To Trim ndarray data '''
+def trimDelay(input, delayDelta):
+    # shift left by delayDelta samples and zero fill the end (same as np.pad then slice)
+    input = np.asarray(input)
+    delayDelta = int(delayDelta)
+    output = np.zeros_like(input)
+    if delayDelta < input.shape[-1]:
+        output[..., :input.shape[-1] - delayDelta] = input[..., delayDelta:]
+    return output
+
+''' Function for padding ndarray data '''
+def padDelay(input, delayDelta):
+    # shift right by delayDelta samples and zero fill the start, keeping the original length
+    input = np.asarray(input)
+    delayDelta = int(delayDelta)
+    output = np.zeros_like(input)
+    if delayDelta < input.shape[-1]:
+        output[..., delayDelta:] = input[..., :input.shape[-1] - delayDelta]
+    return output
+
+''' Function for correcting trigger delays '''
+def correct_trigger_delay(Rx_data, delay):
+    if delay < 0:
+        return padDelay(Rx_data, int(-delay))
+    elif delay > 0:
+        return trimDelay(Rx_data, int(delay))
+    else:
+        return Rx_data
+
+''' Integer delay alignment as views into the channels over their shared overlap window: (views, lo, hi) '''
+def aligned_views(Rx_data, delay):
+    # Rx_data: (channels x samples) block or a list of channels; no samples are copied, so
+    # trimDelay()/padDelay() zero fill becomes "outside [lo, hi)" for the caller
+    # delay: one value per channel [samples], same sign as correct_trigger_delay(), rounded to whole samples
+    # Output sample n of channel k is input sample n + delay[k], which exists for n in [lo, hi) on every channel
+    delay = np.round(np.asarray(delay, dtype=float)).astype(int)
+    num_samples = np.shape(Rx_data[0])[-1]
+    lo = max(0, -int(np.min(delay)))
+    hi = max(lo, num_samples - max(0, int(np.max(delay))))
+    starts = lo + delay
+    return [Rx_data[k][..., start:start + hi - lo] for k, start in enumerate(starts)], lo, hi
+
+''' FFT frequencies in cycles per sample for a given length, built once and reused '''
+@lru_cache(maxsize=32)
+def _fft_freq(num_samples):
+    freq = np.fft.fftfreq(num_samples)
+    freq.flags.writeable = False
+    return freq
+
+''' Correct the trigger delays of a whole (channels x samples) block, fractional delays included '''
+def align_channels(Rx_data, delay):
+    # delay: one value per channel [samples], same sign as correct_trigger_delay()
+    # The whole samples are shifted with zero fill like correct_trigger_delay(), the remaining
+    # fraction is a linear phase across the FFT bins, all channels in one batched FFT
+    Rx_data = np.asarray(Rx_data)
+    delay = np.broadcast_to(np.asarray(delay, dtype=float), Rx_data.shape[:-1])
+    whole = np.round(delay).astype(int)
+    fraction = delay - whole
+    aligned = np.empty(Rx_data.shape, dtype=np.result_type(Rx_data.dtype, np.complex64))
+    for index in np.ndindex(delay.shape):
+        aligned[index] = correct_trigger_delay(Rx_data[index], whole[index])
+    if np.any(fraction != 0):
+        ramp = np.exp(2j * np.pi * np.multiply.outer(fraction, _fft_freq(Rx_data.shape[-1])))
+        s_fft = np.fft.fft(aligned, axis=-1)
+        s_fft *= ramp
+        aligned = np.fft.ifft(s_fft, axis=-1).astype(aligned.dtype, copy=False)
+    return aligned
+
+''' FFT length and lag -> FFT bin lookup for xcorrelate(), per (length, maxlag) '''
+@lru_cache(maxsize=32)
+def _xcorr_plan(N, maxlag):
+    M = 2**math.ceil(math.log(N + maxlag, 2))
+    # Pre-padding X by maxlag zeros is a circular shift of the correlation by maxlag,
+    # so R[k] = cor[(k - maxlag) mod M] for the unpadded FFTs
+    lags = (np.arange(2 * maxlag) - maxlag) % M
+    lags.flags.writeable = False
+    return M, lags
+
+''' Function for cross-correlation - Krysik '''
+def xcorrelate(X, Y, maxlag):
+    # X: reference (samples), Y: one channel (samples) or a block (channels x samples)
+    # Returns R with 2*maxlag lags per channel, R[maxlag] is zero lag
+    X = np.asarray(X)
+    Y = np.asarray(Y)
+    maxlag = int(maxlag)
+    M, lags = _xcorr_plan(max(X.shape[-1], Y.shape[-1]), maxlag)
+    pre = np.fft.fft(X, n=M, axis=-1)
+    post = np.fft.fft(Y, n=M, axis=-1)
+    cor = np.fft.ifft(pre * np.conj(post), axis=-1)
+    R = cor[..., lags]
+    return R
+
+''' Function for computing and finding delays - Krysik '''
+def compute_phase_offset_and_delay(ref_data, Rx_data):
+    # Rx_data may be one channel or a (channels x samples) block, then both results are int arrays
+    result_corr = xcorrelate(ref_data, Rx_data, int(np.shape(ref_data)[-1] / 2))
+    max_position = np.argmax(np.abs(result_corr), axis=-1)
+    delay = result_corr.shape[-1] / 2 - max_position
+
+    # The old code divided the peak by the RMS of Rx_data first, a positive scale that doesn't change the angle
+    peak = np.take_along_axis(result_corr, np.expand_dims(max_position, -1), axis=-1)[..., 0]
+    phase_diff = np.angle(peak) / np.pi * 180
+
+    if np.ndim(phase_diff) == 0:
+        return int(phase_diff), int(delay)
+    return np.trunc(phase_diff).astype(int), delay.astype(int)
+
+''' Function for computing and finding phase offsets '''
+def find_phase_offset(ref_data, Rx_data):
+    phase_diff, delay = compute_phase_offset_and_delay(ref_data, Rx_data)
+    return phase_diff
+
+''' Function for computing and finding trigger delays '''
+def find_trigger_delay(ref_data, Rx_data):
+    phase_diff, delay = compute_phase_offset_and_delay(ref_data, Rx_data)
+    return delay
+
+''' Generate BPSK (Binary Phase Shift Keying) - Emerson '''
+def generate_bpsk(data, samp_rate, bit_len):
+    data = np.asarray(data)
+    samples_per_bit = math.floor(samp_rate * bit_len)
+    # every symbol repeated samples_per_bit times, as a complex baseband signal
+    iq = np.repeat(data, int(samples_per_bit)).astype(np.result_type(data.dtype, np.complex64))
+    return iq
@@ -0,0 +1,261 @@
+'''
+Acquisition, DSP and rendering on separate threads.
+
+The beam steering GUIs used to run everything from a QTimer(0) on the Qt thread: sdr.rx(), the
+DSP, the plot updates and then sleep(speed / 1000), so the window froze for every receive and every
+sleep. A Pipeline moves the first two stages to worker threads (libiio and numpy release the GIL
+while they wait or crunch, so threads are enough; no processes or pickling needed):
+
+    acquisition thread   calls acquire() (e.g. sdr.rx) in a loop
+    DSP thread           every `period` seconds calls process(frame) on the newest frame
+    GUI thread           calls latest() from a display-rate QTimer and draws what it gets
+
+The stages are connected by bounded queues that drop their oldest entry when full, so a slow stage
+never backs up the one before it, it just sees fewer (and always the newest) items. Every drop is
+counted: dropped_frames are buffers the DSP never got to, dropped_results are results the GUI never
+drew. `period` can be changed while running (the speed dial of the GUIs) and the DSP waits on an
+Event instead of sleep(), so close() and pause() take effect at once.
+
+pause() only stops the DSP stage. To swap the device acquire() reads from (a Pluto restart),
+pause_acquire() also stops the acquisition thread, waiting for an rx() in flight to return, and
+drops every queued frame of the old device; resume_acquire() starts it again.
+
+One-off work that needs fresh frames, like a phase calibration averaged over a few buffers, goes
+to submit(): the job runs on the DSP thread (also while paused) and its done() callback is called
+from poll_jobs() on the GUI thread, so the GUI never blocks on the Pluto.
+
+Exceptions from acquire(), process() or a job don't stop their thread. The last few are kept in
+`errors` and all of them are counted in `error_count`.
+'''
+
+import collections
+import queue
+import threading
+import time
+
+''' Put an item on a bounded queue, dropping the oldest items to make room: number dropped '''
+def put_latest(items, item):
+    dropped = 0
+    while True:
+        try:
+            items.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                items.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                pass
+
+''' Threaded acquire -> process -> latest() pipeline with bounded, drop-oldest queues '''
+class Pipeline(object):
+
+    def __init__(self, acquire, process, period=0.0, maxsize=2, reuse_frames=True, max_errors=100):
+        # acquire(): returns one frame, e.g. sdr.rx or ConcurrentReceiver.rx
+        # process(frame): DSP on the newest frame, returns a result for the GUI (None for nothing to draw)
+        # period: seconds between process() calls, i.e. the sweep rate, can be changed while running
+        # maxsize: depth of the frame and result queues
+        # reuse_frames: call process() again on the last frame when no new one has arrived (a phase
+        # sweep over one buffer), otherwise wait for a new frame every time
+        # max_errors: number of exceptions kept in `errors`, the older ones are only counted
+        self.acquire = acquire
+        self.process = process
+        self.period = period
+        self.reuse_frames = reuse_frames
+        self._frames = queue.Queue(maxsize)
+        self._results = queue.Queue(maxsize)
+        self._jobs = queue.Queue()
+        self._done = queue.Queue()
+        self._frame = None
+        self._stop = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+        self._acquiring = threading.Event()
+        self._acquiring.set()
+        self._acquire_lock = threading.Lock()     # held while acquire() runs and its frame is queued
+        self.acquired = 0           # frames returned by acquire()
+        self.processed = 0          # process() calls
+        self.rendered = 0           # results handed to the GUI by latest()
+        self.dropped_frames = 0     # frames replaced by a newer one before process() saw them
+        self.dropped_results = 0    # results replaced by a newer one before latest() saw them
+        self.errors = collections.deque(maxlen=max_errors)   # latest exceptions, the stage keeps running
+        self.error_count = 0        # exceptions raised by acquire(), process() or a job
+        self._threads = [threading.Thread(target=self._acquire_loop, daemon=True),
+                         threading.Thread(target=self._process_loop, daemon=True)]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def _error(self, error):
+        self.errors.append(error)
+        self.error_count += 1
+
+    def _acquire_loop(self):
+        while not self._stop.is_set():
+            if not self._acquiring.is_set():
+                self._acquiring.wait(0.1)
+                continue
+            with self._acquire_lock:
+                # pause_acquire() may have come in while waiting for the lock
+                if not self._acquiring.is_set():
+                    continue
+                try:
+                    frame = self.acquire()
+                except Exception as error:
+                    self._error(error)
+                    frame = None
+                if frame is not None:
+                    self.acquired += 1
+                    self.dropped_frames += put_latest(self._frames, frame)
+            if frame is None:
+                self._stop.wait(0.1)
+
+    ''' Newest frame from the acquisition thread, the last one again if none arrived (reuse_frames) '''
+    def _next_frame(self):
+        # drain to the newest frame, every older one still queued is a dropped frame
+        newest = None
+        while True:
+            try:
+                frame = self._frames.get_nowait()
+            except queue.Empty:
+                break
+            if newest is not None:
+                self.dropped_frames += 1
+            newest = frame
+        if newest is None and not (self.reuse_frames and self._frame is not None):
+            try:
+                newest = self._frames.get(timeout=0.1)
+            except queue.Empty:
+                return None
+        if newest is not None:
+            self._frame = newest
+        return self._frame
+
+    def _process_loop(self):
+        next_time = time.perf_counter()
+        while not self._stop.is_set():
+            self._run_jobs()
+            if not self._running.is_set():
+                self._running.wait(0.1)
+                next_time = time.perf_counter()
+                continue
+            # wait out the rest of the period without sleeping through close() or pause()
+            delay = next_time - time.perf_counter()
+            if delay > 0 and self._stop.wait(delay):
+                break
+            next_time = max(next_time + self.period, time.perf_counter())
+            frame = self._next_frame()
+            if frame is None:
+                continue
+            try:
+                result = self.process(frame)
+            except Exception as error:
+                self._error(error)
+                continue
+            self.processed += 1
+            if result is not None:
+                self.dropped_results += put_latest(self._results, result)
+
+    ''' Run the submitted jobs (DSP thread) '''
+    def _run_jobs(self):
+        while True:
+            try:
+                job, done = self._jobs.get_nowait()
+            except queue.Empty:
+                return
+            result, error = None, None
+            try:
+                result = job(self.next_frame)
+            except Exception as exc:
+                self._error(exc)
+                error = exc
+            self._done.put((done, result, error))
+
+    ''' Run job(next_frame) once on the DSP thread, also while paused; done(result, error) is called by poll_jobs() '''
+    def submit(self, job, done=None):
+        # job: gets next_frame() to read fresh frames with, e.g. an averaged calibration
+        # done: called on the thread that calls poll_jobs(), so it may update widgets
+        self._jobs.put((job, done))
+
+    ''' Call done() for every finished job: number of jobs finished (never blocks) '''
+    def poll_jobs(self):
+        finished = 0
+        while True:
+            try:
+                done, result, error = self._done.get_nowait()
+            except queue.Empty:
+                return finished
+            finished += 1
+            if done is not None:
+                done(result, error)
+
+    ''' Newest result for the GUI, or None if nothing new since the last call (never blocks) '''
+    def latest(self):
+        result = None
+        while True:
+            try:
+                newer = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if result is not None:
+                self.dropped_results += 1
+            result = newer
+        if result is not None:
+            self.rendered += 1
+        return result
+
+    ''' Fresh frame for one-off work like a calibration while paused (blocks, use it from a submit() job) '''
+    def next_frame(self, timeout=5.0):
+        frame = self._frames.get(timeout=timeout)
+        self._frame = frame
+        return frame
+
+    ''' Stop calling process(), acquisition keeps running so next_frame() still works '''
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    ''' Stop calling acquire() and drop the queued frames, e.g. before swapping the device '''
+    def pause_acquire(self):
+        self._acquiring.clear()
+        # an acquire() in flight finishes (and queues its frame) before this returns
+        with self._acquire_lock:
+            pass
+        self.drain()
+
+    def resume_acquire(self):
+        self._acquiring.set()
+
+    ''' Drop every queued frame and the frame kept for reuse: number of frames dropped '''
+    def drain(self):
+        dropped = 0
+        while True:
+            try:
+                self._frames.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                break
+        self._frame = None
+        self.dropped_frames += dropped
+        return dropped
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    ''' Counters as one line, e.g. for a print at exit or a status label '''
+    def report(self):
+        return (f'{self.acquired} frames acquired ({self.dropped_frames} dropped), {self.processed} processed, '
+                f'{self.rendered} rendered ({self.dropped_results} results dropped), {self.error_count} errors')
+
+    def close(self, timeout=2.0):
+        self._stop.set()
+        self._running.set()
+        self._acquiring.set()
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join(timeout)
@@ -0,0 +1,105 @@
+'''
+Persistent pyqtgraph items, updated in place once per displayed frame.
+
+The GUIs used to removeItem() the steering arrows, build a new pg.ArrowItem(), style it and
+addItem() it again on every tick, do the same with the peak line, and setData() every curve as
+soon as a value was ready, sometimes many times per frame. Each of those invalidates the scene,
+so drawing ended up costing as much as the DSP. A Renderer instead creates every item once and
+queues the updates: set_data(), set_angle(), set_pos(), set_text() only record the newest value,
+and flush() applies them together (skipping values that did not change) at most once per monitor
+refresh. Long traces (the time-domain curves) get clipToView and peak downsampling, so pyqtgraph
+only draws the visible samples at screen resolution.
+
+This module needs pyqtgraph and a running QApplication, so unlike the DSP modules it is not
+imported by `beamforming` itself: use `from beamforming.render import Renderer`.
+'''
+
+import time
+import pyqtgraph as pg
+
+DEFAULT_FPS = 60        # used when Qt can't tell the monitor refresh rate
+
+''' Refresh rate of the primary monitor [Hz] '''
+def refresh_rate():
+    app = pg.QtGui.QGuiApplication.instance()
+    screen = app.primaryScreen() if app is not None else None
+    rate = screen.refreshRate() if screen is not None else 0
+    return rate if rate > 0 else DEFAULT_FPS
+
+''' Persistent plot items with queued updates, flushed at most once per monitor refresh '''
+class Renderer(object):
+
+    def __init__(self, max_fps=None):
+        # max_fps: cap on flushes per second, the monitor refresh rate if None
+        self.max_fps = refresh_rate() if max_fps is None else max_fps
+        self._pending = {}          # (item, method) -> arguments, newest wins
+        self._applied = {}          # (item, method) -> arguments of scalar updates already on screen
+        self._last_flush = 0.0
+        self.frames = 0             # flushes that drew something
+        self.skipped = 0            # flushes held back by max_fps
+
+    ''' Timer interval [ms] that matches max_fps, for the QTimer driving the GUI '''
+    @property
+    def interval(self):
+        return int(1000 / self.max_fps)
+
+    ''' New curve on a plot; long=True clips it to the view and peak-downsamples it to screen resolution '''
+    def curve(self, plot, long=False, **kwargs):
+        curve = plot.plot(**kwargs)
+        if long:
+            curve.setClipToView(True)
+            curve.setDownsampling(auto=True, method='peak')
+        return curve
+
+    ''' New arrow added to a plot once, turned later with set_angle() '''
+    def arrow(self, plot, **style):
+        arrow = pg.ArrowItem(**style)
+        plot.addItem(arrow)
+        return arrow
+
+    def _queue(self, item, method, *args):
+        self._pending[(item, method)] = args
+
+    def set_data(self, curve, x, y):
+        self._queue(curve, 'setData', x, y)
+
+    def set_angle(self, arrow, angle):
+        self._queue(arrow, 'setStyle', ('angle', angle))
+
+    def set_pos(self, item, pos):
+        self._queue(item, 'setPos', pos)
+
+    def set_text(self, item, text):
+        self._queue(item, 'setText', text)
+
+    def set_visible(self, item, visible):
+        self._queue(item, 'setVisible', bool(visible))
+
+    def display(self, lcd, value):
+        self._queue(lcd, 'display', value)
+
+    ''' Apply the queued updates if a frame is due: True if anything was drawn '''
+    def flush(self, force=False):
+        now = time.perf_counter()
+        # 10% slack for timer jitter, so a QTimer at `interval` is never held back by the cap
+        if not force and now - self._last_flush < 0.9 / self.max_fps:
+            self.skipped += 1
+            return False
+        if not self._pending:
+            return False
+        self._last_flush = now
+        for (item, method), args in self._pending.items():
+            if method == 'setData':
+                item.setData(*args)
+                continue
+            # scalar updates that would not change anything are not sent to Qt at all
+            if self._applied.get((item, method)) == args:
+                continue
+            self._applied[(item, method)] = args
+            if method == 'setStyle':
+                item.setStyle(**dict(args))
+            else:
+                getattr(item, method)(*args)
+        self._pending.clear()
+        self.frames += 1
+        return True
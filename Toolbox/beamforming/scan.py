@@ -0,0 +1,177 @@
+'''
+Batched delay-and-sum beam scan for the multi-Pluto linear arrays.
+
+The PlotPeaks scripts used to loop over every entry of `delay_phases`, phase shift each channel
+with its own np.exp() array, sum the channels and run a full dbfs() FFT per step. Phase steering is
+just a (phases x channels) weight matrix, so the whole sweep is one matrix product followed by one
+batched FFT. The steering matrix only depends on the phase grid and the element layout, so it is
+built once and reused for every buffer.
+
+Since the FFT and the Hamming window are both linear, the spectrum of a steered sum is the same
+weighted sum of the per-channel spectra. In "freq" mode (the default) each channel is windowed and
+FFT'd once per buffer and the steering is applied to the signal_start:signal_end bins only, so a
+frame costs one FFT per channel no matter how fine the phase grid is. "time" mode keeps the
+sum-then-FFT order of the original loop.
+
+fine_peak() gets sub-degree resolution without a finer grid: it takes the peak of the (coarse)
+delay_phases sweep and narrows it down with a golden-section search over +-one grid step, which
+evaluates the steered sum at a single phase per iteration. The number of evaluations is fixed by
+the grid step and the tolerance, e.g. 11 for a 2 deg grid and 0.1 deg, the last one at the
+returned angle so the returned level belongs to it.
+
+BeamScanner keeps its own per-frame work arrays (windowed channels, FFTs, steered spectra and
+their magnitudes) in a BufferPool and fills them with out= arguments, so only the first frame
+allocates them. Pass a shared pool to watch its allocation counters from the script.
+'''
+
+import math
+import numpy as np
+from . import spectrum
+from .buffers import BufferPool
+from .dsp import hamming
+
+GOLDEN = (math.sqrt(5) - 1) / 2     # golden-section ratio, 0.618
+
+# Upper bound on the (phases x samples) scratch block built per batch of phases, in bytes.
+# 180 phases x 4096 samples x complex128 is ~12 MB, so the default scan runs as a single batch.
+MAX_BATCH_BYTES = 64 * 2**20
+
+''' Build the (phases x channels) steering matrix for a linear array '''
+def steering_matrix(delay_phases, element_index):
+    # delay_phases: phase step between neighbouring elements [deg] (e.g. np.arange(-180, 180, 2))
+    # element_index: position of each channel in units of d (Rx_0a = 0, Rx_1a = 1, Rx_0b = 2, ...)
+    phases = np.outer(np.asarray(delay_phases, dtype=float), np.asarray(element_index, dtype=float))
+    return np.exp(1j * np.deg2rad(phases))
+
+''' Precomputed steering matrix + window, evaluated against a whole (channels x samples) block '''
+class BeamScanner(object):
+
+    def __init__(self, delay_phases, element_index, num_samples, signal_start, signal_end, mode="freq", pool=None):
+        # pool: BufferPool for the per-frame work arrays, a private one if None
+        if mode not in ("freq", "time"):
+            raise ValueError(f'Not a valid scan mode: {mode} ("freq" or "time")')
+        self.mode = mode
+        self.delay_phases = np.asarray(delay_phases)
+        self.element_index = np.asarray(element_index)
+        self.num_samples = int(num_samples)
+        self.signal_start = int(signal_start)
+        self.signal_end = int(signal_end)
+        self.steering = steering_matrix(self.delay_phases, self.element_index)
+        self.win, self.win_sum = hamming(self.num_samples)
+        # fftshift is a roll by N/2, so the shifted bin window maps straight back to unshifted bins
+        shift = self.num_samples // 2
+        self.bins = (np.arange(self.signal_start, self.signal_end) - shift) % self.num_samples
+        self.pool = BufferPool() if pool is None else pool
+
+    ''' Steering weights (phases x channels) with the per-channel phase calibration folded in '''
+    def weights(self, phase_cal=None):
+        # phase_cal: optional per-channel phase calibration [deg], added to every steering phase
+        # with phase_cal the result is a pool buffer, overwritten by the next call
+        if phase_cal is None:
+            return self.steering
+        weights = self.pool.get('weights', self.steering.shape)
+        return np.multiply(self.steering, np.exp(1j * np.deg2rad(np.asarray(phase_cal, dtype=float))), out=weights)
+
+    ''' Windowed spectrum of every channel at the signal_start:signal_end bins, scaled like dbfs() '''
+    def spectra(self, channels):
+        # channels: (channels x samples) array, row order must match element_index
+        # the result is a pool buffer, overwritten by the next call
+        channels = np.asarray(channels)
+        shape = (channels.shape[0], self.num_samples)
+        windowed = np.multiply(channels, self.win, out=self.pool.get('windowed', shape))
+        s_fft = spectrum.fft(windowed, out=self.pool.get('channel_fft', shape))
+        # mode='clip' lets np.take write straight into out (the default 'raise' goes through a full size
+        # temporary); the bins are always in range
+        spectra = np.take(s_fft, self.bins, axis=-1, mode='clip', out=self.pool.get('spectra', (shape[0], len(self.bins))))
+        spectra /= self.win_sum
+        return spectra
+
+    ''' Complex spectra (phases x bins) of the steered sum for every entry of delay_phases '''
+    def steered_spectra(self, channels, phase_cal=None):
+        return self.weights(phase_cal) @ self.spectra(channels)
+
+    ''' Return the peak_sum curve [dBfs] for every entry of delay_phases '''
+    def scan(self, channels, phase_cal=None):
+        if self.mode == "freq":
+            peak_mag = self._scan_freq(self.spectra(channels), self.weights(phase_cal))
+        else:
+            peak_mag = self._scan_time(np.asarray(channels), self.weights(phase_cal))
+        # 20*log10 is monotonic, so take the max in linear magnitude and only convert the peaks
+        return 20 * np.log10(peak_mag / (2**11))   # Pluto is a signed 12 bit ADC, so use 2^11 to convert to dBFS
+
+    ''' Steer the channel spectra in batches of phases: peak magnitude per phase '''
+    def _scan_freq(self, spectra, steering):
+        num_phases = steering.shape[0]
+        batch = max(1, MAX_BATCH_BYTES // (16 * spectra.shape[-1]))
+        peak_mag = np.empty(num_phases)
+        steered = self.pool.get('steered', (min(batch, num_phases), spectra.shape[-1]))
+        magnitude = self.pool.get('magnitude', steered.shape, float)
+        for start in range(0, num_phases, batch):
+            stop = min(start + batch, num_phases)
+            np.matmul(steering[start:stop], spectra, out=steered[:stop - start])
+            np.abs(steered[:stop - start], out=magnitude[:stop - start])
+            np.max(magnitude[:stop - start], axis=-1, out=peak_mag[start:stop])
+        return peak_mag
+
+    ''' Sum-then-FFT scan in batches of phases: peak magnitude per phase '''
+    def _scan_time(self, channels, steering):
+        num_phases = steering.shape[0]
+        batch = max(1, MAX_BATCH_BYTES // (16 * self.num_samples))
+        peak_mag = np.empty(num_phases)
+        shape = (min(batch, num_phases), self.num_samples)
+        delayed_sum = self.pool.get('delayed_sum', shape)
+        sum_fft = self.pool.get('sum_fft', shape)
+        steered = self.pool.get('steered', (shape[0], len(self.bins)))
+        magnitude = self.pool.get('magnitude', steered.shape, float)
+        for start in range(0, num_phases, batch):
+            stop = min(start + batch, num_phases)
+            rows = stop - start
+            np.matmul(steering[start:stop], channels, out=delayed_sum[:rows])     # (batch x samples) steered sums
+            delayed_sum[:rows] *= self.win
+            spectrum.fft(delayed_sum[:rows], out=sum_fft[:rows])
+            np.take(sum_fft[:rows], self.bins, axis=-1, mode='clip', out=steered[:rows])
+            np.abs(steered[:rows], out=magnitude[:rows])
+            np.max(magnitude[:rows], axis=-1, out=peak_mag[start:stop])
+        peak_mag /= self.win_sum
+        return peak_mag
+
+    ''' Peak magnitude of the steered sum at any phase steps, from spectra() of a buffer '''
+    def evaluate(self, spectra, delay_phases, phase_cal=None):
+        steering = steering_matrix(np.atleast_1d(delay_phases), self.element_index)
+        if phase_cal is not None:
+            steering = steering * np.exp(1j * np.deg2rad(np.asarray(phase_cal, dtype=float)))
+        return np.max(np.abs(steering @ spectra), axis=-1)
+
+    ''' Coarse sweep over delay_phases, then a golden-section search around its peak: (peak_delay, peak_dbfs, peak_sum) '''
+    def fine_peak(self, channels, phase_cal=None, tolerance=0.1, spectra=None):
+        # tolerance: width [deg] the peak is narrowed down to
+        # spectra: spectra() of channels if the caller already has them, so the FFT is not done twice
+        if spectra is None:
+            spectra = self.spectra(channels)
+        peak_mag = self._scan_freq(spectra, self.weights(phase_cal))
+        peak_sum = 20 * np.log10(peak_mag / (2**11))
+        peak_index = int(np.argmax(peak_mag))
+        step = float(np.max(np.abs(np.diff(self.delay_phases)))) if len(self.delay_phases) > 1 else 360.0
+        low, high = self.delay_phases[peak_index] - step, self.delay_phases[peak_index] + step
+        # the phase steps are periodic in 360 deg, so the bracket may run past +-180
+        inner_low, inner_high = high - GOLDEN * (high - low), low + GOLDEN * (high - low)
+        mag_low, mag_high = self.evaluate(spectra, [inner_low, inner_high], phase_cal)
+        while high - low > tolerance:
+            if mag_low > mag_high:
+                high, inner_high, mag_high = inner_high, inner_low, mag_low
+                inner_low = high - GOLDEN * (high - low)
+                mag_low = self.evaluate(spectra, inner_low, phase_cal)[0]
+            else:
+                low, inner_low, mag_low = inner_low, inner_high, mag_high
+                inner_high = low + GOLDEN * (high - low)
+                mag_high = self.evaluate(spectra, inner_high, phase_cal)[0]
+        peak_delay = (low + high) / 2
+        # the level is read at the returned angle, not at whichever probe happened to be highest
+        fine_mag = self.evaluate(spectra, peak_delay, phase_cal)[0]
+        peak_delay = (peak_delay + 180) % 360 - 180
+        return peak_delay, 20 * np.log10(fine_mag / (2**11)), peak_sum
+
+    ''' Find the peak of a peak_sum curve: (peak_delay, peak_dbfs) '''
+    def peak(self, peak_sum):
+        peak_index = int(np.argmax(peak_sum))
+        return self.delay_phases[peak_index], peak_sum[peak_index]
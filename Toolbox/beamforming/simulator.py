@@ -0,0 +1,162 @@
+'''
+Simulated PlutoSDR (adi.ad9361) for running the scripts without hardware.
+
+SimulatedPluto has the attributes and methods the Toolbox scripts use on adi.ad9361 (rx_lo,
+sample_rate, rx_buffer_size, rx_enabled_channels, tx(), rx(), tx_cyclic_buffer,
+_rxadc.set_kernel_buffers_count(), ...), so a script can be pointed at it by swapping one import:
+    from beamforming.simulator import SimulatedPluto as ad9361
+
+Every simulated device shares a SimulatedScene, which holds the emitter: its angle, the element
+spacing d and the waveform in the air. The waveform is whatever was last sent with tx() on any
+device of the scene, or a tone at tone_freq if nothing was sent. Each device owns two elements
+of the linear array. By default devices take the next two free elements in the order they are
+created; pass layout={uri: first_element} to the scene to place them explicitly, e.g. for
+newPlotPeaks.py where the transmitter Pluto is created first:
+    scene = SimulatedScene(emitter_angle=20, d=d, layout={'ip:192.168.2.1': 0, 'ip:192.168.5.1': 2, 'ip:192.168.3.1': 4})
+
+Per channel trigger delays [samples] and phase offsets [deg] model the sync errors that
+compute_phase_offset_and_delay() has to remove: a channel with trigger_delay k starts its
+buffer k samples later than a channel with no delay.
+'''
+
+import threading
+import numpy as np
+
+''' The emitter and array geometry shared by a set of simulated Plutos '''
+class SimulatedScene(object):
+
+    def __init__(self, emitter_angle=0.0, d=None, tone_freq=200e3, amplitude=0.5, noise=0.01, layout=None, seed=None):
+        # emitter_angle: direction of arrival [deg], 0 is broadside
+        # d: element spacing [m], defaults to half a wavelength at the device's rx_lo
+        # tone_freq: baseband tone [Hz] received when nothing has been sent with tx()
+        # amplitude, noise: signal peak and noise rms as a fraction of ADC full scale (2^11)
+        # layout: optional {uri: index of the device's first element}
+        self.emitter_angle = emitter_angle
+        self.d = d
+        self.tone_freq = tone_freq
+        self.amplitude = amplitude
+        self.noise = noise
+        self.layout = dict(layout or {})
+        self.waveform = None
+        self.rng = np.random.default_rng(seed)
+        self._next_element = 0
+        self._lock = threading.Lock()
+
+    ''' Index of the first array element for a new device '''
+    def place(self, uri):
+        with self._lock:
+            if uri in self.layout:
+                return self.layout[uri]
+            first_element = self._next_element
+            self._next_element += 2
+            return first_element
+
+    ''' Phase step between neighbouring elements [rad] at a given LO '''
+    def element_phase(self, rx_lo):
+        wavelength = 3e8 / rx_lo
+        d = wavelength / 2 if self.d is None else self.d
+        return 2 * np.pi * d * np.sin(np.deg2rad(self.emitter_angle)) / wavelength
+
+    ''' Baseband signal at absolute sample numbers n, with peak amplitude 1 '''
+    def signal(self, n, sample_rate):
+        if self.waveform is None:
+            return np.exp(2j * np.pi * self.tone_freq * n / sample_rate)
+        return np.take(self.waveform, n, mode='wrap')
+
+default_scene = SimulatedScene()
+
+''' Stand-in for the libiio rx buffer object, only used for set_kernel_buffers_count() '''
+class _SimulatedRxAdc(object):
+
+    def __init__(self):
+        self.kernel_buffers_count = 4
+
+    def set_kernel_buffers_count(self, count):
+        self.kernel_buffers_count = int(count)
+
+''' Drop-in replacement for adi.ad9361 that synthesizes the array signal '''
+class SimulatedPluto(object):
+
+    def __init__(self, uri='ip:192.168.2.1', scene=None, trigger_delay=0, phase_offset=0.0):
+        # trigger_delay: per channel trigger delay [samples], one value or one per channel
+        # phase_offset: per channel LO phase offset [deg], one value or one per channel
+        self.uri = uri
+        self.scene = default_scene if scene is None else scene
+        self.first_element = self.scene.place(uri)
+        self.trigger_delay = np.broadcast_to(np.asarray(trigger_delay, dtype=int), (2,))
+        self.phase_offset = np.broadcast_to(np.asarray(phase_offset, dtype=float), (2,))
+        # Same defaults as the ad9361 driver
+        self.sample_rate = 30720000
+        self.rx_lo = 2400000000
+        self.tx_lo = 2400000000
+        self.rx_rf_bandwidth = 18000000
+        self.tx_rf_bandwidth = 18000000
+        self.gain_control_mode = 'slow_attack'
+        self.gain_control_mode_chan0 = 'slow_attack'
+        self.gain_control_mode_chan1 = 'slow_attack'
+        self.rx_hardwaregain_chan0 = 71
+        self.rx_hardwaregain_chan1 = 71
+        self.tx_hardwaregain_chan0 = -10
+        self.tx_hardwaregain_chan1 = -10
+        self.rx_buffer_size = 1024
+        self.tx_buffer_size = 1024
+        self.rx_enabled_channels = [0]
+        self.tx_enabled_channels = [0]
+        self.tx_cyclic_buffer = False
+        self._rxadc = _SimulatedRxAdc()
+        self._sample_count = 0        # absolute sample number of the next rx() buffer
+
+    ''' Send data: the waveform becomes what every device in the scene receives '''
+    def tx(self, data):
+        # data: one array, or a list with one array per tx channel (only the first is used)
+        if isinstance(data, (list, tuple)):
+            data = data[0]
+        data = np.asarray(data, dtype=complex)
+        peak = np.max(np.abs(data))
+        self.scene.waveform = data / peak if peak > 0 else data
+
+    def tx_destroy_buffer(self):
+        self.scene.waveform = None
+
+    def rx_destroy_buffer(self):
+        self._sample_count = 0
+
+    ''' Receive one buffer: one array per enabled channel, or a single array for one channel '''
+    def rx(self):
+        scene = self.scene
+        num_samples = int(self.rx_buffer_size)
+        n = self._sample_count + np.arange(num_samples)
+        self._sample_count += num_samples
+        element_phase = scene.element_phase(self.rx_lo)
+        full_scale = 2**11
+        data = []
+        for channel in self.rx_enabled_channels:
+            element = self.first_element + channel
+            # element k sees the plane wave k * element_phase later than element 0
+            phase = -element * element_phase + np.deg2rad(self.phase_offset[channel])
+            rx_signal = scene.amplitude * full_scale * np.exp(1j * phase) * scene.signal(n + self.trigger_delay[channel], self.sample_rate)
+            noise = scene.rng.standard_normal((2, num_samples)) * (scene.noise * full_scale / np.sqrt(2))
+            # 12 bit ADC: round to integer codes and clip at full scale
+            i = np.clip(np.round(rx_signal.real + noise[0]), -full_scale, full_scale - 1)
+            q = np.clip(np.round(rx_signal.imag + noise[1]), -full_scale, full_scale - 1)
+            data.append(i + 1j * q)
+        if len(data) == 1:
+            return data[0]
+        return data
+
+''' Create num_devices simulated Plutos with consecutive elements, configured like the PlotPeaks receivers '''
+def simulated_array(num_devices, scene=None, num_samples=2**12, sample_rate=1e6, rx_lo=915e6, trigger_delays=None, phase_offsets=None):
+    # trigger_delays, phase_offsets: optional (num_devices x 2) per channel values
+    scene = SimulatedScene() if scene is None else scene
+    sdrs = []
+    for index in range(num_devices):
+        sdr = SimulatedPluto(uri=f'sim:{index}', scene=scene,
+                             trigger_delay=0 if trigger_delays is None else trigger_delays[index],
+                             phase_offset=0 if phase_offsets is None else phase_offsets[index])
+        sdr.rx_enabled_channels = [0, 1]
+        sdr.sample_rate = int(sample_rate)
+        sdr.rx_lo = int(rx_lo)
+        sdr.rx_buffer_size = int(num_samples)
+        sdr._rxadc.set_kernel_buffers_count(1)
+        sdrs.append(sdr)
+    return sdrs
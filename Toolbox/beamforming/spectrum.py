@@ -0,0 +1,88 @@
+'''
+Windowed FFT spectra in dBFS.
+
+dbfs() is the most called function across the Toolbox scripts and used to rebuild np.hamming()
+and its sum on every call, and upcast every buffer to complex128. Here the window, its sum and
+the dBFS scale are built once per (length, window type, precision) and reused.
+
+    single=True   runs the FFT in complex64 with a float32 window (complex64 input does this by
+                  default). numpy >= 2.0 and scipy.fft both keep single precision through the FFT.
+    workers=N     splits a batched (channels x samples) FFT over N threads. This needs scipy.fft;
+                  with plain numpy.fft the FFT runs on one thread.
+    out=array     writes the FFT into a preallocated array (e.g. from a BufferPool). numpy >= 2.0
+                  transforms straight into it, otherwise the result is copied in.
+'''
+
+from functools import lru_cache
+import inspect
+import numpy as np
+
+try:
+    import scipy.fft as _fft        # supports workers=
+except ImportError:
+    _fft = None
+
+_NUMPY_FFT_OUT = 'out' in inspect.signature(np.fft.fft).parameters     # numpy >= 2.0
+
+FULL_SCALE = 2**11      # Pluto is a signed 12 bit ADC, so use 2^11 to convert to dBFS
+
+WINDOWS = {
+    'hamming': np.hamming,
+    'hanning': np.hanning,
+    'blackman': np.blackman,
+    'bartlett': np.bartlett,
+    'rect': np.ones,
+}
+
+''' Window of a given length and type, built once and reused: (win, sum of win) '''
+@lru_cache(maxsize=64)
+def window(num_samples, kind='hamming', single=False):
+    if kind not in WINDOWS:
+        raise ValueError(f'Not a valid window: {kind} ({", ".join(WINDOWS)})')
+    win = WINDOWS[kind](num_samples)
+    win_sum = float(np.sum(win))
+    if single:
+        win = win.astype(np.float32)
+    win.flags.writeable = False         # shared between callers, so never modify in place
+    return win, win_sum
+
+''' dB offset that turns 10*log10(|FFT|^2) into dBFS for a window '''
+@lru_cache(maxsize=64)
+def dbfs_offset(num_samples, kind='hamming'):
+    win, win_sum = window(num_samples, kind)
+    return -20 * np.log10(win_sum * FULL_SCALE)
+
+''' FFT along the last axis, on worker threads when scipy is available '''
+def fft(data, workers=None, out=None):
+    if out is not None and _NUMPY_FFT_OUT and (workers is None or _fft is None):
+        return np.fft.fft(data, axis=-1, out=out)
+    if _fft is not None:
+        result = _fft.fft(data, axis=-1, workers=workers)
+    else:
+        result = np.fft.fft(data, axis=-1)
+    if out is None:
+        return result
+    out[...] = result
+    return out
+
+''' Windowed FFT of one channel or a (channels x samples) block '''
+def windowed_fft(raw_data, kind='hamming', single=None, workers=None):
+    raw_data = np.asarray(raw_data)
+    if single is None:
+        single = raw_data.dtype == np.complex64
+    if single:
+        raw_data = raw_data.astype(np.complex64, copy=False)
+    win, win_sum = window(raw_data.shape[-1], kind, bool(single))
+    return fft(raw_data * win, workers)
+
+''' Convert IQ samples to FFT Plot Display scaled in dBfs - Kraft '''
+def dbfs(raw_data, kind='hamming', single=None, workers=None, shift=True):
+    s_fft = windowed_fft(raw_data, kind, single, workers)
+    if shift:
+        s_fft = np.fft.fftshift(s_fft, axes=-1)
+    # |X|^2 skips the square root of np.abs(), and the window and ADC scaling is one precomputed offset
+    power = s_fft.real**2
+    power += s_fft.imag**2
+    s_dbfs = 10 * np.log10(power)
+    s_dbfs += dbfs_offset(s_fft.shape[-1], kind)
+    return s_dbfs
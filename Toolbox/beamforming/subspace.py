@@ -0,0 +1,72 @@
+'''
+MUSIC and Root-MUSIC direction finding for the multi-Pluto linear arrays.
+
+The delay-and-sum scan in rotate()/sweep() sees two emitters as one wide (or shifted) peak once
+they are closer than a beamwidth. MUSIC splits the covariance of the aligned channels into a
+signal and a noise subspace and scores every steering vector by how orthogonal it is to the noise
+subspace, which separates up to channels - 1 emitters.
+
+The steering grid is in phase steps between neighbouring elements [deg], the same units as
+delay_phases in the PlotPeaks scripts and BeamScanner, so calcTheta() turns the peaks into
+steering angles. Root-MUSIC solves for the phase steps directly (no grid) and needs the channels
+on consecutive elements (element_index 0, 1, 2, ...).
+'''
+
+import numpy as np
+from .scan import steering_matrix
+
+''' Eigenvectors of R split into (signal subspace, noise subspace), strongest first '''
+def subspaces(R, num_sources):
+    if not 0 < num_sources < R.shape[0]:
+        raise ValueError(f'num_sources = {num_sources} must be between 1 and {R.shape[0] - 1} for {R.shape[0]} channels')
+    eigvals, eigvecs = np.linalg.eigh(R)        # ascending eigenvalues
+    eigvecs = eigvecs[:, ::-1]
+    return eigvecs[:, :num_sources], eigvecs[:, num_sources:]
+
+''' MUSIC pseudospectrum over a precomputed steering grid '''
+class MUSIC(object):
+
+    def __init__(self, element_index, delay_phases=np.arange(-180, 180, 0.5)):
+        # element_index: position of each channel in units of d
+        # delay_phases: grid of phase steps between neighbouring elements [deg]
+        self.element_index = np.asarray(element_index)
+        self.delay_phases = np.asarray(delay_phases)
+        # The signal at element k is delayed by k * phase step, so the array response is the
+        # conjugate of the BeamScanner steering weights (phases x channels)
+        self.manifold = np.conj(steering_matrix(self.delay_phases, self.element_index))
+
+    ''' Pseudospectrum [dB, 0 dB at its maximum] for every entry of delay_phases '''
+    def spectrum(self, R, num_sources):
+        signal, noise = subspaces(R, num_sources)
+        projection = self.manifold.conj() @ noise          # a^H E_n for every grid point
+        distance = np.sum(projection.real**2 + projection.imag**2, axis=-1)
+        pseudo = 10 * np.log10(1 / np.maximum(distance, np.finfo(float).tiny))
+        return pseudo - np.max(pseudo)
+
+    ''' The num_sources highest local maxima of a spectrum: phase steps [deg], strongest first '''
+    def peaks(self, spectrum, num_sources):
+        # the grid wraps at +-180, so compare the ends with each other too
+        local_max = (spectrum >= np.roll(spectrum, 1)) & (spectrum > np.roll(spectrum, -1))
+        candidates = np.flatnonzero(local_max)
+        strongest = candidates[np.argsort(spectrum[candidates])[::-1][:num_sources]]
+        return self.delay_phases[strongest]
+
+    ''' Pseudospectrum and the phase steps of its num_sources peaks: (peak phases [deg], spectrum) '''
+    def estimate(self, R, num_sources):
+        spectrum = self.spectrum(R, num_sources)
+        return self.peaks(spectrum, num_sources), spectrum
+
+''' Root-MUSIC for a uniform linear array: phase steps [deg] of num_sources emitters, strongest first '''
+def root_music(R, num_sources):
+    # R must come from channels on consecutive elements, element_index = 0, 1, 2, ...
+    num_channels = R.shape[0]
+    signal, noise = subspaces(R, num_sources)
+    C = noise @ np.conj(noise.T)
+    # a(z)^H C a(z) with a(z) = [1, z, z^2, ...] is a polynomial whose coefficients are the diagonal sums of C
+    coeffs = np.array([np.trace(C, offset=offset) for offset in range(num_channels - 1, -num_channels, -1)])
+    roots = np.roots(coeffs)
+    # roots come in (z, 1/z*) pairs, keep the ones inside the unit circle closest to it
+    roots = roots[np.abs(roots) < 1]
+    roots = roots[np.argsort(1 - np.abs(roots))][:num_sources]
+    # element k sees exp(-j * k * phase step), so the phase step is minus the root's angle
+    return np.rad2deg(-np.angle(roots))
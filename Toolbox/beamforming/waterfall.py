@@ -0,0 +1,134 @@
+'''
+Waterfall (spectrogram) display rows kept in a preallocated ring.
+
+The PlutoSDR waterfall test script found the min and max of every spectrum with a Python loop,
+mapped each bin through a scalar function, kept the rows in a list trimmed with pop(0), and turned
+the whole image into a PIL Image and then RGBA bytes for pygame on every frame. The cost grew with
+FFT size x history, so anything past 1024 x 200 dropped the frame rate.
+
+A Waterfall keeps the history as a (depth x width) uint8 ring plus its colored (depth x width x 3)
+copy, both allocated once. push() normalizes a spectrum with array operations, colors it through a
+256 entry lookup table and writes it over the oldest row, so a frame costs O(width) no matter how
+deep the history is. Nothing is reordered: segments() tells which ring rows go where on screen, so
+a display blits the ring in (at most) two pieces, and only the newest row has to be uploaded.
+
+Spectra wider than the display are reduced to `width` columns by keeping the strongest bin of each
+group (a narrow carrier never disappears between columns), so the FFT size can grow independently
+of the window size.
+
+psd() is the averaged periodogram the script used from matplotlib.mlab (Hanning window, no overlap,
+centered two sided spectrum, density scaling), as one batched FFT.
+'''
+
+from functools import lru_cache
+import numpy as np
+from .spectrum import fft, window
+
+# Anchor colors of each colormap, from the lowest to the highest level; the lookup tables
+# interpolate linearly between them
+COLORMAPS = {
+    'gray': [(0, 0, 0), (255, 255, 255)],
+    'heat': [(0, 0, 0), (128, 0, 0), (255, 64, 0), (255, 200, 0), (255, 255, 255)],
+    'viridis': [(68, 1, 84), (59, 82, 139), (33, 145, 140), (94, 201, 98), (253, 231, 37)],
+}
+
+''' (256 x 3) uint8 lookup table of a colormap, built once and reused '''
+@lru_cache(maxsize=None)
+def colormap(name='gray'):
+    if name not in COLORMAPS:
+        raise ValueError(f'Not a valid colormap: {name} ({", ".join(COLORMAPS)})')
+    anchors = np.asarray(COLORMAPS[name], dtype=float)
+    levels = np.linspace(0, 1, 256)
+    positions = np.linspace(0, 1, len(anchors))
+    lut = np.stack([np.interp(levels, positions, anchors[:, c]) for c in range(3)], axis=-1)
+    lut = np.round(lut).astype(np.uint8)
+    lut.flags.writeable = False         # shared between callers, so never modify in place
+    return lut
+
+''' Averaged periodogram of IQ samples: nfft bins, centered on DC (like mlab.psd for complex input) '''
+def psd(samples, nfft=1024, sample_rate=1.0, kind='hanning'):
+    samples = np.asarray(samples)
+    num_segments = len(samples) // nfft
+    if num_segments < 1:
+        raise ValueError(f'{len(samples)} samples are fewer than nfft = {nfft}')
+    win, win_sum = window(nfft, kind)
+    # all segments are windowed and transformed in one batch, then averaged
+    segments = samples[:num_segments * nfft].reshape(num_segments, nfft) * win
+    s_fft = fft(segments)
+    power = s_fft.real**2
+    power += s_fft.imag**2
+    power = np.mean(power, axis=0)
+    power /= sample_rate * np.sum(win**2)
+    return np.fft.fftshift(power)
+
+''' Start of each group of bins that becomes one display column (used with np.maximum.reduceat) '''
+@lru_cache(maxsize=16)
+def column_edges(num_bins, width):
+    edges = (np.arange(width) * num_bins) // width
+    edges.flags.writeable = False
+    return edges
+
+''' Fixed size history of colored spectra in a ring, oldest row overwritten first '''
+class Waterfall(object):
+
+    def __init__(self, width, depth, cmap='gray', levels=None, scale="linear"):
+        # width: display columns; wider spectra are peak-reduced to this, narrower ones stretched
+        # depth: number of rows (spectra) kept
+        # levels: fixed (low, high) mapped to the bottom and top of the colormap, in the units of
+        # `scale`; None rescales every row to its own min and max like the original script
+        # scale: "linear" maps power as is, "db" maps 10*log10(power)
+        if scale not in ("linear", "db"):
+            raise ValueError(f'Not a valid scale: {scale} ("linear" or "db")')
+        self.width = int(width)
+        self.depth = int(depth)
+        self.levels = levels
+        self.scale = scale
+        self.lut = colormap(cmap)
+        self.index = np.zeros((self.depth, self.width), dtype=np.uint8)     # colormap index of every pixel
+        self.rgb = np.zeros((self.depth, self.width, 3), dtype=np.uint8)    # the same rows, colored
+        self._row = np.empty(self.width)        # one normalized row, reused for every push()
+        self.head = -1                          # ring row of the newest spectrum
+        self.rows = 0                           # spectra pushed so far
+
+    ''' Reduce a spectrum to `width` columns, keeping the strongest bin of each column '''
+    def columns(self, power):
+        power = np.asarray(power, dtype=float)
+        if len(power) == self.width:
+            return power
+        edges = column_edges(len(power), self.width)
+        if len(power) > self.width:
+            return np.maximum.reduceat(power, edges)
+        return power[edges]
+
+    ''' Add one spectrum as the newest row: its (width x 3) colors, e.g. to upload just that row '''
+    def push(self, power):
+        row = self._row
+        np.copyto(row, self.columns(power))
+        if self.scale == "db":
+            np.log10(np.maximum(row, 1e-20, out=row), out=row)
+            row *= 10
+        low, high = (row.min(), row.max()) if self.levels is None else self.levels
+        # (power - low) * 255 / (high - low), clipped to the colormap, all bins at once
+        span = high - low
+        row -= low
+        row *= 255 / span if span > 0 else 0
+        np.clip(row, 0, 255, out=row)
+        self.head = (self.head + 1) % self.depth
+        np.copyto(self.index[self.head], row, casting='unsafe')
+        np.take(self.lut, self.index[self.head], axis=0, mode='clip', out=self.rgb[self.head])
+        self.rows += 1
+        return self.rgb[self.head]
+
+    ''' Ring rows in display order, oldest on top: [(first ring row, last ring row + 1, screen row)] '''
+    def segments(self):
+        if self.rows < self.depth:
+            # not full yet, the rows are still in order from row 0
+            return [(0, self.rows, 0)] if self.rows else []
+        oldest = (self.head + 1) % self.depth
+        if oldest == 0:
+            return [(0, self.depth, 0)]
+        return [(oldest, self.depth, 0), (0, oldest, self.depth - oldest)]
+
+    ''' Colored history in display order (a copy, e.g. to save or show with matplotlib) '''
+    def image(self):
+        return np.concatenate([self.rgb[start:stop] for start, stop, y in self.segments()] or [self.rgb[:0]])
@@ -0,0 +1,217 @@
+'''
+TX waveforms for the Plutos: tones, Barker and PN codes, shaped BPSK and cyclic TX buffers.
+
+Every script built its TX tone at startup from a float np.arange() time axis (whose length can be
+off by one) with separate cos() and sin() arrays, and kept its own copy of the Barker 13 code. The
+BPSK buffers were built by growing an array symbol by symbol. Here:
+
+    tone()          one complex exponential over an integer sample index, optionally snapped to
+                    the nearest FFT bin so a cyclic TX buffer wraps without a phase jump
+    barker()        the known Barker codes, as read-only +-1 arrays
+    pn_sequence()   maximal length (m-) sequences from a Fibonacci LFSR, 2^order - 1 chips
+    shape()         symbols to samples: "rect" is np.repeat(), "half_sine" and "rrc" are FIR pulses
+                    applied with one convolution (circular with cyclic=True, for cyclic TX buffers)
+    bpsk_buffer()   a code repeated to fill a TX buffer, optionally on a carrier tone
+
+All of them are cached per process. WaveformCache also keeps the generated arrays on disk as .npy
+files keyed by the generating function, the source of its module and its arguments, so a 2^18
+sample buffer or a long PN preamble is a file load on the next start instead of a rebuild.
+'''
+
+from functools import lru_cache
+import hashlib
+import inspect
+import math
+from pathlib import Path
+import sys
+import numpy as np
+
+DEFAULT_CACHE = Path.home() / '.sdr-beamforming' / 'waveforms'
+
+FULL_SCALE = 2**14      # TX amplitude the scripts use, the Pluto DAC is 12 bit in the upper bits of int16
+
+BARKER = {
+    2: (1, -1),
+    3: (1, 1, -1),
+    4: (1, 1, -1, 1),
+    5: (1, 1, 1, -1, 1),
+    7: (1, 1, 1, -1, -1, 1, -1),
+    11: (1, 1, 1, -1, -1, -1, 1, -1, -1, 1, -1),
+    13: (1, 1, 1, 1, 1, -1, -1, 1, 1, -1, 1, -1, 1),
+}
+
+# Feedback taps of a maximal length Fibonacci LFSR for each register length (primitive polynomials)
+PN_TAPS = {
+    2: (2, 1), 3: (3, 2), 4: (4, 3), 5: (5, 3), 6: (6, 5), 7: (7, 6), 8: (8, 6, 5, 4), 9: (9, 5),
+    10: (10, 7), 11: (11, 9), 12: (12, 11, 10, 4), 13: (13, 12, 11, 8), 14: (14, 13, 12, 2),
+    15: (15, 14), 16: (16, 15, 13, 4), 17: (17, 14), 18: (18, 11), 19: (19, 18, 17, 14), 20: (20, 17),
+}
+
+def _read_only(array):
+    array.flags.writeable = False       # shared between callers, so never modify in place
+    return array
+
+''' Complex tone exp(j 2 pi freq t) * amplitude over num_samples samples '''
+@lru_cache(maxsize=16)
+def tone(num_samples, freq, samp_rate, amplitude=FULL_SCALE, cyclic=False):
+    # cyclic: move freq to the nearest frequency with a whole number of periods in num_samples,
+    # so the buffer repeats without a phase jump (tx_cyclic_buffer)
+    if cyclic:
+        freq = round(freq * num_samples / samp_rate) * samp_rate / num_samples
+    phase = (2 * np.pi * freq / samp_rate) * np.arange(num_samples)
+    return _read_only(amplitude * np.exp(1j * phase))
+
+''' Barker code of a given length as a +-1 array '''
+@lru_cache(maxsize=None)
+def barker(length=13):
+    if length not in BARKER:
+        raise ValueError(f'No Barker code of length {length} ({", ".join(str(n) for n in BARKER)})')
+    return _read_only(np.array(BARKER[length], dtype=float))
+
+''' Maximal length sequence of 2^order - 1 chips as a +-1 array '''
+@lru_cache(maxsize=8)
+def pn_sequence(order, seed=1):
+    # seed: nonzero initial register state
+    if order not in PN_TAPS:
+        raise ValueError(f'No PN taps for order {order} ({min(PN_TAPS)} to {max(PN_TAPS)})')
+    if not 0 < seed < 2**order:
+        raise ValueError(f'seed = {seed} must be in [1, {2**order - 1}]')
+    length = 2**order - 1
+    chips = np.empty(length, dtype=np.uint8)
+    # tap t of the polynomial x^order + ... + x^t + ... + 1 reads register bit order - t
+    mask = 0
+    for tap in PN_TAPS[order]:
+        mask |= 1 << (order - tap)
+    state = seed
+    # the register is one int: output the low bit, shift in the parity of the tapped bits
+    for n in range(length):
+        chips[n] = state & 1
+        feedback = bin(state & mask).count('1') & 1
+        state = (state >> 1) | (feedback << (order - 1))
+    return _read_only(1.0 - 2.0 * chips)
+
+''' FIR taps of a pulse shape, samples_per_symbol samples per symbol, peak 1 '''
+@lru_cache(maxsize=16)
+def pulse_taps(pulse, samples_per_symbol, beta=0.35, span=6):
+    # beta: roll-off of "rrc"; span: length of "rrc" in symbols
+    sps = int(samples_per_symbol)
+    if pulse == "rect":
+        taps = np.ones(sps)
+    elif pulse == "half_sine":
+        taps = np.sin(np.pi * (np.arange(sps) + 0.5) / sps)
+    elif pulse == "rrc":
+        t = (np.arange(span * sps + 1) - span * sps / 2) / sps
+        taps = np.empty_like(t)
+        # the closed form is 0/0 at t = 0 and at t = +-1/(4 beta), those points take their limits
+        center = t == 0
+        edge = np.isclose(np.abs(4 * beta * t), 1)
+        rest = ~(center | edge)
+        tr = t[rest]
+        taps[rest] = ((np.sin(np.pi * tr * (1 - beta)) + 4 * beta * tr * np.cos(np.pi * tr * (1 + beta)))
+                      / (np.pi * tr * (1 - (4 * beta * tr)**2)))
+        taps[center] = 1 - beta + 4 * beta / np.pi
+        if beta > 0:
+            taps[edge] = (beta / math.sqrt(2)) * ((1 + 2 / np.pi) * math.sin(np.pi / (4 * beta))
+                                                  + (1 - 2 / np.pi) * math.cos(np.pi / (4 * beta)))
+    else:
+        raise ValueError(f'Not a valid pulse: {pulse} ("rect", "half_sine" or "rrc")')
+    # scaled so a +-1 rect symbol stream keeps its amplitude: peak of the pulse is 1
+    taps /= np.max(np.abs(taps))
+    return _read_only(taps)
+
+''' Symbols to samples_per_symbol samples each, through a pulse shape '''
+def shape(symbols, samples_per_symbol, pulse="rect", beta=0.35, span=6, cyclic=False):
+    # cyclic: filter circularly, so the result repeats cleanly as a cyclic TX buffer
+    symbols = np.asarray(symbols)
+    sps = int(samples_per_symbol)
+    if pulse == "rect":
+        return np.repeat(symbols, sps)
+    taps = pulse_taps(pulse, sps, beta, span)
+    # zero stuffed symbols, one sample per symbol, then one convolution with the pulse
+    impulses = np.zeros(len(symbols) * sps, dtype=np.result_type(symbols.dtype, float))
+    impulses[::sps] = symbols
+    delay = (len(taps) - 1) // 2 if pulse == "rrc" else 0     # rrc is centered, the others start at the symbol
+    if cyclic:
+        num_samples = len(impulses)
+        # circular convolution by FFT, taps rolled so the pulse peak stays on its symbol
+        kernel = np.zeros(num_samples)
+        index = (np.arange(len(taps)) - delay) % num_samples
+        np.add.at(kernel, index, taps)
+        shaped = np.fft.ifft(np.fft.fft(impulses) * np.fft.fft(kernel))
+        return shaped if np.iscomplexobj(impulses) else shaped.real
+    return np.convolve(impulses, taps)[delay:delay + len(impulses)]
+
+''' Code repeated to fill a num_samples TX buffer, as complex baseband or on a carrier tone '''
+def bpsk_buffer(code, samples_per_symbol, num_samples, freq=0.0, samp_rate=1.0, amplitude=FULL_SCALE,
+                pulse="rect", beta=0.35, span=6):
+    # code: +-1 chips, e.g. barker(13) or pn_sequence(7)
+    # freq: carrier frequency, the tone is snapped to a whole number of periods in num_samples
+    one_code = shape(code, samples_per_symbol, pulse, beta, span, cyclic=True)
+    repeats = -(-num_samples // len(one_code))
+    iq = np.tile(one_code, repeats)[:num_samples].astype(np.complex128)
+    if freq:
+        iq *= tone(num_samples, freq, samp_rate, amplitude, cyclic=True)
+    else:
+        iq *= amplitude
+    return iq
+
+''' Hash of the source file of a module, '' if it has none (e.g. builtins) '''
+@lru_cache(maxsize=None)
+def _source_hash(module_name):
+    module = sys.modules.get(module_name)
+    try:
+        source = Path(inspect.getsourcefile(module)).read_bytes()
+    except (TypeError, OSError):
+        return ''
+    return hashlib.sha1(source).hexdigest()
+
+''' .npy files of generated waveforms, keyed by the generating function, its source and its arguments '''
+class WaveformCache(object):
+
+    def __init__(self, path=DEFAULT_CACHE):
+        self.path = Path(path)
+        self.hits = 0
+        self.misses = 0
+
+    ''' File name for build(*args, **kwargs) '''
+    def key(self, build, *args, **kwargs):
+        digest = hashlib.sha1(build.__name__.encode())
+        # the source of the generator's module is part of the key, so editing a generator (or a
+        # helper it calls) never serves a file built by the old code
+        digest.update(_source_hash(getattr(build, '__module__', None)).encode())
+        named = [(None, value) for value in args] + sorted(kwargs.items())
+        for name, value in named:
+            digest.update(repr(name).encode())
+            # arrays are hashed by content, everything else by repr
+            if isinstance(value, np.ndarray):
+                digest.update(f'{value.dtype}{value.shape}'.encode())
+                digest.update(np.ascontiguousarray(value).tobytes())
+            else:
+                digest.update(repr(value).encode())
+        return f'{build.__name__}-{digest.hexdigest()[:16]}.npy'
+
+    ''' build(*args, **kwargs) from disk if it was generated before, else built and saved (read-only) '''
+    def get(self, build, *args, **kwargs):
+        file = self.path / self.key(build, *args, **kwargs)
+        if file.exists():
+            try:
+                waveform = np.load(file)
+                self.hits += 1
+                return _read_only(waveform)
+            except (OSError, ValueError):
+                pass        # unreadable (e.g. half written), build it again
+        self.misses += 1
+        waveform = np.array(build(*args, **kwargs))
+        self.path.mkdir(parents=True, exist_ok=True)
+        # written under a temporary name first, so an interrupted save never leaves a broken file
+        partial = file.with_suffix('.partial.npy')
+        np.save(partial, waveform)
+        partial.replace(file)
+        return _read_only(waveform)
+
+    ''' Delete every cached waveform: number of files removed '''
+    def clear(self):
+        files = list(self.path.glob('*.npy')) if self.path.exists() else []
+        for file in files:
+            file.unlink()
+        return len(files)
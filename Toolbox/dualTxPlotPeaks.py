@@ -60,109 +60,8 @@ from datetime import datetime
 import pyqtgraph as pg  
 from pyqtgraph.Qt import QtCore, QtGui#, QtWidgets
 import numpy as np
-import pylab as pl
-import math
-import time
-
-''' Generate BPSK (Binary Phase Shift Keying) '''
-def generate_bpsk(data, samp_rate, bit_len):
-    num_bits = data.shape[0]
-    samples_per_bit = math.floor(samp_rate*bit_len)
-    #
-    iq = np.empty(0)
-    for idx in range(num_bits):
-        iq = np.append(iq, data[idx] * np.ones([int(samples_per_bit)]))
-    #
-    # Add complex component
-    iq = iq + 1j * np.zeros(iq.shape[0])
-    #
-    return iq
-
-''' Function for cross-correlation - Krysik '''
-def xcorrelate(X, Y, maxlag):
-    N = max(len(X), len(Y))
-    N_nextpow2 = math.ceil(math.log(N + maxlag, 2))
-    M = 2**N_nextpow2
-    if len(X) < M:
-        postpad_X = int(M - len(X) - maxlag)
-    else:
-        postpad_X = 0
-
-    if len(Y) < M:
-        postpad_Y = int(M - len(Y))
-    else:
-        postpad_Y = 0
-        
-    pre = pl.fft(pl.pad(X, (maxlag,postpad_X), 'constant', constant_values=(0, 0)))
-    post = pl.fft(pl.pad(Y, (0,postpad_Y), 'constant', constant_values=(0, 0)))
-    cor = pl.ifft(pre * pl.conj(post))
-    R = cor[0:2 * maxlag]
-    return R
-
-# TODO: Compute this function initially with the reference RX data (P1Rx0) and the raw RX data, 
-    # then calculate returned values `phase_diff` & `delay` with another call to this function 
-    # Using the reference data (again) & the raw data after a TRIM or PAD based off the first computed delay value
-''' Function for computing and finding phase offsets '''
-def find_phase_offset(ref_data, Rx_data):
-
-    result_corr = xcorrelate(ref_data, Rx_data,int(len(ref_data) / 2))
-    max_position = np.argmax(abs(result_corr))
-
-    phase_diff = result_corr[max_position] / pl.sqrt(pl.mean(pl.real(Rx_data)**2 + pl.imag(Rx_data)**2))
-    phase_diff = pl.angle(phase_diff)/ pl.pi * 180
-
-    return int(phase_diff)
-
-''' Function for computing and finding trigger delays '''
-def find_trigger_delay(ref_data, Rx_data):
-
-    result_corr = xcorrelate(ref_data, Rx_data,int(len(ref_data) / 2))
-    max_position = np.argmax(abs(result_corr))
-    delay = len(result_corr) / 2 - max_position
-
-    return int(delay)
-
-''' Function To Trim ndarray data '''
-def trimDelay(input, delayDelta):
-    input = np.pad(input, (0, delayDelta), 'constant', constant_values=(0))
-    input = input[delayDelta:]
-    return input
-
-''' Function for padding ndarray data '''
-def padDelay(input, delayDelta):
-    length = len(input)
-    input = np.pad(input, (delayDelta, 0), 'constant', constant_values=(0))
-    input = input[:length]
-    return input
-
-''' Function for correcting trigger delays '''
-def correct_trigger_delay(Rx_data, delay):
-    if delay < 0:
-        return padDelay(Rx_data, int(-delay))
-    elif delay > 0:
-        return trimDelay(Rx_data, int(delay))
-    else:
-        return Rx_data
-
-''' Calculate Steering Angle using Phase Difference - Kraft '''
-def calcTheta(phase):
-    # calculates the steering angle for a given phase delta (phase is in deg)
-    # steering angle is theta = arcsin(c * deltaphase / (2 * pi * f * d)
-    arcsin_arg = np.deg2rad(phase) * 3e8 / (2 * np.pi * rx_lo * d)
-    arcsin_arg = max(min(1, arcsin_arg), -1) # arcsin argument must be between 1 and -1, or numpy will throw a warning
-    calc_theta = np.rad2deg(np.arcsin(arcsin_arg))
-    return calc_theta
-
-''' Convert IQ samples to FFT Plot Display scaled in dBfs - Kraft '''
-def dbfs(raw_data):
-    NumSamples = len(raw_data)
-    win = np.hamming(NumSamples)
-    y = raw_data * win
-    s_fft = np.fft.fft(y) / np.sum(win)
-    s_shift = np.fft.fftshift(s_fft)
-    s_dbfs = 20 * np.log10(np.abs(s_shift) / (2**11))     # Pluto is a signed 12 bit ADC, so use 2^11 to convert to dBFS
-    return s_dbfs
-
+from beamforming import (BeamScanner, WaveformCache, barker, bpsk_buffer, calcTheta, correct_trigger_delay, find_phase_offset,
+                         find_trigger_delay, tone)
 
 ''' Basic RF Setup '''
 # must be <=30.72 MHz if both channels are enabled
@@ -248,36 +147,31 @@ sdr0.tx_hardwaregain_chan1 = int(tx_gain)
 sdr0.tx_buffer_size = int(2**18)                # TX Buffer size: 2^18 = 262144
 
 ''' TX Mode Selection for TX Pluto: '''
+waveform_cache = WaveformCache()  # TX buffers are generated on the first run and loaded from disk after that
 MODE = "carrier" # "bpsk" or "carrier"
 
 if MODE == "bpsk": # Beta testing
 
     ''' Program SDR1 TX0 & TX1 and Send Data From PlutoSDR 1 to all other RX Nodes '''
     # Barker Sequence
-    b13 = np.array([1, 1, 1, 1, 1, -1, -1, 1, 1, -1, 1, -1, 1])
+    b13 = barker(13)
 
     # Carrier Signal
     fs = int(sdr0.sample_rate)
     N = 2**16
     ts = 1 / float(fs)
-    t = np.arange(0, N * ts, ts)
-    i0 = np.cos(2 * np.pi * t * fc0) * 2**14
-    q0 = np.sin(2 * np.pi * t * fc0) * 2**14
-    iq0 = i0 + 1j * q0
+    iq0 = waveform_cache.get(tone, N, fc0, fs)    # built once, then loaded from disk
 
-    # BPSK
-    bpsk = generate_bpsk(iq0, 50, 13)
-    sdr0.tx([iq0, iq0])  # Send Tx data.
+    # BPSK: the Barker code at 50 samples per chip, repeated over the buffer on the fc0 carrier
+    bpsk = waveform_cache.get(bpsk_buffer, b13, 50, N, fc0, fs)
+    sdr0.tx([bpsk, bpsk])  # Send Tx data.
 
 elif MODE == "carrier": # Default Mode
 
     fs = int(sdr0.sample_rate)
     N = 2**16
     ts = 1 / float(fs)
-    t = np.arange(0, N * ts, ts)
-    i0 = np.cos(2 * np.pi * t * fc0) * 2**14
-    q0 = np.sin(2 * np.pi * t * fc0) * 2**14
-    iq0 = i0 + 1j * q0
+    iq0 = waveform_cache.get(tone, N, fc0, fs)    # built once, then loaded from disk
     sdr0.tx([iq0, iq0])  # Send Tx data.
 
 else:
@@ -396,10 +290,10 @@ while(0): # Turned Off For now
     #phase_cal_1d = int(sum(phase_cal_1b) / len(phase_cal_1b))
 
 ''' Main Loop '''
-AVERAGING_SCANS = 1
+delay_phases = np.arange(-180, 180, 2)    # Create an Array for -180 - 180 degrees sweep
+# Steering matrix for the 3 Rx1 nodes is built once: node k is shifted by k * phase_delay
+scanner = BeamScanner(delay_phases, np.arange(3), NumSamples, signal_start, signal_end)
 def sweep():
-    # Speed of main loop sweep
-    rpm = 0.1
     ## #  # Receieve data #  # ##
     data1, data1_T = sdr1.rx(P1Clock)
     data2, data2_T = sdr2.rx(P2Clock)
@@ -411,7 +305,6 @@ def sweep():
     Rx_1b = data2[1]          # PlutoSDR 2, RX 1
     Rx_0c = data3[0]          # PlutoSDR 3, RX 0
     Rx_1c = data3[1]          # PlutoSDR 3, RX 1
-    peak_sum = []
     #
     ## #  # Find trigger delays for first Rx nodes #  # ##
     delay_Pluto2 = find_trigger_delay(Rx_0a, Rx_0b) 
@@ -424,33 +317,18 @@ def sweep():
     ## #  # Find phase offsets for second Rx nodes #  # ##
     phase_cal_Pluto2 = find_phase_offset(Rx_1a, Rx_1b)
     phase_cal_Pluto3 = find_phase_offset(Rx_1a, Rx_1c)
-    #
-    #
-    delay_phases = np.arange(-180, 180, 2)    # Create an Array for -180 - 180 degrees sweep
         
-    ''' Phase shift by each degree from -180 to 180 and store peak signal '''
-    for phase_delay in delay_phases:   
-        peak_sum_avg = []
-        # Compute phase shift
-        delayed_Rx_1b = Rx_1b * np.exp(1j * np.deg2rad(1 * phase_delay + phase_cal_Pluto2)) # PlutoSDR 2 RX 1
-        delayed_Rx_1c = Rx_1c * np.exp(1j * np.deg2rad(2 * phase_delay + phase_cal_Pluto3)) # PlutoSDR 3 RX 1
-        # Add to peak sum array
-        delayed_sum = dbfs( Rx_1a + delayed_Rx_1b + delayed_Rx_1c)
-        peak_sum_avg.append(delayed_sum[signal_start:signal_end])
-        peak_sum_value = sum(peak_sum_avg) / len(peak_sum_avg)
-        peak_sum.append(np.max(peak_sum_value)) # np.max(delayed_sum[signal_start:signal_end])
+    ''' Phase shift by every entry of delay_phases in one batch and store peak signal '''
+    channels = np.array([Rx_1a, Rx_1b, Rx_1c])
+    peak_sum = scanner.scan(channels, [0, phase_cal_Pluto2, phase_cal_Pluto3])
     
     # Find peak sum
-    peak_dbfs = np.max(peak_sum)
-    peak_delay_index = np.where(peak_sum == peak_dbfs)
-    peak_delay = delay_phases[peak_delay_index[0][0]]
-    steer_angle = int(calcTheta(peak_delay))
+    peak_delay, peak_dbfs = scanner.peak(peak_sum)
+    steer_angle = int(calcTheta(peak_delay, rx_lo, d))
 
     ''' Peak Sum Plot '''
     baseCurve.setData(delay_phases, peak_sum)
-    p1.removeItem(vertiLine)
-    vertiLine.setPos(peak_delay)
-    p1.addItem(vertiLine)
+    vertiLine.setPos(peak_delay)     # moved in place, not removed and re-added
     # Set labels
     peakSignalLabel.setText(f'Peak Signal at {round(peak_delay, 1)} deg phase delay')
     delayLabelP2Rx0.setText(f'Trigger delay P2Rx0 = {delay_Pluto2} samples')
@@ -458,9 +336,6 @@ def sweep():
     phaseLabelP2Rx1.setText(f'Phase shift P2Rx1 = {phase_cal_Pluto2} deg')
     phaseLabelP3Rx1.setText(f'Phase shift P3Rx1 = {phase_cal_Pluto3} deg')
     peakSteerLabel.setText(f'If d = {int(d*1000)}mm, then steering angle = {steer_angle} deg')
-
-    # Control rate of rotation
-    time.sleep(rpm)
     
 timer = pg.QtCore.QTimer()
 timer.timeout.connect(sweep)
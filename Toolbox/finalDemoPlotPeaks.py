@@ -57,94 +57,13 @@ from datetime import datetime
 import pyqtgraph as pg  
 from pyqtgraph.Qt import QtCore, QtGui#, QtWidgets
 import numpy as np
-import pylab as pl
-import math
-import time
-
-''' Function To Trim ndarray data '''
-def trimDelay(input, delayDelta):
-    input = np.pad(input, (0, delayDelta), 'constant', constant_values=(0))
-    input = input[delayDelta:]
-    return input
-
-''' Function for padding ndarray data '''
-def padDelay(input, delayDelta):
-    length = len(input)
-    input = np.pad(input, (delayDelta, 0), 'constant', constant_values=(0))
-    input = input[:length]
-    return input
-
-''' Generate BPSK (Binary Phase Shift Keying) - Emerson '''
-def generate_bpsk(data, samp_rate, bit_len):
-    num_bits = data.shape[0]
-    samples_per_bit = math.floor(samp_rate*bit_len)
-    #
-    iq = np.empty(0)
-    for idx in range(num_bits):
-        iq = np.append(iq, data[idx] * np.ones([int(samples_per_bit)]))
-    #
-    # Add complex component
-    iq = iq + 1j * np.zeros(iq.shape[0])
-    #
-    return iq
-
-''' Function for cross-correlation - Krysik '''
-def xcorrelate(X, Y, maxlag):
-    N = max(len(X), len(Y))
-    N_nextpow2 = math.ceil(math.log(N + maxlag, 2))
-    M = 2**N_nextpow2
-    if len(X) < M:
-        postpad_X = int(M - len(X) - maxlag)
-    else:
-        postpad_X = 0
-
-    if len(Y) < M:
-        postpad_Y = int(M - len(Y))
-    else:
-        postpad_Y = 0
-        
-    pre = pl.fft(pl.pad(X, (maxlag,postpad_X), 'constant', constant_values=(0, 0)))
-    post = pl.fft(pl.pad(Y, (0,postpad_Y), 'constant', constant_values=(0, 0)))
-    cor = pl.ifft(pre * pl.conj(post))
-    R = cor[0:2 * maxlag]
-    return R
-
-''' Function for computing and finding delays - Krysik '''
-def compute_phase_offset_and_delay(ref_data, Rx_data):
-
-    result_corr = xcorrelate(ref_data, Rx_data, int(len(ref_data) / 2))
-    max_position = np.argmax(abs(result_corr))
-    delay = len(result_corr) / 2 - max_position
-
-    phase_diff = result_corr[max_position] / np.sqrt(np.mean(np.real(Rx_data)**2 + np.imag(Rx_data)**2))
-    phase_diff = np.angle(phase_diff)/ np.pi * 180
-
-    return int(phase_diff), int(delay)
-
-''' Calculate Steering Angle using Phase Difference - Kraft '''
-def calcTheta(phase):
-    # calculates the steering angle for a given phase delta (phase is in deg)
-    # steering angle is theta = arcsin(c * deltaphase / (2 * pi * f * d)
-    arcsin_arg = np.deg2rad(phase) * 3e8 / (2 * np.pi * rx_lo * d)
-    arcsin_arg = max(min(1, arcsin_arg), -1) # arcsin argument must be between 1 and -1, or numpy will throw a warning
-    calc_theta = np.rad2deg(np.arcsin(arcsin_arg))
-    return calc_theta
-
-''' Convert IQ samples to FFT Plot Display scaled in dBfs - Kraft '''
-def dbfs(raw_data):
-    NumSamples = len(raw_data)
-    win = np.hamming(NumSamples)
-    y = raw_data * win
-    s_fft = np.fft.fft(y) / np.sum(win)
-    s_shift = np.fft.fftshift(s_fft)
-    s_dbfs = 20 * np.log10(np.abs(s_shift) / (2**11))     # Pluto is a signed 12 bit ADC, so use 2^11 to convert to dBFS
-    return s_dbfs
-
+from beamforming import BeamScanner, WaveformCache, aligned_views, barker, bpsk_buffer, calcTheta, correlate_channels, tone
 
 ''' Basic RF Setup '''
 # must be <=30.72 MHz if both channels are enabled
 samp_rate = 1e6                     # 1 MHz: 1 Mil Samples / Sec (1 sample per microsecond)
 NumSamples = 2**12
+sync_maxlag = 256                   # trigger delays between the Plutos are tens of samples, so only search +-256
 rx_lo = 915e6                       # 915 MHz (Keep it inside the USA ISM band: 902 - 928 MHz)
 rx_mode = "manual"                  # can be "manual" or "slow_attack"
 #rx0_gain_sdr1 = 20                  # Each RX Channel now has its own gain setting (Tested with GNURadio)
@@ -224,36 +143,31 @@ sdr0.tx_hardwaregain_chan1 = int(-88)
 sdr0.tx_buffer_size = int(2**18)                # TX Buffer size: 2^18 = 262144
 
 ''' TX Mode Selection for TX Pluto: '''
+waveform_cache = WaveformCache()  # TX buffers are generated on the first run and loaded from disk after that
 MODE = "carrier" # "bpsk" or "carrier"
 
 if MODE == "bpsk": # Beta testing
 
     ''' Program SDR1 TX1 and Send Data From PlutoSDR 1 to all other RX Nodes '''
     # Barker Sequence
-    b13 = np.array([1, 1, 1, 1, 1, -1, -1, 1, 1, -1, 1, -1, 1])
+    b13 = barker(13)
 
     # Carrier Signal
     fs = int(sdr0.sample_rate)
     N = 2**16
     ts = 1 / float(fs)
-    t = np.arange(0, N * ts, ts)
-    i0 = np.cos(2 * np.pi * t * fc0) * 2**14
-    q0 = np.sin(2 * np.pi * t * fc0) * 2**14
-    iq0 = i0 + 1j * q0
+    iq0 = waveform_cache.get(tone, N, fc0, fs)    # built once, then loaded from disk
 
-    # BPSK
-    bpsk = generate_bpsk(iq0, 50, 13)
-    sdr0.tx([iq0, iq0])  # Send Tx data.
+    # BPSK: the Barker code at 50 samples per chip, repeated over the buffer on the fc0 carrier
+    bpsk = waveform_cache.get(bpsk_buffer, b13, 50, N, fc0, fs)
+    sdr0.tx([bpsk, bpsk])  # Send Tx data.
 
 elif MODE == "carrier": # Default Mode
 
     fs = int(sdr0.sample_rate)
     N = 2**16
     ts = 1 / float(fs)
-    t = np.arange(0, N * ts, ts)
-    i0 = np.cos(2 * np.pi * t * fc0) * 2**14
-    q0 = np.sin(2 * np.pi * t * fc0) * 2**14
-    iq0 = i0 + 1j * q0
+    iq0 = waveform_cache.get(tone, N, fc0, fs)    # built once, then loaded from disk
     sdr0.tx([iq0, iq0])  # Send Tx data.
 
 else:
@@ -299,6 +213,8 @@ p1_t = win_raw.addPlot()
 p1_t.setLabel('bottom', 'Time', 'sec', **{'color': '#FFF', 'size': '14pt'})
 p1_t.setLabel('left', 'Amplitude', **{'color': '#FFF', 'size': '14pt'})
 p1_t.setYRange(-650, 650, padding=0)
+p1_t.setClipToView(True)                       # the traces are NumSamples long: only draw the visible part,
+p1_t.setDownsampling(auto=True, mode='peak')   # peak downsampled to screen resolution
 # Time axis
 t_ax = np.arange(NumSamples) / samp_rate
 # Curves and labels
@@ -336,9 +252,13 @@ for i in range(20):
     data3 = sdr3.rx()
 
 ''' Main Loop '''
+# Create an Array for -180 - 180 degrees sweep
+delay_phases = np.arange(-160, 160, 2)
+# delay_phases = np.array([-120, 0, 120])
+# Rx_0b and Rx_0c are shifted by 2x and 4x the phase delay; the aligned block is allocated once
+scanner = BeamScanner(delay_phases, [0, 2, 4], NumSamples, signal_start, signal_end)
+aligned = np.zeros((3, NumSamples), dtype=complex)
 def rotate():
-    # Speed modifier for sweep
-    rpm = 0.1
     # Receieve Rx data
     data1 = sdr1.rx()
     data2 = sdr2.rx()
@@ -347,62 +267,42 @@ def rotate():
     Rx_0a = data1[0]          # PlutoSDR 1, RX 0
     Rx_0b = data2[0]          # PlutoSDR 2, RX 0
     Rx_0c = data3[0]          # PlutoSDR 3, RX 0
-    peak_sum = []
     
-    # Find trigger delays and phase offsets
-    phase_cal_0b, delay_0b = compute_phase_offset_and_delay(Rx_0a, Rx_0b)
-    phase_cal_0c, delay_0c = compute_phase_offset_and_delay(Rx_0a, Rx_0c)
-    
-    # Create an Array for -180 - 180 degrees sweep
-    delay_phases = np.arange(-160, 160, 2)    
-    # delay_phases = np.array([-120, 0, 120]) 
-    
-    # Set delays   
-    if delay_0b < 0:
-        Rx_0b = padDelay(Rx_0b, int(-delay_0b))
-    elif delay_0b > 0:
-        Rx_0b = trimDelay(Rx_0b, int(delay_0b))
-    if delay_0c < 0:
-        Rx_0c = padDelay(Rx_0c, int(-delay_0c))
-    elif delay_0c > 0:
-        Rx_0c = trimDelay(Rx_0c, int(delay_0c))
+    # Find trigger delays and phase offsets of Rx_0b and Rx_0c against Rx_0a in one batch
+    phase_cal, delay, _ = correlate_channels(Rx_0a, np.array([Rx_0b, Rx_0c]), sync_maxlag, "window")
+    phase_cal_0b, phase_cal_0c = np.trunc(phase_cal).astype(int)
+    delay_0b, delay_0c = delay
 
     ''' Phase shift by each degree from -180 to 180 and store peak signal '''
-    for phase_delay in delay_phases:   
-        peak_sum_avg = []
-        # Compute phase shift
-        delayed_Rx_0b = Rx_0b * np.exp(1j * np.deg2rad(2 * phase_delay + phase_cal_0b)) # PlutoSDR 2 RX 0
-        delayed_Rx_0c = Rx_0c * np.exp(1j * np.deg2rad(4 * phase_delay + phase_cal_0c)) # PlutoSDR 3 RX 0
-        # Sum shifted & delayed Rx data 
-        delayed_sum = dbfs( Rx_0a + delayed_Rx_0b  + delayed_Rx_0c )
-        peak_sum_avg.append(delayed_sum[signal_start:signal_end])
-        
-        ''' Sync Time Plot '''
-        curve1_t.setData(t_ax, np.real(Rx_0a))
-        curve3_t.setData(t_ax, np.real(Rx_0b))
-        curve5_t.setData(t_ax, np.real(Rx_0c))
-        peak_sum_value = sum(peak_sum_avg) / len(peak_sum_avg)
-        peak_sum.append(np.max(peak_sum_value)) # np.max(delayed_sum[signal_start:signal_end])
-    
+    # Delays are offsets into the samples all three channels share, copied into the aligned block that
+    # is zero outside the overlap (like trimDelay()/padDelay()); the scan then FFTs each channel once
+    # and steers every phase step at the signal bins only
+    (Rx_0a, Rx_0b, Rx_0c), lo, hi = aligned_views([Rx_0a, Rx_0b, Rx_0c], [0, delay_0b, delay_0c])
+    aligned[:, :lo] = 0
+    aligned[:, hi:] = 0
+    for row, Rx in zip(aligned, (Rx_0a, Rx_0b, Rx_0c)):
+        row[lo:hi] = Rx
+    peak_sum = scanner.scan(aligned, [0, phase_cal_0b, phase_cal_0c])
+
+    ''' Sync Time Plot '''
+    curve1_t.setData(t_ax[lo:hi], np.real(Rx_0a))
+    curve3_t.setData(t_ax[lo:hi], np.real(Rx_0b))
+    curve5_t.setData(t_ax[lo:hi], np.real(Rx_0c))
+
     # Peak delay and steering angle
     peak_dbfs = np.max(peak_sum)
     peak_delay_index = np.where(peak_sum == peak_dbfs)
     peak_delay = delay_phases[peak_delay_index[0][0]]
-    steer_angle = int(calcTheta(peak_delay))
+    steer_angle = int(calcTheta(peak_delay, rx_lo, d))
 
     ''' Peak Sum Plot '''
     baseCurve.setData(delay_phases, peak_sum)
-    p1.removeItem(vertiLine)
-    vertiLine.setPos(peak_delay)
-    p1.addItem(vertiLine)
+    vertiLine.setPos(peak_delay)     # moved in place, not removed and re-added
     # Set labels
     peakSignalLabel.setText(f'Peak Signal at {round(peak_delay, 1)} deg phase delay')
     phaseLabelP2Rx0.setText(f'Phase offset P2Rx0 = {phase_cal_0b} deg')
     phaseLabelP3Rx0.setText(f'Phase offset P3Rx0 = {phase_cal_0c} deg')
     peakSteerLabel.setText(f'If d = {int(d*1000)}mm, then steering angle = {steer_angle} deg')
-
-    # Control rate of rotation
-    time.sleep(rpm)
     
 timer = pg.QtCore.QTimer()
 timer.timeout.connect(rotate)
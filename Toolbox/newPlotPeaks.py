@@ -57,108 +57,21 @@ from datetime import datetime
 import pyqtgraph as pg  
 from pyqtgraph.Qt import QtCore, QtGui#, QtWidgets
 import numpy as np
-import pylab as pl
-import math
-import time
-
-''' Function To Trim ndarray data '''
-def trimDelay(input, delayDelta):
-    input = np.pad(input, (0, delayDelta), 'constant', constant_values=(0))
-    input = input[delayDelta:]
-    return input
-
-''' Function for padding ndarray data '''
-def padDelay(input, delayDelta):
-    length = len(input)
-    input = np.pad(input, (delayDelta, 0), 'constant', constant_values=(0))
-    input = input[:length]
-    return input
-
-''' Generate BPSK (Binary Phase Shift Keying) '''
-def generate_bpsk(data, samp_rate, bit_len):
-    num_bits = data.shape[0]
-    samples_per_bit = math.floor(samp_rate*bit_len)
-    #
-    iq = np.empty(0)
-    for idx in range(num_bits):
-        iq = np.append(iq, data[idx] * np.ones([int(samples_per_bit)]))
-    #
-    # Add complex component
-    iq = iq + 1j * np.zeros(iq.shape[0])
-    #
-    return iq
-
-''' Function for cross-correlation - Krysik '''
-def xcorrelate(X, Y, maxlag):
-    N = max(len(X), len(Y))
-    N_nextpow2 = math.ceil(math.log(N + maxlag, 2))
-    M = 2**N_nextpow2
-    if len(X) < M:
-        postpad_X = int(M - len(X) - maxlag)
-    else:
-        postpad_X = 0
-
-    if len(Y) < M:
-        postpad_Y = int(M - len(Y))
-    else:
-        postpad_Y = 0
-        
-    pre = pl.fft(pl.pad(X, (maxlag,postpad_X), 'constant', constant_values=(0, 0)))
-    post = pl.fft(pl.pad(Y, (0,postpad_Y), 'constant', constant_values=(0, 0)))
-    cor = pl.ifft(pre * pl.conj(post))
-    R = cor[0:2 * maxlag]
-    return R
-
-''' Function for computing and finding delays - Krysik '''
-def compute_phase_offset_and_delay(ref_data, Rx_data):
-
-    result_corr = xcorrelate(ref_data, Rx_data, int(len(ref_data) / 2))
-    max_position = np.argmax(abs(result_corr))
-    delay = len(result_corr) / 2 - max_position
-
-    phase_diff = result_corr[max_position] / np.sqrt(np.mean(np.real(Rx_data)**2 + np.imag(Rx_data)**2))
-    phase_diff = np.angle(phase_diff)/ np.pi * 180
-
-    # TODO: Compute this function initially with the reference RX data (P1Rx0) and the raw RX data, 
-    # then calculate returned values `phase_diff` & `delay` with another call to this function 
-    # Using the reference data (again) & the raw data after a TRIM or PAD based off the first computed delay value
-
-    return int(phase_diff), int(delay)
-
-''' Calculate Steering Angle using Phase Difference '''
-def calcTheta(phase):
-    # calculates the steering angle for a given phase delta (phase is in deg)
-    # steering angle is theta = arcsin(c * deltaphase / (2 * pi * f * d)
-    arcsin_arg = np.deg2rad(phase) * 3e8 / (2 * np.pi * rx_lo * d)
-    arcsin_arg = max(min(1, arcsin_arg), -1) # arcsin argument must be between 1 and -1, or numpy will throw a warning
-    calc_theta = np.rad2deg(np.arcsin(arcsin_arg))
-    return calc_theta
-
-''' Convert IQ samples to FFT Plot Display scaled in dBfs '''
-def dbfs(raw_data):
-    NumSamples = len(raw_data)
-    win = np.hamming(NumSamples)
-    y = raw_data * win
-    s_fft = np.fft.fft(y) / np.sum(win)
-    s_shift = np.fft.fftshift(s_fft)
-    s_dbfs = 20 * np.log10(np.abs(s_shift) / (2**11))     # Pluto is a signed 12 bit ADC, so use 2^11 to convert to dBFS
-    return s_dbfs
-
+from beamforming import (BeamScanner, BufferPool, Calibration, CalibrationStore, ChannelMatrix, ConcurrentReceiver, DriftMonitor,
+                         WaveformCache, barker, bpsk_buffer, calcTheta, calibration_key, tone)
+from beamforming.render import Renderer
 
 ''' Basic RF Setup '''
 # must be <=30.72 MHz if both channels are enabled
 samp_rate = 1e6                     # 1 MHz: 1 Mil Samples / Sec (1 sample per microsecond)
 NumSamples = 2**12
+sync_maxlag = 256                   # trigger delays between the Plutos are tens of samples, so only search +-256
+debug_allocations = False           # print the work buffer allocations (and peak temporary bytes) of every frame
 rx_lo = 915e6                       # 915 MHz (Keep it inside the USA ISM band: 902 - 928 MHz)
 rx_mode = "manual"                  # can be "manual" or "slow_attack"
-#rx0_gain_sdr1 = 20                  # Each RX Channel now has its own gain setting (Tested with GNURadio)
-#rx1_gain_sdr1 = 20
-rx0_gain_sdr2 = 20
-rx1_gain_sdr2 = 20
-rx0_gain_sdr3 = 20
-rx1_gain_sdr3 = 20
-rx0_gain_sdr4 = 20
-rx1_gain_sdr4 = 20
+rx_gains = [[20, 20],               # Each RX Channel now has its own gain setting (Tested with GNURadio)
+            [20, 20],               # one [Rx0, Rx1] pair per receiving Pluto, in rx_uris order
+            [20, 20]]
 tx_lo = rx_lo
 tx_gain = -3                        # Same as positive value in GNU Radio Sink
 fc0 = int(200e3)                    # 200 kHz
@@ -174,47 +87,23 @@ print("Set distance between Rx Antennas to ", int(d*1000), "mm")
 
 ''' Create Radios '''
 sdr0 = ad9361(uri='ip:192.168.4.1') # Pluto #4 (Transmitter)
-sdr1 = ad9361(uri='ip:192.168.2.1') # Pluto #2
-sdr2 = ad9361(uri='ip:192.168.5.1') # Pluto #5
-sdr3 = ad9361(uri='ip:192.168.3.1') # Pluto #3
+rx_uris = ['ip:192.168.2.1',        # Pluto #2
+           'ip:192.168.5.1',        # Pluto #5
+           'ip:192.168.3.1']        # Pluto #3 (add a URI and an rx_gains pair for every extra Pluto)
+rx_sdrs = [ad9361(uri=uri) for uri in rx_uris]
+num_channels = 2 * len(rx_sdrs)     # Rx0 and Rx1 of every receiving Pluto, one array element each
 
 ''' Configure All PlutoSDR Radio Channels '''
-#sdr1.rx_enabled_channels = [0, 1]
-sdr1.rx_enabled_channels = [0, 1]
-sdr2.rx_enabled_channels = [0, 1]
-sdr3.rx_enabled_channels = [0, 1]
-#sdr1.sample_rate = int(samp_rate)
-sdr1.sample_rate = int(samp_rate)
-sdr2.sample_rate = int(samp_rate)
-sdr3.sample_rate = int(samp_rate)
-#sdr1.rx_rf_bandwidth = int(fc0 * 3)
-sdr1.rx_rf_bandwidth = int(fc0 * 3)
-sdr2.rx_rf_bandwidth = int(fc0 * 3)
-sdr3.rx_rf_bandwidth = int(fc0 * 3)
-#sdr1.rx_lo = int(rx_lo)
-sdr1.rx_lo = int(rx_lo)
-sdr2.rx_lo = int(rx_lo)
-sdr3.rx_lo = int(rx_lo)
-#sdr1.gain_control_mode = rx_mode
-sdr1.gain_control_mode = rx_mode
-sdr2.gain_control_mode = rx_mode
-sdr3.gain_control_mode = rx_mode
-#sdr1.rx_hardwaregain_chan0 = int(rx0_gain_sdr1)
-sdr1.rx_hardwaregain_chan0 = int(rx0_gain_sdr2)
-sdr2.rx_hardwaregain_chan0 = int(rx0_gain_sdr3)
-sdr3.rx_hardwaregain_chan0 = int(rx0_gain_sdr4)
-#sdr1.rx_hardwaregain_chan1 = int(rx1_gain_sdr1)
-sdr1.rx_hardwaregain_chan1 = int(rx1_gain_sdr2)
-sdr2.rx_hardwaregain_chan1 = int(rx1_gain_sdr3)
-sdr3.rx_hardwaregain_chan1 = int(rx1_gain_sdr4)
-#sdr1.rx_buffer_size = int(NumSamples)
-sdr1.rx_buffer_size = int(NumSamples)
-sdr2.rx_buffer_size = int(NumSamples)
-sdr3.rx_buffer_size = int(NumSamples)
-#sdr1._rxadc.set_kernel_buffers_count(1)        # set buffers to 1 (instead of the default 4) to avoid stale data on Pluto
-sdr1._rxadc.set_kernel_buffers_count(1)
-sdr2._rxadc.set_kernel_buffers_count(1)
-sdr3._rxadc.set_kernel_buffers_count(1)
+for sdr, (rx0_gain, rx1_gain) in zip(rx_sdrs, rx_gains):
+    sdr.rx_enabled_channels = [0, 1]
+    sdr.sample_rate = int(samp_rate)
+    sdr.rx_rf_bandwidth = int(fc0 * 3)
+    sdr.rx_lo = int(rx_lo)
+    sdr.gain_control_mode = rx_mode
+    sdr.rx_hardwaregain_chan0 = int(rx0_gain)
+    sdr.rx_hardwaregain_chan1 = int(rx1_gain)
+    sdr.rx_buffer_size = int(NumSamples)
+    sdr._rxadc.set_kernel_buffers_count(1)      # set buffers to 1 (instead of the default 4) to avoid stale data on Pluto
 sdr0.tx_rf_bandwidth = int(fc0 * 3)             # ONLY TX 1 of PlutoSDR 1 will have TX capability.
 sdr0.tx_lo = int(tx_lo)
 sdr0.tx_cyclic_buffer = True
@@ -229,36 +118,31 @@ sdr0.tx_hardwaregain_chan1 = int(-88)
 sdr0.tx_buffer_size = int(2**18)                # TX Buffer size: 2^18 = 262144
 
 ''' TX Mode Selection for TX Pluto: '''
+waveform_cache = WaveformCache()  # TX buffers are generated on the first run and loaded from disk after that
 MODE = "carrier" # "bpsk" or "carrier"
 
 if MODE == "bpsk": # Beta testing
 
     ''' Program SDR1 TX1 and Send Data From PlutoSDR 1 to all other RX Nodes '''
     # Barker Sequence
-    b13 = np.array([1, 1, 1, 1, 1, -1, -1, 1, 1, -1, 1, -1, 1])
+    b13 = barker(13)
 
     # Carrier Signal
     fs = int(sdr0.sample_rate)
     N = 2**16
     ts = 1 / float(fs)
-    t = np.arange(0, N * ts, ts)
-    i0 = np.cos(2 * np.pi * t * fc0) * 2**14
-    q0 = np.sin(2 * np.pi * t * fc0) * 2**14
-    iq0 = i0 + 1j * q0
+    iq0 = waveform_cache.get(tone, N, fc0, fs)    # built once, then loaded from disk
 
-    # BPSK
-    bpsk = generate_bpsk(iq0, 50, 13)
-    sdr0.tx([iq0, iq0])  # Send Tx data.
+    # BPSK: the Barker code at 50 samples per chip, repeated over the buffer on the fc0 carrier
+    bpsk = waveform_cache.get(bpsk_buffer, b13, 50, N, fc0, fs)
+    sdr0.tx([bpsk, bpsk])  # Send Tx data.
 
 elif MODE == "carrier": # Default Mode
 
     fs = int(sdr0.sample_rate)
     N = 2**16
     ts = 1 / float(fs)
-    t = np.arange(0, N * ts, ts)
-    i0 = np.cos(2 * np.pi * t * fc0) * 2**14
-    q0 = np.sin(2 * np.pi * t * fc0) * 2**14
-    iq0 = i0 + 1j * q0
+    iq0 = waveform_cache.get(tone, N, fc0, fs)    # built once, then loaded from disk
     sdr0.tx([iq0, iq0])  # Send Tx data.
 
 else:
@@ -282,29 +166,24 @@ p1.setLabel('left', 'P1Rx + P2Rx', '[dBfs]', **{'color': '#FFF', 'size': '14pt'}
 peakSignalLabel = pg.TextItem("Peak Signal at 0 deg")
 peakSignalLabel.setParentItem(p1)
 peakSignalLabel.setPos(65, 2)
-phaseLabelP1Rx1 = pg.TextItem("Phase shift P1Rx1 = 0 deg")
-phaseLabelP1Rx1.setParentItem(p1)
-phaseLabelP1Rx1.setPos(65, 22)
-phaseLabelP2Rx0 = pg.TextItem("Phase shift P2Rx0 = 0 deg")
-phaseLabelP2Rx0.setParentItem(p1)
-phaseLabelP2Rx0.setPos(65, 42)
-phaseLabelP2Rx1 = pg.TextItem("Phase shift P2Rx1 = 0 deg")
-phaseLabelP2Rx1.setParentItem(p1)
-phaseLabelP2Rx1.setPos(65, 62)
-phaseLabelP3Rx0 = pg.TextItem("Phase shift P3Rx0 = 0 deg")
-phaseLabelP3Rx0.setParentItem(p1)
-phaseLabelP3Rx0.setPos(65, 82)
-phaseLabelP3Rx1 = pg.TextItem("Phase shift P3Rx1 = 0 deg")
-phaseLabelP3Rx1.setParentItem(p1)
-phaseLabelP3Rx1.setPos(65, 102)
+# One phase shift label per channel after the reference (P1Rx0), for any number of Plutos
+channel_names = [f'P{k // 2 + 1}Rx{k % 2}' for k in range(num_channels)]
+phaseLabels = []
+for k, name in enumerate(channel_names[1:]):
+    label = pg.TextItem(f"Phase shift {name} = 0 deg")
+    label.setParentItem(p1)
+    label.setPos(65, 22 + 20 * k)
+    phaseLabels.append(label)
 peakSteerLabel = pg.TextItem("Estimated DOA = N/A")
 peakSteerLabel.setParentItem(p1)
-peakSteerLabel.setPos(65, 122)
+peakSteerLabel.setPos(65, 22 + 20 * len(phaseLabels))
+# Plot items are created once and updated in place by the renderer, at most once per monitor refresh
+renderer = Renderer()
 # Line
 vertiLine = pg.InfiniteLine(pen=pg.mkPen('r', width=2, style=QtCore.Qt.SolidLine))
 p1.addItem(vertiLine)
 # Curves
-baseCurve = p1.plot()
+baseCurve = renderer.curve(p1)
 baseCurve.setZValue(10)
 
 ''' Set up Sync Window '''
@@ -315,139 +194,84 @@ p1_t.setLabel('left', 'Amplitude', **{'color': '#FFF', 'size': '14pt'})
 p1_t.setYRange(-650, 650, padding=0)
 # Time axis
 t_ax = np.arange(NumSamples) / samp_rate
-# Curves and labels
-curve1_t = p1_t.plot(pen=pg.mkPen('b'))
-label1_t = pg.TextItem("P1 Rx0 in BLUE")
-label1_t.setParentItem(p1_t)
-label1_t.setPos(65, 2)
-curve2_t = p1_t.plot(pen=pg.mkPen('r'))
-label2_t = pg.TextItem("P1 Rx1 in RED")
-label2_t.setParentItem(p1_t)
-label2_t.setPos(65, 24) # Change Y position for each label
-curve3_t = p1_t.plot(pen=pg.mkPen('g'))
-label3_t = pg.TextItem("P2 Rx0 in GREEN")
-label3_t.setParentItem(p1_t)
-label3_t.setPos(65, 46) # Change Y position for each label
-curve4_t = p1_t.plot(pen=pg.mkPen('y'))
-label4_t = pg.TextItem("P2 Rx1 in YELLOW")
-label4_t.setParentItem(p1_t)
-label4_t.setPos(65, 68) # Change Y position for each label
-curve5_t = p1_t.plot(pen=pg.mkPen('c'))
-label5_t = pg.TextItem("P3 Rx1 in CYAN")
-label5_t.setParentItem(p1_t)
-label5_t.setPos(65, 90) # Change Y position for each label
-curve6_t = p1_t.plot(pen=pg.mkPen('m'))
-label6_t = pg.TextItem("P3 Rx1 in MAGENTA")
-label6_t.setParentItem(p1_t)
-label6_t.setPos(65, 102) # Change Y position for each label
+# Curves and labels, one per channel (colors repeat past the sixth channel)
+colors = [('b', "BLUE"), ('r', "RED"), ('g', "GREEN"), ('y', "YELLOW"), ('c', "CYAN"), ('m', "MAGENTA")]
+curves_t = []
+for k, name in enumerate(channel_names):
+    color, color_name = colors[k % len(colors)]
+    curves_t.append(renderer.curve(p1_t, long=True, pen=pg.mkPen(color)))   # clipped to view, peak downsampled
+    label = pg.TextItem(f"{name[:2]} {name[2:]} in {color_name}")
+    label.setParentItem(p1_t)
+    label.setPos(65, 2 + 22 * k)    # Change Y position for each label
 
 
 ''' Collect Data '''
 # let each Pluto run for a bit, to do all its calibrations, then get a buffer
 # TODO: Debug Terminal Print statements. Sould print # of samples.
+# All three Plutos are read in parallel, one thread each, so the buffers are captured together
+receiver = ConcurrentReceiver(rx_sdrs)
 for i in range(20):
-    #data1 = sdr1.rx()
-    data1 = sdr1.rx()
-    data2 = sdr2.rx()
-    data3 = sdr3.rx()
-
-# TODO: Try Threading processes to receieve data
+    data, capture_times = receiver.rx()
+
+''' Calibration '''
+# Phase, delay and gain offsets are reloaded from disk for this set of Plutos, LO and sample rate,
+# and only measured (averaged over 10 buffers) the first time
+calibration_store = CalibrationStore()
+cal_key = calibration_key(rx_sdrs, rx_lo, samp_rate)
+calibration = calibration_store.load(cal_key)
+if calibration is None:
+    calibration = Calibration.measure([receiver.rx()[0] for i in range(10)], sync_maxlag, "full")
+    calibration_store.save(cal_key, calibration)
+# Each frame only reads the phase at the tone bin and tracks its drift; a full correlation runs again
+# when the phase jumps or the channels stop lining up (e.g. a Pluto restarted)
+tone_freq = fc0 / samp_rate if MODE == "carrier" else None
+drift_monitor = DriftMonitor(calibration, tone_freq, maxlag=sync_maxlag, mode="full", store=calibration_store, key=cal_key)
 
 ''' Main Loop '''
-AVERAGING_SCANS = 1
+delay_phases = np.arange(-180, 180, 2)    # Create an Array for -180 - 180 degrees sweep
+# Steering matrix for all Rx nodes is built once: element k is shifted by k * phase_delay
+# and the per-frame FFT and sum arrays come from a pool sized on the first frame
+pool = BufferPool(debug=debug_allocations)
+scanner = BeamScanner(delay_phases, np.arange(num_channels), NumSamples, signal_start, signal_end, pool=pool)
 def rotate():
-    rpm = 0.1
-    # Receieve data
-    data1 = sdr1.rx()
-    data2 = sdr2.rx()
-    data3 = sdr3.rx()
+    # Receieve data from all Plutos at once, rows are (Pluto 1 Rx0, Pluto 1 Rx1, Pluto 2 Rx0, ...)
+    frame = ChannelMatrix.from_receiver(receiver)
     #
-    Rx_0a = data1[0]          # PlutoSDR 1, RX 0
-    Rx_1a = data1[1]          # PlutoSDR 1, RX 1
-    Rx_0b = data2[0]          # PlutoSDR 2, RX 0
-    Rx_1b = data2[1]          # PlutoSDR 2, RX 1
-    Rx_0c = data3[0]          # PlutoSDR 3, RX 0
-    Rx_1c = data3[1]          # PlutoSDR 3, RX 1
-    peak_sum = []
+    # Set delays (fractional part included) and gains from the calibration, all channels at once,
+    # with the phase offsets tracked frame to frame
+    aligned, phase_cal = drift_monitor.process(frame.data)
+    frame = frame.replace(aligned, drift_monitor.calibration)
+
+    ''' Phase shift by every entry of delay_phases in one batch and store peak signal '''
+    # then narrow the peak down to 0.1 deg with a few extra single-phase evaluations
+    peak_delay, peak_dbfs, peak_sum = scanner.fine_peak(frame.data, frame.phase_cal, tolerance=0.1)
     #
-    # Find trigger delays and phase offsets
-    phase_cal_1a, delay_1a = compute_phase_offset_and_delay(Rx_0a, Rx_1a)
-    phase_cal_0b, delay_0b = compute_phase_offset_and_delay(Rx_0a, Rx_0b)
-    phase_cal_1b, delay_1b = compute_phase_offset_and_delay(Rx_0a, Rx_1b)
-    phase_cal_0c, delay_0c = compute_phase_offset_and_delay(Rx_0a, Rx_0c)
-    phase_cal_1c, delay_1c = compute_phase_offset_and_delay(Rx_0a, Rx_1c)
-    #
-    delay_phases = np.arange(-180, 180, 2)    # Create an Array for -180 - 180 degrees sweep
-    #
-    # Set delays   
-    if delay_1a < 0:
-        Rx_1a = padDelay(Rx_1a, int(-delay_1a))
-    elif delay_1a > 0:
-        Rx_1a = trimDelay(Rx_1a, int(delay_1a))
-    if delay_0b < 0:
-        Rx_0b = padDelay(Rx_0b, int(-delay_0b))
-    elif delay_0b > 0:
-        Rx_0b = trimDelay(Rx_0b, int(delay_0b))
-    if delay_1b < 0:
-        Rx_1b = padDelay(Rx_1b, int(-delay_1b))
-    elif delay_1b > 0:
-        Rx_1b = trimDelay(Rx_1b, int(delay_1b))
-    if delay_0c < 0:
-        Rx_0c = padDelay(Rx_0c, int(-delay_0c))
-    elif delay_0c > 0:
-        Rx_0c = trimDelay(Rx_0c, int(delay_0c))
-    if delay_1c < 0:
-        Rx_1c = padDelay(Rx_1c, int(-delay_1c))
-    elif delay_1c > 0:
-        Rx_1c = trimDelay(Rx_1c, int(delay_1c))
-
-    ''' Phase shift by each degree from -180 to 180 and store peak signal '''
-    for phase_delay in delay_phases:   
-        peak_sum_avg = []
-        for i in range(AVERAGING_SCANS):
-            # Compute phase shift
-            delayed_Rx_1a = Rx_1a * np.exp(1j * np.deg2rad(1 * phase_delay + phase_cal_1a)) # PlutoSDR 1 RX 1
-            delayed_Rx_0b = Rx_0b * np.exp(1j * np.deg2rad(2 * phase_delay + phase_cal_0b)) # PlutoSDR 2 RX 0
-            delayed_Rx_1b = Rx_1b * np.exp(1j * np.deg2rad(3 * phase_delay + phase_cal_1b)) # PlutoSDR 2 RX 1
-            delayed_Rx_0c = Rx_0c * np.exp(1j * np.deg2rad(4 * phase_delay + phase_cal_0c)) # PlutoSDR 3 RX 0
-            delayed_Rx_1c = Rx_1c * np.exp(1j * np.deg2rad(5 * phase_delay + phase_cal_1c)) # PlutoSDR 3 RX 1
-            delayed_sum = dbfs( Rx_0a + delayed_Rx_1a + delayed_Rx_0b + delayed_Rx_1b + delayed_Rx_0c + delayed_Rx_1c )
-            peak_sum_avg.append(delayed_sum[signal_start:signal_end])
-            #
-            ''' Sync Time Plot '''
-            curve1_t.setData(t_ax, np.real(Rx_0a))
-            curve2_t.setData(t_ax, np.real(Rx_1a))
-            curve3_t.setData(t_ax, np.real(Rx_0b))
-            curve4_t.setData(t_ax, np.real(Rx_1b))
-            curve5_t.setData(t_ax, np.real(Rx_0c))
-            curve6_t.setData(t_ax, np.real(Rx_1c))
-        peak_sum_value = sum(peak_sum_avg) / len(peak_sum_avg)
-        peak_sum.append(np.max(peak_sum_value)) # np.max(delayed_sum[signal_start:signal_end])
+    ''' Sync Time Plot '''
+    # Plot updates are only queued here and drawn together by renderer.flush()
+    for curve, Rx in zip(curves_t, frame):
+        renderer.set_data(curve, t_ax, np.real(Rx))
     
-    peak_dbfs = np.max(peak_sum)
-    peak_delay_index = np.where(peak_sum == peak_dbfs)
-    peak_delay = delay_phases[peak_delay_index[0][0]]
-    steer_angle = int(calcTheta(peak_delay))
+    steer_angle = round(calcTheta(peak_delay, rx_lo, d), 1)
 
     ''' Peak Sum Plot '''
-    baseCurve.setData(delay_phases, peak_sum)
-    p1.removeItem(vertiLine)
-    vertiLine.setPos(peak_delay)
-    p1.addItem(vertiLine)
+    renderer.set_data(baseCurve, delay_phases, peak_sum)
+    renderer.set_pos(vertiLine, peak_delay)
     # Set labels
-    peakSignalLabel.setText(f'Peak Signal at {round(peak_delay, 1)} deg phase delay')
-    phaseLabelP1Rx1.setText(f'Phase shift P1Rx1 = {phase_cal_1a} deg')
-    phaseLabelP2Rx0.setText(f'Phase shift P2Rx0 = {phase_cal_0b} deg')
-    phaseLabelP2Rx1.setText(f'Phase shift P2Rx1 = {phase_cal_1b} deg')
-    phaseLabelP3Rx0.setText(f'Phase shift P3Rx0 = {phase_cal_0c} deg')
-    phaseLabelP3Rx1.setText(f'Phase shift P3Rx1 = {phase_cal_1c} deg')
-    peakSteerLabel.setText(f'If d = {int(d*1000)}mm, then steering angle = {steer_angle} deg')
-
-    # Control rate of rotation
-    time.sleep(rpm)
+    renderer.set_text(peakSignalLabel, f'Peak Signal at {round(peak_delay, 1)} deg phase delay')
+    for label, name, phase in zip(phaseLabels, frame.labels[1:], frame.phase_cal[1:]):
+        renderer.set_text(label, f'Phase shift {name} = {phase:.1f} deg')
+    renderer.set_text(peakSteerLabel, f'If d = {int(d*1000)}mm, then steering angle = {steer_angle} deg')
     
+''' Count the buffer allocations of every frame '''
+def frame():
+    with pool.frame():
+        rotate()
+    renderer.flush()
+    if debug_allocations:
+        print(pool.report())
+
 timer = pg.QtCore.QTimer()
-timer.timeout.connect(rotate)
+timer.timeout.connect(frame)
 timer.start(0)
 
 if __name__ == '__main__':
@@ -455,4 +279,7 @@ if __name__ == '__main__':
     if (sys.flags.interactive != 1) or not hasattr(QtCore, 'PYQT_VERSION'):
         QtGui.QGuiApplication.instance().exec()
 
+receiver.close()
+print(f"Full recalibrations: {drift_monitor.recalibrations} of {drift_monitor.frames} frames "
+      f"({drift_monitor.phase_failures} phase jumps, {drift_monitor.alignment_failures} alignment failures)")
 sdr0.tx_destroy_buffer()
\ No newline at end of file
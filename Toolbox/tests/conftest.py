@@ -0,0 +1,3 @@
+from sys import path
+from pathlib import Path
+path.append(str(Path(__file__).resolve().parents[1]))     # Toolbox/ folder for the shared beamforming package
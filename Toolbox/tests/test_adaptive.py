@@ -0,0 +1,55 @@
+import numpy as np
+from beamforming import MVDR, SimulatedScene, calcTheta, sample_covariance, simulated_array
+
+num_samples = 4096
+rx_lo = 915e6
+d = 0.5 * 3e8 / rx_lo
+
+''' Phase step between neighbouring elements [deg] for an angle, the inverse of calcTheta() '''
+def phase_step(angle):
+    return 360 * d * np.sin(np.deg2rad(angle)) / (3e8 / rx_lo)
+
+''' (6 x samples) block: a weak emitter at 200 kHz from 20 deg, a 20 dB stronger interferer at 230 kHz from -40 deg '''
+def simulated_block(seed=0):
+    block = 0
+    for k, (emitter_angle, tone_freq, amplitude) in enumerate([(20, 200e3, 0.05), (-40, 230e3, 0.5)]):
+        scene = SimulatedScene(emitter_angle=emitter_angle, d=d, tone_freq=tone_freq, amplitude=amplitude, seed=seed + k)
+        sdrs = simulated_array(3, scene, num_samples=num_samples, rx_lo=rx_lo)
+        block = block + np.concatenate([np.asarray(sdr.rx()) for sdr in sdrs])
+    return block
+
+''' Power [dB] of a beamformed stream at one tone frequency (cycles per sample) '''
+def tone_power(stream, freq):
+    return 20 * np.log10(np.abs(np.exp(-2j * np.pi * freq * np.arange(len(stream))) @ stream) / len(stream))
+
+def test_mvdr_keeps_the_look_direction_and_nulls_the_interferer():
+    block = simulated_block()
+    mvdr = MVDR(np.arange(6))
+    mvdr.update(sample_covariance(block))
+    w = mvdr.weights(phase_step(20))
+    np.testing.assert_allclose(np.conj(w) @ mvdr.response(phase_step(20)), 1)
+    assert np.abs(np.conj(w) @ mvdr.response(phase_step(-40))) < 0.01
+    # the interferer only gets the sidelobe level from the plain phase-shift sum, MVDR nulls it
+    output = mvdr.beamform(block, phase_step(20))
+    steered = np.conj(mvdr.response(phase_step(20))) @ block / 6
+    mvdr_sir = tone_power(output, 0.2) - tone_power(output, 0.23)
+    steered_sir = tone_power(steered, 0.2) - tone_power(steered, 0.23)
+    assert mvdr_sir > steered_sir + 30
+
+''' The Capon spectrum has a peak at each emitter, the interferer's the stronger one '''
+def test_capon_spectrum_peaks_at_both_emitters():
+    mvdr = MVDR(np.arange(6), delay_phases=np.arange(-180, 180, 0.5))
+    mvdr.update(sample_covariance(simulated_block()))
+    spectrum = mvdr.spectrum()
+    local_max = (spectrum >= np.roll(spectrum, 1)) & (spectrum > np.roll(spectrum, -1))
+    peaks = np.flatnonzero(local_max)
+    strongest = peaks[np.argsort(spectrum[peaks])[::-1][:2]]
+    np.testing.assert_allclose(calcTheta(mvdr.delay_phases[strongest], rx_lo, d), [-40, 20], atol=1.0)
+
+def test_inverse_is_only_recomputed_every_update_every_calls():
+    block = simulated_block()
+    mvdr = MVDR(np.arange(6), update_every=4)
+    for i in range(10):
+        mvdr.update(sample_covariance(block))
+    assert mvdr.updates == 10
+    assert mvdr.inversions == 3
@@ -0,0 +1,50 @@
+import numpy as np
+from beamforming import Calibration, DriftMonitor, SimulatedScene, calibration_key, generate_bpsk, simulated_array
+from beamforming.calibration import device_id
+
+''' Stand-in for a pylibiio Context: attrs maps names to plain strings '''
+class FakeContext(object):
+
+    def __init__(self, serial):
+        self.attrs = {'hw_serial': serial, 'fw_version': 'v0.38'}
+
+class FakePluto(object):
+
+    def __init__(self, uri, serial=None):
+        self.uri = uri
+        if serial is not None:
+            self.ctx = FakeContext(serial)
+
+def test_device_id_reads_the_serial_from_the_context():
+    assert device_id(FakePluto('ip:192.168.2.1', '104473b04a0600180b002a00a2bd4c8e')) == '104473b04a0600180b002a00a2bd4c8e'
+    assert device_id(FakePluto('ip:192.168.2.1')) == 'ip:192.168.2.1'
+
+''' Two Plutos swapped on the same URIs must not share a calibration entry '''
+def test_calibration_key_follows_the_devices_not_the_uris():
+    first = [FakePluto('ip:192.168.2.1', 'A'), FakePluto('ip:192.168.3.1', 'B')]
+    swapped = [FakePluto('ip:192.168.2.1', 'B'), FakePluto('ip:192.168.3.1', 'A')]
+    assert calibration_key(first, 915e6, 2e6) != calibration_key(swapped, 915e6, 2e6)
+
+''' Buffers of a BPSK scene where Pluto 2 slips its trigger in two of them '''
+def slipping_buffers():
+    rng = np.random.default_rng(0)
+    scene = SimulatedScene(emitter_angle=20, seed=0)
+    sdrs = simulated_array(3, scene, 4096, 2e6, trigger_delays=[[0, 0], [4, 4], [-3, -3]],
+                           phase_offsets=[[0, 30], [60, -40], [100, 170]])
+    sdrs[0].tx(generate_bpsk(rng.choice([-1, 1], 512), 2e6, 8e-6))
+    buffers = []
+    for i in range(10):
+        sdrs[1].trigger_delay = np.array([60, 60] if i in (3, 7) else [4, 4])
+        buffers.append(np.concatenate([np.asarray(sdr.rx()) for sdr in sdrs]))
+    return sdrs, buffers
+
+def test_measure_keeps_the_common_delay_when_buffers_jitter():
+    sdrs, buffers = slipping_buffers()
+    calibration = Calibration.measure(buffers, 256, "full")
+    single = Calibration.measure(buffers[0], 256, "full")
+    np.testing.assert_allclose(calibration.delay, [0, 0, -4, -4, 3, 3], atol=0.1)
+    assert np.max(np.abs((calibration.phase - single.phase + 180) % 360 - 180)) < 1.0
+    # the stored calibration fits the next regular buffer, so it doesn't trigger a recalibration
+    monitor = DriftMonitor(calibration, maxlag=256)
+    monitor.process(np.concatenate([np.asarray(sdr.rx()) for sdr in sdrs]))
+    assert monitor.recalibrations == 0
@@ -0,0 +1,43 @@
+import numpy as np
+from beamforming import SimulatedScene, correlate_channels, generate_bpsk, simulated_array
+
+''' (channels x samples) block of 3 simulated Plutos with trigger delays and phase offsets '''
+def simulated_block(seed, waveform=None):
+    rng = np.random.default_rng(seed)
+    scene = SimulatedScene(emitter_angle=20, seed=seed)
+    sdrs = simulated_array(3, scene, num_samples=4096, sample_rate=2e6,
+                           trigger_delays=np.repeat(rng.integers(-10, 10, (3, 1)), 2, axis=1),
+                           phase_offsets=rng.uniform(-180, 180, (3, 2)))
+    if waveform is not None:
+        sdrs[0].tx(waveform(rng))
+    return np.concatenate([np.asarray(sdr.rx()) for sdr in sdrs])
+
+def phase_error(a, b):
+    return np.abs((np.asarray(a) - np.asarray(b) + 180) % 360 - 180)
+
+''' A tone correlates equally at every lag: "window" mode has to settle on the same lag as "full" '''
+def test_window_mode_matches_full_mode_on_a_tone():
+    for seed in range(5):
+        block = simulated_block(seed)
+        full_phase, full_delay, full_mag = correlate_channels(block[0], block[1:], 256, "full")
+        phase, delay, mag = correlate_channels(block[0], block[1:], 256, "window")
+        np.testing.assert_array_equal(delay, full_delay)
+        assert np.max(phase_error(phase, full_phase)) < 1.0
+
+def test_window_mode_matches_full_mode_on_bpsk():
+    bpsk = lambda rng: generate_bpsk(rng.choice([-1, 1], 512), 2e6, 8e-6)
+    for seed in range(5):
+        block = simulated_block(seed, bpsk)
+        full_phase, full_delay, full_mag = correlate_channels(block[0], block[1:], 256, "full")
+        phase, delay, mag = correlate_channels(block[0], block[1:], 256, "window")
+        np.testing.assert_array_equal(delay, full_delay)
+        assert np.max(phase_error(phase, full_phase)) < 1.0
+
+''' A tone has no correlation peak to interpolate: "window" mode stays on the lag instead of +-0.5 samples '''
+def test_window_mode_subsample_on_a_tone():
+    for seed in range(5):
+        block = simulated_block(seed)
+        full_phase, full_delay, full_mag = correlate_channels(block[0], block[1:], 256, "full", subsample=True)
+        phase, delay, mag = correlate_channels(block[0], block[1:], 256, "window", subsample=True)
+        assert np.max(np.abs(delay - full_delay)) < 0.1
+        assert np.max(phase_error(phase, full_phase)) < 1.0
@@ -0,0 +1,40 @@
+import numpy as np
+from beamforming import MUSIC, SimulatedScene, StreamingCovariance, calcTheta, sample_covariance, simulated_array
+
+num_samples = 4096
+rx_lo = 915e6
+d = 0.5 * 3e8 / rx_lo
+band = (int(num_samples * 0.6), int(num_samples * 0.9))     # signal_start:signal_end around the 200 kHz tone at 1 MSPS
+
+''' Simulated 6 element array and a function that receives one (6 x samples) buffer '''
+def simulated_receiver(emitter_angle, seed=0):
+    scene = SimulatedScene(emitter_angle=emitter_angle, d=d, seed=seed)
+    sdrs = simulated_array(3, scene, num_samples=num_samples, rx_lo=rx_lo)
+    return scene, lambda: np.concatenate([np.asarray(sdr.rx()) for sdr in sdrs])
+
+def test_updates_blend_with_the_forgetting_factor():
+    scene, rx = simulated_receiver(10)
+    buffers = [rx() for i in range(3)]
+    latest = StreamingCovariance(6, forgetting=0)
+    blended = StreamingCovariance(6, forgetting=0.75)
+    for buffer in buffers:
+        latest.update(buffer)
+        blended.update(buffer)
+    np.testing.assert_allclose(latest.R, sample_covariance(buffers[-1]))
+    R0, R1, R2 = [sample_covariance(buffer) for buffer in buffers]
+    np.testing.assert_allclose(blended.R, 0.75 * (0.75 * R0 + 0.25 * R1) + 0.25 * R2)
+
+''' In band snapshots: MUSIC on the streamed R finds the emitter, and follows it after it moves '''
+def test_band_covariance_tracks_a_moving_emitter():
+    scene, rx = simulated_receiver(-20)
+    covariance = StreamingCovariance(6, forgetting=0.5, band=band)
+    music = MUSIC(np.arange(6))
+    for i in range(5):
+        covariance.update(rx())
+    phases, spectrum = music.estimate(covariance.R, 1)
+    assert abs(calcTheta(phases[0], rx_lo, d) + 20) < 0.5
+    scene.emitter_angle = 30
+    for i in range(10):
+        covariance.update(rx())
+    phases, spectrum = music.estimate(covariance.R, 1)
+    assert abs(calcTheta(phases[0], rx_lo, d) - 30) < 0.5
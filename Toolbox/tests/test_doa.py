@@ -0,0 +1,40 @@
+import numpy as np
+from beamforming import BeamScanner, SimulatedScene, doa_candidates, interferometric_doa, simulated_array
+
+num_samples = 4096
+samp_rate = 1e6
+rx_lo = 915e6
+wavelength = 3e8 / rx_lo
+signal_start = int(num_samples * (samp_rate / 2 + 200e3 / 2) / samp_rate)     # around the 200 kHz scene tone
+signal_end = int(num_samples * (samp_rate / 2 + 200e3 * 2) / samp_rate)
+
+''' Channel spectra of 3 simulated Plutos (6 elements) with the emitter at a given angle '''
+def simulated_spectra(emitter_angle, d, seed=0):
+    scene = SimulatedScene(emitter_angle=emitter_angle, d=d, seed=seed)
+    sdrs = simulated_array(3, scene, num_samples=num_samples, sample_rate=samp_rate, rx_lo=rx_lo)
+    block = np.concatenate([np.asarray(sdr.rx()) for sdr in sdrs])
+    scanner = BeamScanner([0], np.arange(6), num_samples, signal_start, signal_end)
+    return scanner.spectra(block).copy()
+
+def test_half_wavelength_spacing_recovers_the_angle():
+    d = wavelength / 2
+    for emitter_angle in (-60, -20, 0, 15, 45):
+        steer_angle, phase, coherence = interferometric_doa(simulated_spectra(emitter_angle, d), np.arange(6), rx_lo, d)
+        assert abs(steer_angle - emitter_angle) < 0.5
+        assert coherence > 0.99
+
+''' With d = one wavelength every phase step has two angles, the prior picks the tracked one '''
+def test_wide_spacing_lists_every_candidate_and_uses_the_prior():
+    d = wavelength
+    for emitter_angle in (-35, 20, 50):
+        spectra = simulated_spectra(emitter_angle, d)
+        steer_angle, phase, coherence = interferometric_doa(spectra, np.arange(6), rx_lo, d, prior=emitter_angle + 5)
+        assert abs(steer_angle - emitter_angle) < 0.5
+        candidates = doa_candidates(phase, rx_lo, d)
+        assert len(candidates) == 2
+        # the other candidate is an exact alias: same phase step, different angle
+        alias = candidates[np.argmax(np.abs(candidates - emitter_angle))]
+        alias_phase = 360 * d / wavelength * np.sin(np.deg2rad(alias))
+        assert abs((alias_phase - phase + 180) % 360 - 180) < 0.5
+        aliased_angle = interferometric_doa(spectra, np.arange(6), rx_lo, d, prior=alias)[0]
+        np.testing.assert_allclose(aliased_angle, alias)
@@ -0,0 +1,70 @@
+import time
+from beamforming import Pipeline
+
+''' After pause_acquire() no frame of the old device reaches process() '''
+def test_pause_acquire_drops_frames_of_the_old_device():
+    device = {'id': 0}
+    seen = []
+    def acquire():
+        time.sleep(0.005)
+        return device['id']
+    def process(frame):
+        seen.append(frame)
+        return frame
+    pipeline = Pipeline(acquire, process, period=0.002, reuse_frames=False).start()
+    try:
+        time.sleep(0.1)
+        pipeline.pause()
+        pipeline.pause_acquire()
+        acquired = pipeline.acquired
+        time.sleep(0.05)
+        assert pipeline.acquired == acquired
+        device['id'] = 1
+        swapped = len(seen)
+        pipeline.resume_acquire()
+        pipeline.resume()
+        time.sleep(0.1)
+    finally:
+        pipeline.close()
+    assert seen[:swapped] and set(seen[swapped:]) == {1}
+
+''' A job submitted while paused reads fresh frames on the DSP thread, done() runs in poll_jobs() '''
+def test_submit_runs_while_paused_and_reports_through_poll_jobs():
+    counter = {'frames': 0}
+    def acquire():
+        time.sleep(0.002)
+        counter['frames'] += 1
+        return counter['frames']
+    finished = []
+    pipeline = Pipeline(acquire, lambda frame: frame, period=0.01).start()
+    try:
+        pipeline.pause()
+        pipeline.submit(lambda next_frame: [next_frame() for i in range(3)], lambda result, error: finished.append(result))
+        pipeline.submit(lambda next_frame: 1 / 0, lambda result, error: finished.append(error))
+        deadline = time.perf_counter() + 2
+        while len(finished) < 2 and time.perf_counter() < deadline:
+            pipeline.poll_jobs()
+            time.sleep(0.01)
+    finally:
+        pipeline.close()
+    frames, error = finished
+    assert len(frames) == 3 and frames == sorted(set(frames))
+    assert isinstance(error, ZeroDivisionError) and pipeline.error_count == 1
+
+''' errors keeps only the latest exceptions, error_count counts all of them '''
+def test_errors_are_bounded():
+    calls = {'rx': 0}
+    def acquire():
+        calls['rx'] += 1
+        raise IOError(f'rx timeout {calls["rx"]}')
+    # the acquisition thread waits 0.1 s after every failed acquire()
+    pipeline = Pipeline(acquire, lambda frame: frame, max_errors=3).start()
+    try:
+        deadline = time.perf_counter() + 2
+        while pipeline.error_count < 5 and time.perf_counter() < deadline:
+            time.sleep(0.02)
+    finally:
+        pipeline.close()
+    count = pipeline.error_count
+    assert count >= 5 and len(pipeline.errors) == 3
+    assert str(pipeline.errors[-1]) == f'rx timeout {count}'
@@ -0,0 +1,52 @@
+import numpy as np
+from beamforming import BeamScanner
+
+num_samples = 4096
+signal_start, signal_end = 2457, 3686       # the PlotPeaks signal bins, fc0/2 to 2*fc0 for fc0 = 200 kHz at 1 MSPS
+delay_phases = np.arange(-180, 180, 2)
+element_index = np.arange(6)
+
+''' 6 channels of a 200 kHz tone arriving with a 40 deg phase step, phase offsets and noise '''
+def tone_block(seed):
+    rng = np.random.default_rng(seed)
+    n = np.arange(num_samples)
+    phases = -40 * element_index + rng.uniform(-180, 180, len(element_index))
+    block = 1000 * np.exp(2j * np.pi * (0.2 * n + phases[:, np.newaxis] / 360))
+    return block + rng.normal(0, 20, block.shape) + 1j * rng.normal(0, 20, block.shape), phases
+
+''' The original rotate() loop: phase shift each channel, sum, dbfs() and take the peak, one phase at a time '''
+def loop_scan(channels, phase_cal):
+    win = np.hamming(num_samples)
+    peak_sum = []
+    for phase_delay in delay_phases:
+        delayed_sum = sum(Rx * np.exp(1j * np.deg2rad(k * phase_delay + cal))
+                          for k, Rx, cal in zip(element_index, channels, phase_cal))
+        s_fft = np.fft.fft(delayed_sum * win) / np.sum(win)
+        s_dbfs = 20 * np.log10(np.abs(np.fft.fftshift(s_fft)) / (2**11))
+        peak_sum.append(np.max(s_dbfs[signal_start:signal_end]))
+    return np.array(peak_sum)
+
+''' Both the sum-then-FFT ("time") and the steered spectra ("freq") scan give the loop's peak_sum '''
+def test_scan_matches_the_per_phase_loop():
+    for mode in ("time", "freq"):
+        scanner = BeamScanner(delay_phases, element_index, num_samples, signal_start, signal_end, mode=mode)
+        for seed in range(3):
+            channels, phases = tone_block(seed)
+            phase_cal = -(phases - phases[0] + 40 * element_index)     # leaves only the 40 deg steps
+            peak_sum = scanner.scan(channels, phase_cal)
+            expected = loop_scan(channels, phase_cal)
+            np.testing.assert_allclose(peak_sum, expected, atol=1e-9)
+            assert scanner.peak(peak_sum)[0] == 40
+
+''' fine_peak() narrows the coarse 2 deg peak down to the true phase step, and its level is the level at that step '''
+def test_fine_peak_finds_the_phase_step_between_grid_points():
+    scanner = BeamScanner(delay_phases, element_index, num_samples, signal_start, signal_end)
+    n = np.arange(num_samples)
+    for step in (40.0, 41.3, -97.7):
+        channels = 1000 * np.exp(2j * np.pi * (0.2 * n - step * element_index[:, np.newaxis] / 360))
+        peak_delay, peak_dbfs, peak_sum = scanner.fine_peak(channels, tolerance=0.1)
+        assert abs(peak_delay - step) < 0.1
+        np.testing.assert_allclose(peak_sum, scanner.scan(channels))
+        assert peak_dbfs > np.max(peak_sum) - 0.01     # within the tolerance of the true peak
+        exact = BeamScanner([peak_delay], element_index, num_samples, signal_start, signal_end).scan(channels)[0]
+        np.testing.assert_allclose(peak_dbfs, exact, atol=1e-9)
@@ -0,0 +1,28 @@
+import numpy as np
+from beamforming import MUSIC, SimulatedScene, calcTheta, root_music, sample_covariance, simulated_array
+
+num_samples = 4096
+rx_lo = 915e6
+d = 0.5 * 3e8 / rx_lo
+
+''' (6 x samples) block of 3 simulated Plutos hearing one tone per (angle, tone_freq) emitter '''
+def simulated_block(emitters, seed=0):
+    block = 0
+    for k, (emitter_angle, tone_freq) in enumerate(emitters):
+        scene = SimulatedScene(emitter_angle=emitter_angle, d=d, tone_freq=tone_freq, seed=seed + k)
+        sdrs = simulated_array(3, scene, num_samples=num_samples, rx_lo=rx_lo)
+        block = block + np.concatenate([np.asarray(sdr.rx()) for sdr in sdrs])
+    return block
+
+def test_music_recovers_one_emitter():
+    R = sample_covariance(simulated_block([(25, 200e3)]))
+    phases, spectrum = MUSIC(np.arange(6)).estimate(R, 1)
+    assert abs(calcTheta(phases[0], rx_lo, d) - 25) < 0.5
+    assert abs(calcTheta(root_music(R, 1)[0], rx_lo, d) - 25) < 0.5
+
+''' Two emitters 12 deg apart are inside the 6 element beamwidth (~17 deg), MUSIC still separates them '''
+def test_music_and_root_music_separate_two_close_emitters():
+    R = sample_covariance(simulated_block([(-10, 200e3), (2, 230e3)]))
+    phases, spectrum = MUSIC(np.arange(6)).estimate(R, 2)
+    np.testing.assert_allclose(np.sort(calcTheta(phases, rx_lo, d)), [-10, 2], atol=1.0)
+    np.testing.assert_allclose(np.sort(calcTheta(root_music(R, 2), rx_lo, d)), [-10, 2], atol=1.0)
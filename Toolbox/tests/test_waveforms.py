@@ -0,0 +1,108 @@
+import importlib
+import sys
+import numpy as np
+import pytest
+from beamforming import WaveformCache, barker, bpsk_buffer, pn_sequence, tone
+from beamforming.waveforms import _source_hash, shape
+
+''' An m-sequence has a periodic autocorrelation of 2^order - 1 at lag 0 and -1 at every other lag '''
+@pytest.mark.parametrize('order', [3, 5, 7, 10])
+def test_pn_sequence_periodic_autocorrelation(order):
+    chips = pn_sequence(order)
+    length = 2**order - 1
+    assert len(chips) == length and set(np.unique(chips)) == {-1.0, 1.0}
+    # circular autocorrelation of every lag at once
+    autocorrelation = np.round(np.fft.ifft(np.abs(np.fft.fft(chips))**2).real)
+    assert autocorrelation[0] == length
+    assert np.all(autocorrelation[1:] == -1)
+    # another seed is the same sequence started further along
+    shifted = pn_sequence(order, seed=3)
+    assert any(np.array_equal(np.roll(chips, -k), shifted) for k in range(length))
+
+def test_pn_sequence_rejects_bad_arguments():
+    with pytest.raises(ValueError):
+        pn_sequence(1)
+    with pytest.raises(ValueError):
+        pn_sequence(5, seed=0)
+
+def test_rect_shape_repeats_every_symbol():
+    np.testing.assert_array_equal(shape(barker(5), 4), np.repeat(barker(5), 4))
+
+''' Every pulse peaks at 1 on its own symbol, "rrc" centered on it and the others starting there '''
+@pytest.mark.parametrize('pulse', ['half_sine', 'rrc'])
+def test_shaped_pulse_peaks_on_its_symbol(pulse):
+    symbols = np.zeros(32)
+    symbols[10] = 1
+    shaped = shape(symbols, 8, pulse)
+    peak = int(np.argmax(shaped))
+    assert abs(shaped[peak] - 1) < 1e-12
+    assert peak == 10 * 8 if pulse == 'rrc' else 10 * 8 <= peak < 11 * 8
+
+''' A cyclic buffer wraps the pulse tails around, so rolling the symbols rolls the samples '''
+@pytest.mark.parametrize('pulse', ['half_sine', 'rrc'])
+def test_cyclic_shape_is_circular(pulse):
+    code = pn_sequence(5)
+    cyclic = shape(code, 4, pulse, cyclic=True)
+    np.testing.assert_allclose(shape(np.roll(code, 3), 4, pulse, cyclic=True), np.roll(cyclic, 3 * 4), atol=1e-9)
+    # away from the ends, where nothing wraps, it matches the linear convolution
+    linear = shape(code, 4, pulse)
+    np.testing.assert_allclose(cyclic[40:-40], linear[40:-40], atol=1e-9)
+    if pulse == 'rrc':
+        # the tail of the last symbols wraps onto the first samples
+        assert not np.allclose(cyclic[:8], linear[:8])
+
+''' A cyclic tone and a BPSK buffer on it repeat without a phase jump '''
+def test_cyclic_tone_wraps_without_a_phase_jump():
+    iq = tone(1000, 123e3, 1e6, cyclic=True)
+    step = iq[1] / iq[0]
+    np.testing.assert_allclose(iq[0] / iq[-1], step)
+    buffer = bpsk_buffer(barker(13), 10, 1300, 123e3, 1e6)
+    np.testing.assert_allclose(np.abs(buffer), 2**14)
+    assert not iq.flags.writeable
+
+def test_cache_key_follows_the_arguments():
+    cache = WaveformCache()
+    assert cache.key(tone, 4096, 200e3, 2e6) == cache.key(tone, 4096, 200e3, 2e6)
+    assert cache.key(tone, 4096, 200e3, 2e6) != cache.key(tone, 4096, 210e3, 2e6)
+    assert cache.key(tone, 4096, 200e3, 2e6) != cache.key(tone, 4096, 200e3, 2e6, cyclic=True)
+    # arrays by content, not by identity
+    code = np.array(barker(13))
+    assert cache.key(bpsk_buffer, code, 50, 2**16) == cache.key(bpsk_buffer, code.copy(), 50, 2**16)
+    assert cache.key(bpsk_buffer, code, 50, 2**16) != cache.key(bpsk_buffer, -code, 50, 2**16)
+
+def test_cache_builds_once_then_loads_from_disk(tmp_path):
+    cache = WaveformCache(tmp_path)
+    built = cache.get(bpsk_buffer, barker(13), 50, 2**12, 200e3, 2e6)
+    assert (cache.hits, cache.misses) == (0, 1)
+    # a new process (a new cache on the same folder) loads the file
+    restarted = WaveformCache(tmp_path)
+    loaded = restarted.get(bpsk_buffer, barker(13), 50, 2**12, 200e3, 2e6)
+    assert (restarted.hits, restarted.misses) == (1, 0)
+    np.testing.assert_array_equal(loaded, built)
+    assert not loaded.flags.writeable
+    # a half written file is built again
+    file = tmp_path / restarted.key(bpsk_buffer, barker(13), 50, 2**12, 200e3, 2e6)
+    file.write_bytes(file.read_bytes()[:100])
+    np.testing.assert_array_equal(restarted.get(bpsk_buffer, barker(13), 50, 2**12, 200e3, 2e6), built)
+    assert restarted.misses == 1
+    assert restarted.clear() == 1 and not list(tmp_path.glob('*.npy'))
+
+''' Editing the generator's module changes the key, so the old file is never served '''
+def test_cache_key_changes_with_the_generator_source(tmp_path, monkeypatch):
+    module = tmp_path / 'sweep_waveform.py'
+    module.write_text('import numpy as np\ndef chirp(n):\n    return np.linspace(0, 1, n)\n')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    cache = WaveformCache(tmp_path / 'cache')
+    try:
+        generator = importlib.import_module('sweep_waveform')
+        before = cache.key(generator.chirp, 16)
+        cache.get(generator.chirp, 16)
+        module.write_text('import numpy as np\ndef chirp(n):\n    return np.linspace(0, 2.5, n)\n')
+        generator = importlib.reload(generator)
+        _source_hash.cache_clear()
+        assert cache.key(generator.chirp, 16) != before
+        np.testing.assert_array_equal(cache.get(generator.chirp, 16), np.linspace(0, 2.5, 16))
+        assert cache.misses == 2
+    finally:
+        sys.modules.pop('sweep_waveform', None)
+        _source_hash.cache_clear()